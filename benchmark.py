@@ -0,0 +1,322 @@
+# Benchmarks de los caminos críticos de las dos aplicaciones, sin Streamlit ni datos reales.
+#
+# Genera entradas sintéticas (DICOM, JPG y un video) con una semilla fija y mide:
+#   - imagen: carga del encabezado y decodificación con DicomProcessor, y preprocesamiento
+#   - modelo: latencia de IA_Modelo.predecir y rendimiento de una pasada por tamaño de lote
+#   - backends: PSNR, SSIM y latencia de ONNX y ONNX INT8 frente a PyTorch, y el backend
+#             recomendado (el más rápido que cumple el umbral de precisión de IA_Modelo)
+#   - video:  FPS de CenterOfMassDetector.process_video y el tiempo de cada etapa según
+#             PipelineMetrics (decode, convert, pose, cm, draw_landmarks, annotate, encode, ui)
+# Los resultados se guardan en JSON para comparar entre commits.
+#
+# Uso:
+#   python benchmark.py resultados.json --solo imagen,video --repeticiones 20
+#   python benchmark.py resultados.json --modelo modelo_entrenado.safetensors --lotes 1,4,16
+#   python benchmark.py resultados.json --video caminata.mp4
+#   python benchmark.py resultados.json --solo backends --modelo modelo_entrenado.safetensors
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from fractions import Fraction
+
+import numpy as np
+
+SECCIONES = ('imagen', 'modelo', 'backends', 'video')
+
+
+# Estadísticas (en milisegundos) de una lista de tiempos en segundos
+def estadisticas(tiempos):
+    ms = np.array(tiempos, dtype=np.float64) * 1000.0
+    return {
+        'repeticiones': len(ms),
+        'media_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'min_ms': float(ms.min()),
+    }
+
+
+# Ejecuta la función varias veces (después de unas ejecuciones de calentamiento) y mide cada una
+def medir(funcion, repeticiones, calentamiento=1):
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return estadisticas(tiempos)
+
+
+# Archivo en memoria con la interfaz que usa la aplicación del UploadedFile de Streamlit
+class ArchivoSubido(io.BytesIO):
+    def __init__(self, datos, name):
+        super().__init__(datos)
+        self.name = name
+        self.size = len(datos)
+
+
+# DICOM de CT sintético (int16 con pendiente e intercepto, como los de un tomógrafo)
+def dicom_sintetico(rng, lado=512, numero=1):
+    from pydicom.dataset import FileDataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    dataset = FileDataset(None, {}, file_meta=meta, preamble=b'\0' * 128)
+    dataset.SOPClassUID = meta.MediaStorageSOPClassUID
+    dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dataset.Modality = 'CT'
+    dataset.InstanceNumber = numero
+    dataset.Rows = dataset.Columns = lado
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated = dataset.BitsStored = 16
+    dataset.HighBit = 15
+    dataset.PixelRepresentation = 1
+    dataset.RescaleSlope = 1
+    dataset.RescaleIntercept = -1024
+    dataset.WindowCenter = 40
+    dataset.WindowWidth = 400
+    dataset.PixelData = rng.integers(0, 2500, (lado, lado), dtype=np.int16).tobytes()
+
+    buffer = io.BytesIO()
+    dataset.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+# JPG RGB sintético
+def jpg_sintetico(rng, ancho=1024, alto=768):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (alto, ancho, 3), dtype=np.uint8)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+# Video H.264 sintético: una figura que se desplaza sobre un fondo con textura
+def video_sintetico(ruta, rng, segundos=5, fps=30, ancho=640, alto=480):
+    import av
+    import cv2
+
+    fondo = rng.integers(0, 80, (alto, ancho, 3), dtype=np.uint8)
+    with av.open(ruta, 'w') as contenedor:
+        stream = contenedor.add_stream('libx264', rate=Fraction(fps))
+        stream.width, stream.height, stream.pix_fmt = ancho, alto, 'yuv420p'
+        for indice in range(segundos * fps):
+            imagen = fondo.copy()
+            x = int(ancho * (0.2 + 0.6 * indice / (segundos * fps)))
+            cv2.circle(imagen, (x, alto // 4), alto // 12, (220, 180, 150), -1)
+            cv2.line(imagen, (x, alto // 3), (x, 2 * alto // 3), (220, 180, 150), alto // 15)
+            cv2.line(imagen, (x, 2 * alto // 3), (x - alto // 8, 9 * alto // 10), (220, 180, 150), alto // 20)
+            cv2.line(imagen, (x, 2 * alto // 3), (x + alto // 8, 9 * alto // 10), (220, 180, 150), alto // 20)
+            for paquete in stream.encode(av.VideoFrame.from_ndarray(imagen, format='rgb24')):
+                contenedor.mux(paquete)
+        for paquete in stream.encode():
+            contenedor.mux(paquete)
+
+
+# Carga del encabezado, decodificación y preprocesamiento de DICOM y JPG
+def benchmark_imagen(rng, repeticiones):
+    from main import DicomProcessor, Preprocesador, IA_Modelo
+
+    archivos = {
+        'dicom': (dicom_sintetico(rng), 'sintetico.dcm'),
+        'jpg': (jpg_sintetico(rng), 'sintetico.jpg'),
+    }
+    preprocesador = Preprocesador(IA_Modelo.tamano_entrada, IA_Modelo.canales_entrada, 'Abdomen')
+    resultados = {}
+    for tipo, (datos, nombre) in archivos.items():
+        # Cada repetición usa un procesador nuevo: no se reutiliza lo ya leído
+        def cargar_y_decodificar():
+            procesador = DicomProcessor()
+            procesador.cargar_archivo(ArchivoSubido(datos, nombre))
+            return procesador.obtener_imagen()
+
+        procesador = DicomProcessor()
+        procesador.cargar_archivo(ArchivoSubido(datos, nombre))
+        imagen = procesador.obtener_imagen()
+        lote = np.stack([imagen] * 16)
+        resultados[tipo] = {
+            'bytes': len(datos),
+            'forma': list(imagen.shape),
+            'carga_y_decodificacion': medir(cargar_y_decodificar, repeticiones),
+            'preprocesamiento': medir(lambda: preprocesador.procesar(imagen, procesador.dicom_data), repeticiones),
+            'preprocesamiento_lote_16': medir(
+                lambda: preprocesador.procesar_lote(lote, procesador.dicom_data), max(1, repeticiones // 4)),
+        }
+    return resultados
+
+
+# Latencia de predecir() y rendimiento de una pasada del generador por tamaño de lote.
+# Sin --modelo se usan generadores con pesos aleatorios y la arquitectura por defecto.
+def benchmark_modelo(rng, repeticiones, lotes, ruta_modelo, backend, directorio):
+    from main import IA_Modelo
+
+    ruta_modelo = ruta_modelo or pesos_aleatorios(directorio)
+    inicio = time.perf_counter()
+    modelo = IA_Modelo(ruta_modelo, backend=backend)
+    carga = time.perf_counter() - inicio
+
+    lado, canales = IA_Modelo.tamano_entrada, IA_Modelo.canales_entrada
+    imagen = rng.uniform(-1.0, 1.0, (lado, lado, canales)).astype(np.float32)
+    resultados = {
+        'backend': backend,
+        'carga_s': carga,
+        'predecir': medir(lambda: modelo.predecir(imagen, 'ct2us'), repeticiones),
+        'lotes': {},
+    }
+    for tam_lote in lotes:
+        lote = rng.uniform(-1.0, 1.0, (tam_lote, lado, lado, canales)).astype(np.float32)
+        tiempos = medir(lambda: modelo.predecir_lote(lote, 'ct2us'), max(1, repeticiones // tam_lote))
+        tiempos['imagenes_por_s'] = tam_lote * 1000.0 / tiempos['media_ms']
+        resultados['lotes'][str(tam_lote)] = tiempos
+    return resultados
+
+
+# Generadores con pesos aleatorios y la arquitectura por defecto, guardados en safetensors
+def pesos_aleatorios(directorio):
+    import torch
+    from main import IA_Modelo, construir_generador_resnet, guardar_generadores_safetensors
+
+    ruta = os.path.join(directorio, 'generadores.safetensors')
+    if not os.path.exists(ruta):
+        torch.manual_seed(0)
+        redes = {direccion: construir_generador_resnet(IA_Modelo.canales_entrada) for direccion in ('ct2us', 'us2ct')}
+        guardar_generadores_safetensors(redes, ruta, IA_Modelo.canales_entrada)
+    return ruta
+
+
+# Precisión (PSNR y SSIM frente a PyTorch) y latencia de cada backend sobre las imágenes de
+# control, con el mismo umbral que aplica IA_Modelo al cargar un backend ONNX, y el backend
+# que conviene usar: el más rápido de los que lo cumplen.
+def benchmark_backends(repeticiones, ruta_modelo, directorio):
+    from main import (IA_Modelo, GeneradorONNX, comparar_backends, cuantizar_int8, elegir_backend,
+                      exportar_onnx, imagenes_control)
+
+    ruta_modelo = ruta_modelo or pesos_aleatorios(directorio)
+    referencia = IA_Modelo(ruta_modelo).modelo['ct2us']
+    ruta_onnx = os.path.join(directorio, 'ct2us.onnx')
+    ruta_int8 = os.path.join(directorio, 'ct2us.int8.onnx')
+    exportar_onnx(referencia, ruta_onnx, IA_Modelo.canales_entrada, IA_Modelo.tamano_entrada)
+    cuantizar_int8(ruta_onnx, ruta_int8)
+    candidatos = {'onnx': GeneradorONNX(ruta_onnx), 'onnx-int8': GeneradorONNX(ruta_int8)}
+    imagenes = imagenes_control(canales=IA_Modelo.canales_entrada, tamano=IA_Modelo.tamano_entrada)
+    resultados = comparar_backends(referencia, candidatos, imagenes, IA_Modelo.psnr_min, IA_Modelo.ssim_min,
+                                   max(1, repeticiones // 4))
+    return {
+        'psnr_min': IA_Modelo.psnr_min,
+        'ssim_min': IA_Modelo.ssim_min,
+        'comparacion': resultados,
+        'recomendado': elegir_backend(resultados),
+    }
+
+
+# FPS de process_video y tiempo por etapa, con las métricas del propio pipeline
+# (PipelineMetrics). Las etapas corren en paralelo (una por hilo), por lo que la suma de los
+# tiempos puede superar el tiempo total.
+def benchmark_video(rng, repeticiones, ruta_video, directorio):
+    from master import CenterOfMassDetector, PipelineMetrics, ProcessingMode
+
+    if ruta_video is None:
+        ruta_video = os.path.join(directorio, 'sintetico.mp4')
+        video_sintetico(ruta_video, rng)
+
+    ejecuciones = []
+    for _ in range(max(1, repeticiones // 10)):
+        metricas = PipelineMetrics(enabled=True)
+        detector = CenterOfMassDetector(cache=None, metrics=metricas)
+
+        inicio = time.perf_counter()
+        resultado = detector.process_video(ruta_video, 70.0, ProcessingMode())
+        total = time.perf_counter() - inicio
+
+        resumen = metricas.snapshot()
+        frames = len(resultado['timestamps'])
+        ejecuciones.append({
+            'total_s': total,
+            'frames': frames,
+            'frames_con_pose': int(np.count_nonzero(~np.isnan(resultado['landmarks'][:, 0, 0]))),
+            'fps': frames / total,
+            'etapas': resumen['stages'],
+            'contadores': resumen['counters'],
+        })
+
+    # Se informa la ejecución más rápida (la menos afectada por otras cargas del equipo)
+    mejor = max(ejecuciones, key=lambda ejecucion: ejecucion['fps'])
+    return dict(mejor, video=os.path.basename(ruta_video), fps_ejecuciones=[e['fps'] for e in ejecuciones])
+
+
+# Versión de Python, bibliotecas y commit, para saber qué se está comparando
+def entorno():
+    versiones = {}
+    for modulo in ('numpy', 'pydicom', 'PIL', 'av', 'cv2', 'mediapipe', 'torch', 'onnxruntime'):
+        try:
+            versiones[modulo] = getattr(__import__(modulo), '__version__', '?')
+        except ImportError:
+            pass
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'versiones': versiones,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de imagen, modelo y video con datos sintéticos")
+    parser.add_argument('salida', help="Archivo JSON de resultados")
+    parser.add_argument('--solo', default=','.join(SECCIONES),
+                        help="Secciones a ejecutar, separadas por comas: " + ", ".join(SECCIONES))
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--lotes', default='1,2,4,8', help="Tamaños de lote del modelo, separados por comas")
+    parser.add_argument('--modelo', help="Pesos en safetensors (por defecto, pesos aleatorios)")
+    parser.add_argument('--backend', default='pytorch', choices=('pytorch', 'onnx', 'onnx-int8'))
+    parser.add_argument('--video', help="Video a analizar (por defecto, uno sintético de 5 s)")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    secciones = [seccion.strip() for seccion in args.solo.split(',') if seccion.strip()]
+    desconocidas = set(secciones) - set(SECCIONES)
+    if desconocidas:
+        parser.error(f"Secciones desconocidas: {', '.join(sorted(desconocidas))}")
+
+    rng = np.random.default_rng(args.semilla)
+    resultados = {'entorno': entorno(), 'parametros': vars(args)}
+    with tempfile.TemporaryDirectory() as directorio:
+        for seccion in secciones:
+            print(f"Ejecutando {seccion}...", file=sys.stderr)
+            if seccion == 'imagen':
+                resultados[seccion] = benchmark_imagen(rng, args.repeticiones)
+            elif seccion == 'modelo':
+                lotes = [int(lote) for lote in args.lotes.split(',')]
+                resultados[seccion] = benchmark_modelo(rng, args.repeticiones, lotes, args.modelo,
+                                                       args.backend, directorio)
+            elif seccion == 'backends':
+                resultados[seccion] = benchmark_backends(args.repeticiones, args.modelo, directorio)
+            else:
+                resultados[seccion] = benchmark_video(rng, args.repeticiones, args.video, directorio)
+
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultados, archivo, indent=2)
+    print(f"Resultados guardados en {args.salida}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# Extracción del centro de masa por lotes, sin Streamlit.
+#
+# Procesa todos los videos de un directorio con CenterOfMassDetector y guarda, por video,
+# los timestamps, los 33 landmarks y el CM (x, y, z) de cada frame en formato NPZ o Parquet.
+# Los videos cuya salida ya existe y es más reciente que el video se omiten.
+#
+# Uso:
+#   python cm_batch.py videos/ resultados/ --formato parquet --procesos 8
+import argparse
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from master import CenterOfMassDetector
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi')
+
+
+# Busca los videos del directorio (recursivamente) y calcula la ruta de salida de cada uno
+def find_videos(input_dir, output_dir, output_format):
+    jobs = []
+    for root, _, files in os.walk(input_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            video = os.path.join(root, name)
+            relative = os.path.relpath(video, input_dir)
+            output = os.path.join(output_dir, os.path.splitext(relative)[0] + '.' + output_format)
+            jobs.append((video, output))
+    return jobs
+
+
+# La salida está al día si existe y es posterior a la última modificación del video
+def is_up_to_date(video, output):
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(video)
+
+
+# Guarda el resultado como NPZ (arrays tal cual) o Parquet (una columna por coordenada)
+def save_result(result, output, output_format):
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    # Se escribe en un archivo temporal y se renombra, para no dejar salidas incompletas
+    partial = output + '.partial'
+
+    if output_format == 'npz':
+        with open(partial, 'wb') as file:
+            np.savez_compressed(file, **result)
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("El formato Parquet requiere pyarrow (pip install pyarrow)")
+
+        columns = {'timestamp': result['timestamps']}
+        landmarks = result['landmarks']
+        for index in range(landmarks.shape[1]):
+            for axis, name in enumerate('xyz'):
+                columns[f'lm{index}_{name}'] = landmarks[:, index, axis]
+        for axis, name in enumerate('xyz'):
+            columns[f'cm_{name}'] = result['cm'][:, axis]
+        pq.write_table(pa.table(columns), partial)
+
+    os.replace(partial, output)
+
+
+# Trabajo de un proceso: analiza un video completo y guarda su resultado
+def process_one(video, output, output_format):
+    result = CenterOfMassDetector().analyze_video(video)
+    save_result(result, output, output_format)
+    return len(result['timestamps'])
+
+
+# Tipo de argparse para --procesos: un entero mayor o igual a 1
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' no es un número entero")
+    if number < 1:
+        raise argparse.ArgumentTypeError("debe ser al menos 1")
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extrae el centro de masa de un directorio de videos.")
+    parser.add_argument('entrada', help="Directorio con los videos (.mp4, .mov, .avi)")
+    parser.add_argument('salida', help="Directorio donde se guardan los resultados")
+    parser.add_argument('--formato', choices=('npz', 'parquet'), default='npz')
+    parser.add_argument('--procesos', type=positive_int, default=os.cpu_count() or 1,
+                        help="Videos procesados en paralelo")
+    parser.add_argument('--forzar', action='store_true', help="Reprocesa aunque la salida esté al día")
+    args = parser.parse_args(argv)
+
+    jobs = find_videos(args.entrada, args.salida, args.formato)
+    pending = [job for job in jobs if args.forzar or not is_up_to_date(*job)]
+    print(f"{len(jobs)} videos encontrados, {len(jobs) - len(pending)} al día, {len(pending)} por procesar")
+
+    # Un solo video largo: se reparte por fragmentos entre todos los procesos. Un error se
+    # informa igual que en el caso de varios videos.
+    if len(pending) == 1:
+        video, output = pending[0]
+        try:
+            result = CenterOfMassDetector().analyze_video_sharded(video, workers=args.procesos)
+            save_result(result, output, args.formato)
+        except Exception as error:
+            print(f"{video}: error - {error}", file=sys.stderr)
+            return 1
+        print(f"{video}: {len(result['timestamps'])} frames")
+        return 0
+
+    failures = 0
+    # "spawn": con fork los procesos heredarían los hilos ya iniciados de MediaPipe y podrían bloquearse
+    with ProcessPoolExecutor(max_workers=args.procesos, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {executor.submit(process_one, video, output, args.formato): video
+                   for video, output in pending}
+        for future in as_completed(futures):
+            video = futures[future]
+            try:
+                print(f"{video}: {future.result()} frames")
+            except Exception as error:
+                failures += 1
+                print(f"{video}: error - {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
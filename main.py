@@ -1,70 +1,917 @@
 import streamlit as st
 import numpy as np
 import pydicom
+from pydicom.errors import InvalidDicomError
 from PIL import Image
 import matplotlib.pyplot as plt
 from streamlit_option_menu import option_menu
 import requests
 from datetime import datetime
 import io
+import logging
+import os
+import tempfile
+import zipfile
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+from model_registry import registry
+from trabajos import GestorTrabajos
+
+log = logging.getLogger(__name__)
 
 # Clase para cargar y procesar imágenes DICOM o JPG
 class DicomProcessor:
+    # Elementos que se muestran en el resumen del archivo DICOM
+    tags_resumen = [
+        "Modality", "StudyDescription", "SeriesDescription", "Manufacturer",
+        "Rows", "Columns", "NumberOfFrames", "BitsAllocated", "PhotometricInterpretation",
+        "PixelSpacing", "SliceThickness", "RescaleSlope", "RescaleIntercept",
+        "WindowCenter", "WindowWidth"
+    ]
+
+    # Valores más largos que esto se resumen en la vista de elementos
+    max_largo_valor = 80
+
     def __init__(self):
         self.dicom_data = None
         self.image = None
+        self.archivo = None
+        self.id_archivo = None
+        self.pixeles = None
+        self.frame_actual = 0
 
     def cargar_archivo(self, uploaded_file):
-        if uploaded_file.name.endswith(".dcm"):
-            self.dicom_data = pydicom.dcmread(uploaded_file)
+        # El procesador vive en la sesión: si el archivo no cambió entre reruns, se reutiliza
+        # el encabezado ya leído y los píxeles ya decodificados
+        id_archivo = (uploaded_file.name, getattr(uploaded_file, "file_id", None), uploaded_file.size)
+        if id_archivo != self.id_archivo:
+            self.dicom_data = None
+            self.image = None
+            self.pixeles = None
+            self.archivo = uploaded_file
+            self.id_archivo = id_archivo
+            if uploaded_file.name.lower().endswith(".dcm"):
+                # Solo el encabezado: los píxeles se decodifican cuando se necesitan
+                uploaded_file.seek(0)
+                self.dicom_data = pydicom.dcmread(uploaded_file, stop_before_pixels=True)
+            elif uploaded_file.name.lower().endswith((".jpg", ".jpeg")):
+                self.image = Image.open(uploaded_file)
+
+        if self.dicom_data is not None:
             st.write("Información del archivo DICOM cargado:")
-            st.write(self.dicom_data)
-        elif uploaded_file.name.lower().endswith((".jpg", ".jpeg")):
-            self.image = Image.open(uploaded_file)
+            st.table(self.resumen_tags())
+            with st.expander("Todos los elementos (sin etiquetas privadas)"):
+                st.dataframe(self.elementos())
+        elif self.image is not None:
             st.write("Imagen en formato JPG cargada.")
 
+    # Valores de los elementos principales del encabezado
+    def resumen_tags(self):
+        resumen = {}
+        for keyword in self.tags_resumen:
+            valor = self.dicom_data.get(keyword)
+            if valor is not None:
+                resumen[keyword] = str(valor)
+        return resumen
+
+    # Elementos públicos del encabezado; las secuencias y los valores grandes se resumen
+    def elementos(self):
+        filas = []
+        for elemento in self.dicom_data:
+            if elemento.tag.is_private:
+                continue
+            if elemento.VR == "SQ":
+                valor = f"<secuencia de {len(elemento.value)} elementos>"
+            elif elemento.VR in ("OB", "OW", "OF", "OD", "UN"):
+                valor = f"<{elemento.VR}, {len(elemento.value or b'')} bytes>"
+            else:
+                valor = str(elemento.value)
+                if len(valor) > self.max_largo_valor:
+                    valor = valor[:self.max_largo_valor] + "..."
+            filas.append({"Tag": str(elemento.tag), "Nombre": elemento.name, "Valor": valor})
+        return filas
+
+    # Decodifica los píxeles una sola vez por archivo; el dataset completo se descarta después
+    # para no mantener en memoria los bytes comprimidos junto con el array decodificado
     def obtener_imagen(self):
-        if self.dicom_data:
-            imagen_array = self.dicom_data.pixel_array
-            return imagen_array
-        elif self.image:
-            return np.array(self.image)
+        if self.pixeles is not None:
+            return self.pixeles
+        if self.dicom_data is not None:
+            self.archivo.seek(0)
+            self.pixeles = pydicom.dcmread(self.archivo).pixel_array
+            return self.pixeles
+        elif self.image is not None:
+            # Modos como P, CMYK o LA se convierten a RGB; las imágenes en gris se mantienen en L
+            if self.image.mode not in ("L", "RGB"):
+                self.image = self.image.convert("RGB")
+            self.pixeles = np.asarray(self.image)
+            return self.pixeles
         else:
             st.warning("No se ha cargado ningún archivo válido.")
             return None
 
+    # Imagen lista para el generador: en multiframe, el frame seleccionado en mostrar_imagen
+    def obtener_tensor(self, preprocesador):
+        imagen = self.obtener_imagen()
+        if imagen is None:
+            return None
+        if self.es_multiframe():
+            imagen = imagen[self.frame_actual]
+        return preprocesador.procesar(imagen, self.dicom_data)
+
+    # Se decide por NumberOfFrames y no por la forma: un frame RGB (alto, ancho, 3) también tiene
+    # tres dimensiones, y un multiframe RGB tiene cuatro (frames, alto, ancho, 3)
+    def es_multiframe(self):
+        return self.dicom_data is not None and int(self.dicom_data.get("NumberOfFrames", 1) or 1) > 1
+
     def mostrar_imagen(self):
         imagen = self.obtener_imagen()
         if imagen is not None:
-            st.image(imagen, caption="Imagen cargada", use_column_width=True)
+            # Multiframe: se muestra un frame a la vez
+            if self.es_multiframe():
+                self.frame_actual = st.slider("Frame", 0, imagen.shape[0] - 1, imagen.shape[0] // 2)
+                imagen = imagen[self.frame_actual]
+            st.image(self.para_mostrar(imagen), caption="Imagen cargada", use_container_width=True)
+
+    # Escala a 8 bits solo para visualizar (CT suele venir en 12-16 bits)
+    def para_mostrar(self, imagen):
+        if imagen.dtype == np.uint8:
+            return imagen
+        minimo, maximo = float(imagen.min()), float(imagen.max())
+        escala = 255.0 / (maximo - minimo) if maximo > minimo else 0.0
+        return ((imagen - minimo) * escala).astype(np.uint8)
+
+
+# Preprocesamiento de imágenes DICOM y JPG hacia el tensor de entrada del generador:
+# reescalado a HU (RescaleSlope/Intercept), ventana, redimensionado, canales y normalización a
+# [-1, 1]. Todo se hace con operaciones de NumPy sobre un único buffer float32, en el mismo
+# lugar siempre que se puede, y sobre lotes (N, alto, ancho[, canales]) para series completas.
+class Preprocesador:
+    # Ventanas (centro, ancho) en unidades Hounsfield
+    ventanas = {
+        "Abdomen": (40, 400),
+        "Tejido blando": (50, 350),
+        "Pulmón": (-600, 1500),
+        "Hueso": (400, 1800),
+        "Cerebro": (40, 80)
+    }
+
+    # Pesos de luminancia para pasar de RGB a un canal
+    pesos_luma = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    # ventana: nombre de un preset, "Del archivo" (WindowCenter/WindowWidth) o "Mín-máx"
+    def __init__(self, tamano=256, canales=1, ventana="Abdomen"):
+        self.tamano = tamano
+        self.canales = canales
+        self.ventana = ventana
+
+    # Una imagen (alto, ancho[, canales]) -> (tamano, tamano, canales)
+    def procesar(self, imagen, encabezado=None):
+        return self.procesar_lote(np.asarray(imagen)[np.newaxis], encabezado)[0]
+
+    # Lote (N, alto, ancho[, canales]) -> (N, tamano, tamano, canales) float32 en [-1, 1]
+    # encabezado: uno para todo el lote o una lista con el de cada imagen (cortes de una serie).
+    # limites: ventana (bajo, alto) ya calculada, por ejemplo el mín-máx de toda una serie.
+    def procesar_lote(self, lote, encabezado=None, limites=None):
+        lote = np.asarray(lote)
+        if lote.ndim == 3:
+            lote = lote[..., np.newaxis]
+
+        # Única copia de los datos originales: el resto de pasos trabaja sobre este buffer
+        if lote.shape[-1] == 3 and self.canales == 1:
+            datos = np.tensordot(lote.astype(np.float32, copy=False), self.pesos_luma, axes=([-1], [0]))
+            datos = datos[..., np.newaxis]
+        else:
+            datos = lote.astype(np.float32, copy=True)
+
+        # Redimensionar primero: los pasos siguientes recorren menos píxeles
+        datos = self.redimensionar(datos)
+        self.normalizar(datos, encabezado, limites)
+
+        if datos.shape[-1] == 1 and self.canales == 3:
+            datos = np.repeat(datos, 3, axis=-1)
+        return datos
+
+    # Reescalado, ventana y normalización a [-1, 1], en el mismo buffer. Con un encabezado por
+    # imagen, la pendiente, el intercepto y la ventana se aplican por imagen (arrays (N, 1, 1, 1)).
+    def normalizar(self, datos, encabezado=None, limites=None):
+        if encabezado is None:
+            # JPG u otras imágenes de 8 bits
+            datos *= 2.0 / 255.0
+            datos -= 1.0
+            return datos
+
+        pendiente, intercepto = self.reescalado(encabezado)
+        if np.any(pendiente != 1):
+            datos *= pendiente
+        if np.any(intercepto != 0):
+            datos += intercepto
+
+        bajo, alto = limites if limites is not None else self.limites_ventana(datos, encabezado)
+        np.clip(datos, bajo, alto, out=datos)
+        datos -= bajo
+        datos *= 2.0 / np.maximum(np.subtract(alto, bajo), 1e-6)
+        datos -= 1.0
+        return datos
+
+    # RescaleSlope y RescaleIntercept del encabezado, o de cada encabezado de la lista
+    def reescalado(self, encabezado):
+        if isinstance(encabezado, (list, tuple)):
+            valores = np.array([self.reescalado(uno) for uno in encabezado], dtype=np.float32)
+            return valores[:, 0, np.newaxis, np.newaxis, np.newaxis], valores[:, 1, np.newaxis, np.newaxis, np.newaxis]
+        return float(encabezado.get("RescaleSlope", 1) or 1), float(encabezado.get("RescaleIntercept", 0) or 0)
+
+    # Límites (bajo, alto) de la ventana; sin ventana fija, el mínimo y el máximo de los datos
+    # (de cada imagen, si hay un encabezado por imagen)
+    def limites_ventana(self, datos, encabezado):
+        if isinstance(encabezado, (list, tuple)):
+            limites = np.array([self.limites_ventana(imagen, uno) for imagen, uno in zip(datos, encabezado)],
+                               dtype=np.float32)
+            return limites[:, 0, np.newaxis, np.newaxis, np.newaxis], limites[:, 1, np.newaxis, np.newaxis, np.newaxis]
+        ventana = self.ventana_fija(encabezado)
+        if ventana is None:
+            return float(datos.min()), float(datos.max())
+        return ventana
+
+    # Las ventanas predefinidas están en HU y solo tienen sentido en CT. Otras modalidades
+    # (ultrasonido, por ejemplo) no tienen HU y se normalizan entre su mínimo y su máximo.
+    # Devuelve None cuando corresponde el mín-máx.
+    def ventana_fija(self, encabezado):
+        if self.ventana in self.ventanas and encabezado.get("Modality") == "CT":
+            centro, ancho = self.ventanas[self.ventana]
+        elif self.ventana == "Del archivo" and "WindowCenter" in encabezado and "WindowWidth" in encabezado:
+            centro = float(np.ravel(encabezado.WindowCenter)[0])
+            ancho = float(np.ravel(encabezado.WindowWidth)[0])
+        else:
+            return None
+        return centro - ancho / 2.0, centro + ancho / 2.0
+
+    # Mín-máx de toda una serie (después del reescalado de cada corte), para que el contraste no
+    # cambie entre lotes ni entre cortes. None si la serie usa una ventana fija. Recorre la serie
+    # una vez más (corte a corte, sin mantenerla en memoria).
+    def limites_serie(self, serie):
+        if self.ventana_fija(serie.encabezado) is not None:
+            return None
+        bajo, alto = np.inf, -np.inf
+        for corte, encabezado in zip(serie.iterar_cortes(), serie.encabezados):
+            pendiente, intercepto = self.reescalado(encabezado)
+            extremos = np.array([corte.min(), corte.max()], dtype=np.float64) * pendiente + intercepto
+            bajo, alto = min(bajo, extremos.min()), max(alto, extremos.max())
+        return float(bajo), float(alto)
+
+    # Redimensiona todo el lote a (tamano, tamano). Si el tamaño es un divisor exacto se promedia
+    # por bloques (sin aliasing); si no, interpolación bilineal vectorizada sobre el lote
+    def redimensionar(self, datos):
+        _, alto, ancho, _ = datos.shape
+        tamano = self.tamano
+        if tamano is None or (alto, ancho) == (tamano, tamano):
+            return datos
+
+        if alto % tamano == 0 and ancho % tamano == 0:
+            n, _, _, canales = datos.shape
+            bloques = datos.reshape(n, tamano, alto // tamano, tamano, ancho // tamano, canales)
+            return bloques.mean(axis=(2, 4), dtype=np.float32)
+
+        y0, y1, wy = self._indices_bilineales(alto, tamano)
+        x0, x1, wx = self._indices_bilineales(ancho, tamano)
+        wy = wy[np.newaxis, :, np.newaxis, np.newaxis]
+        wx = wx[np.newaxis, np.newaxis, :, np.newaxis]
+
+        filas0 = datos[:, y0]
+        filas1 = datos[:, y1]
+        arriba = filas0[:, :, x0] * (1 - wx) + filas0[:, :, x1] * wx
+        abajo = filas1[:, :, x0] * (1 - wx) + filas1[:, :, x1] * wx
+        arriba *= 1 - wy
+        abajo *= wy
+        arriba += abajo
+        return arriba
+
+    def _indices_bilineales(self, origen, destino):
+        posiciones = (np.arange(destino, dtype=np.float32) + 0.5) * (origen / destino) - 0.5
+        np.clip(posiciones, 0, origen - 1, out=posiciones)
+        inferior = np.floor(posiciones).astype(np.intp)
+        superior = np.minimum(inferior + 1, origen - 1)
+        return inferior, superior, (posiciones - inferior).astype(np.float32)
+
+    # Salida del generador ([-1, 1]) -> imagen uint8 para mostrar o guardar
+    def a_imagen(self, salida):
+        salida = np.asarray(salida, dtype=np.float32)
+        if salida.ndim == 3 and salida.shape[-1] == 1:
+            salida = salida[..., 0]
+        imagen = np.clip(salida, -1.0, 1.0)
+        imagen += 1.0
+        imagen *= 127.5
+        return imagen.astype(np.uint8)
+
+
+# Serie de CT: cientos de cortes DICOM en un ZIP o en una carpeta.
+# Al abrirla solo se leen los encabezados, para ordenar los cortes por su posición
+# (ImagePositionPatient proyectada sobre la normal del corte, o InstanceNumber). Los píxeles se
+# decodifican corte a corte al iterar, o se vuelcan a un volumen 3D en un archivo mapeado en memoria.
+# El ZIP y el volumen temporal se liberan con cerrar() o, si nadie la llama (la sesión terminó),
+# cuando la serie deja de usarse.
+class SerieDicom:
+    def __init__(self, origen):
+        self.zip = None
+        if isinstance(origen, (str, os.PathLike)) and os.path.isdir(origen):
+            fuentes = [os.path.join(raiz, nombre) for raiz, _, nombres in os.walk(origen) for nombre in nombres]
+        else:
+            self.zip = zipfile.ZipFile(origen)
+            fuentes = [info.filename for info in self.zip.infolist() if not info.is_dir()]
+        self.temporales = []
+        self._liberar = weakref.finalize(self, liberar_serie, self.zip, self.temporales)
+
+        cortes = []
+        for fuente in fuentes:
+            # Los archivos que no son DICOM, o les faltan datos, se omiten (pydicom puede fallar
+            # con distintas excepciones según qué falte)
+            try:
+                with self._abrir(fuente) as archivo:
+                    encabezado = pydicom.dcmread(archivo, stop_before_pixels=True)
+                if "Rows" in encabezado:
+                    cortes.append((self._clave_orden(encabezado, fuente), fuente, encabezado))
+            except (InvalidDicomError, OSError, AttributeError, KeyError, TypeError, ValueError, IndexError) as error:
+                log.warning("Se omite %s de la serie: %s", fuente, error)
+        if not cortes:
+            self.cerrar()
+            raise ValueError("No se encontraron cortes DICOM en la serie.")
+
+        cortes.sort(key=lambda corte: corte[0])
+        self.fuentes = [fuente for _, fuente, _ in cortes]
+        # Encabezados (sin píxeles) de cada corte: el reescalado y la ventana pueden variar entre cortes
+        self.encabezados = [encabezado for _, _, encabezado in cortes]
+        self.encabezado = cortes[0][2]
+        self.forma = (len(self.fuentes), int(self.encabezado.Rows), int(self.encabezado.Columns))
+        self.ruta_volumen = None
+
+    def _abrir(self, fuente):
+        return self.zip.open(fuente) if self.zip is not None else open(fuente, "rb")
+
+    # Posición del corte a lo largo de la normal del plano; si falta, el número de instancia
+    def _clave_orden(self, encabezado, fuente):
+        posicion = encabezado.get("ImagePositionPatient")
+        orientacion = encabezado.get("ImageOrientationPatient")
+        if posicion is not None and orientacion is not None:
+            normal = np.cross(np.array(orientacion[:3], dtype=float), np.array(orientacion[3:], dtype=float))
+            return (0, float(np.dot(normal, np.array(posicion, dtype=float))), fuente)
+        numero = encabezado.get("InstanceNumber")
+        if numero is not None:
+            return (1, float(numero), fuente)
+        return (2, 0.0, fuente)
+
+    def __len__(self):
+        return len(self.fuentes)
+
+    # Decodifica un solo corte
+    def corte(self, indice):
+        with self._abrir(self.fuentes[indice]) as archivo:
+            return pydicom.dcmread(archivo).pixel_array
+
+    # Iterador perezoso: solo hay un corte decodificado en memoria a la vez
+    def iterar_cortes(self):
+        for indice in range(len(self)):
+            yield self.corte(indice)
+
+    # Lotes de cortes consecutivos (tam_lote, alto, ancho) para el modelo
+    def lotes(self, tam_lote=8):
+        lote = []
+        for corte in self.iterar_cortes():
+            lote.append(corte)
+            if len(lote) == tam_lote:
+                yield np.stack(lote)
+                lote = []
+        if lote:
+            yield np.stack(lote)
+
+    # Volumen 3D (cortes, alto, ancho) en un archivo temporal mapeado en memoria: el sistema
+    # operativo carga las páginas bajo demanda en lugar de mantener todo el volumen en RAM
+    def volumen(self):
+        if self.ruta_volumen is None:
+            primero = self.corte(0)
+            archivo = tempfile.NamedTemporaryFile(suffix=".npy", delete=False)
+            archivo.close()
+            self.ruta_volumen = archivo.name
+            self.temporales.append(archivo.name)
+            volumen = np.lib.format.open_memmap(self.ruta_volumen, mode="w+", dtype=primero.dtype, shape=self.forma)
+            volumen[0] = primero
+            for indice in range(1, len(self)):
+                volumen[indice] = self.corte(indice)
+            volumen.flush()
+            del volumen
+        return np.load(self.ruta_volumen, mmap_mode="r")
+
+    # Cierra el ZIP y elimina el volumen temporal
+    def cerrar(self):
+        self._liberar()
+        self.zip = None
+        self.ruta_volumen = None
+
+
+# Libera los recursos de una serie; no recibe la serie para que el finalizador no la mantenga viva
+def liberar_serie(archivo_zip, temporales):
+    if archivo_zip is not None:
+        archivo_zip.close()
+    for ruta in temporales:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    temporales.clear()
+
+
+# Servidor de inferencia dentro del proceso: agrupa las solicitudes que llegan al mismo modelo
+# en micro-lotes (hasta tam_max_lote imágenes o espera_max segundos) y ejecuta una sola pasada
+# del generador por lote. Cada solicitud recibe su resultado a través de un Future.
+# En la aplicación el modelo vive en los procesos de trabajos (trabajos.py), que ejecutan un
+# trabajo a la vez: los lotes reúnen los cortes de una serie o las teselas de una imagen, no
+# solicitudes de distintos usuarios.
+class ServidorInferencia:
+    def __init__(self, funcion_lote, tam_max_lote=8, espera_max=0.01):
+        self.funcion_lote = funcion_lote
+        self.tam_max_lote = tam_max_lote
+        self.espera_max = espera_max
+        self.cola = queue.Queue()
+        self.hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self.hilo.start()
+
+    # Encola una imagen para traducir en la dirección indicada ("ct2us" o "us2ct")
+    def enviar(self, imagen, direccion):
+        futuro = Future()
+        self.cola.put((np.asarray(imagen), direccion, futuro))
+        return futuro
+
+    # Espera la primera solicitud y completa el lote con las que lleguen hasta espera_max
+    def _armar_lote(self):
+        lote = [self.cola.get()]
+        limite = time.monotonic() + self.espera_max
+        while len(lote) < self.tam_max_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self.cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _trabajar(self):
+        while True:
+            # Solo se apilan juntas las imágenes con la misma dirección, forma y tipo
+            grupos = {}
+            for imagen, direccion, futuro in self._armar_lote():
+                if futuro.set_running_or_notify_cancel():
+                    clave = (direccion, imagen.shape, imagen.dtype.str)
+                    grupos.setdefault(clave, []).append((imagen, futuro))
+
+            for (direccion, _, _), solicitudes in grupos.items():
+                try:
+                    salidas = self.funcion_lote(np.stack([imagen for imagen, _ in solicitudes]), direccion)
+                except Exception as error:
+                    for _, futuro in solicitudes:
+                        futuro.set_exception(error)
+                    continue
+                for (_, futuro), salida in zip(solicitudes, salidas):
+                    futuro.set_result(salida)
+
+
+# Generador de S-CycleGAN (arquitectura ResNet de CycleGAN): codificador con dos convoluciones
+# con stride 2, bloques residuales y decodificador simétrico, con salida tanh en [-1, 1].
+# PyTorch se importa aquí para que la aplicación funcione sin él si no se usa el modelo.
+def construir_generador_resnet(canales=1, filtros=64, bloques=9):
+    from torch import nn
+
+    class BloqueResidual(nn.Module):
+        def __init__(self, dimension):
+            super().__init__()
+            self.capas = nn.Sequential(
+                nn.ReflectionPad2d(1), nn.Conv2d(dimension, dimension, 3), nn.InstanceNorm2d(dimension), nn.ReLU(True),
+                nn.ReflectionPad2d(1), nn.Conv2d(dimension, dimension, 3), nn.InstanceNorm2d(dimension)
+            )
+
+        def forward(self, x):
+            return x + self.capas(x)
+
+    capas = [nn.ReflectionPad2d(3), nn.Conv2d(canales, filtros, 7), nn.InstanceNorm2d(filtros), nn.ReLU(True)]
+    for i in range(2):
+        entrada = filtros * 2 ** i
+        capas += [nn.Conv2d(entrada, entrada * 2, 3, stride=2, padding=1), nn.InstanceNorm2d(entrada * 2), nn.ReLU(True)]
+    capas += [BloqueResidual(filtros * 4) for _ in range(bloques)]
+    for i in range(2):
+        entrada = filtros * 2 ** (2 - i)
+        capas += [nn.ConvTranspose2d(entrada, entrada // 2, 3, stride=2, padding=1, output_padding=1),
+                  nn.InstanceNorm2d(entrada // 2), nn.ReLU(True)]
+    capas += [nn.ReflectionPad2d(3), nn.Conv2d(filtros, canales, 7), nn.Tanh()]
+    return nn.Sequential(*capas)
+
+
+# Envuelve una red de PyTorch con la interfaz de los generadores: lotes NHWC de NumPy
+class GeneradorTorch:
+    def __init__(self, red):
+        self.red = red.eval()
+
+    def predict(self, lote):
+        import torch
+
+        # from_numpy no copia los datos; solo se reordenan los ejes a NCHW
+        entrada = torch.from_numpy(np.ascontiguousarray(np.asarray(lote, dtype=np.float32).transpose(0, 3, 1, 2)))
+        with torch.inference_mode():
+            salida = self.red(entrada)
+        return salida.numpy().transpose(0, 2, 3, 1)
+
+
+# Carga los generadores desde un archivo safetensors. El archivo se mapea en memoria: los pesos
+# no se copian ni se deserializan con pickle, y varios procesos que abren el mismo archivo
+# comparten sus páginas a través de la caché del sistema operativo.
+# Formato: tensores "ct2us.<parámetro>" y "us2ct.<parámetro>", y la arquitectura en los metadatos.
+def cargar_generadores_safetensors(ruta):
+    import torch
+    from safetensors import safe_open
+
+    generadores = {}
+    with safe_open(ruta, framework="pt", device="cpu") as archivo:
+        metadatos = archivo.metadata() or {}
+        canales = int(metadatos.get("canales", IA_Modelo.canales_entrada))
+        filtros = int(metadatos.get("filtros", 64))
+        bloques = int(metadatos.get("bloques", 9))
+        for direccion in ("ct2us", "us2ct"):
+            prefijo = direccion + "."
+            estado = {clave[len(prefijo):]: archivo.get_tensor(clave) for clave in archivo.keys()
+                      if clave.startswith(prefijo)}
+            if not estado:
+                continue
+            # La red se crea sin memoria (dispositivo "meta") y adopta los tensores del archivo
+            with torch.device("meta"):
+                red = construir_generador_resnet(canales, filtros, bloques)
+            red.load_state_dict(estado, assign=True)
+            generadores[direccion] = GeneradorTorch(red)
+    if not generadores:
+        raise ValueError(f"{ruta} no contiene generadores 'ct2us' ni 'us2ct'.")
+    return generadores
+
+
+# Guarda los generadores de PyTorch en formato safetensors (por ejemplo, para convertir una
+# vez, en un entorno de confianza, un modelo entrenado que estaba guardado con pickle)
+def guardar_generadores_safetensors(redes, ruta, canales=1, filtros=64, bloques=9):
+    from safetensors.torch import save_file
+
+    tensores = {f"{direccion}.{nombre}": tensor.detach().contiguous()
+                for direccion, red in redes.items() for nombre, tensor in red.state_dict().items()}
+    save_file(tensores, ruta, metadata={"canales": str(canales), "filtros": str(filtros), "bloques": str(bloques)})
+
+
+# Generador ejecutado con ONNX Runtime en CPU. hilos_intra controla los hilos dentro de cada
+# operador (convoluciones) y hilos_inter los hilos entre operadores independientes.
+class GeneradorONNX:
+    def __init__(self, ruta, hilos_intra=0, hilos_inter=1):
+        import onnxruntime as ort
+
+        opciones = ort.SessionOptions()
+        opciones.intra_op_num_threads = hilos_intra
+        opciones.inter_op_num_threads = hilos_inter
+        opciones.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL if hilos_inter <= 1 else ort.ExecutionMode.ORT_PARALLEL
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sesion = ort.InferenceSession(ruta, opciones, providers=["CPUExecutionProvider"])
+        self.entrada = self.sesion.get_inputs()[0].name
+
+    def predict(self, lote):
+        entrada = np.ascontiguousarray(np.asarray(lote, dtype=np.float32).transpose(0, 3, 1, 2))
+        salida = self.sesion.run(None, {self.entrada: entrada})[0]
+        return salida.transpose(0, 2, 3, 1)
+
+
+# Exporta un generador de PyTorch a ONNX con lote y resolución dinámicos
+def exportar_onnx(generador, ruta, canales=1, tamano=256):
+    import torch
+
+    ejemplo = torch.zeros(1, canales, tamano, tamano)
+    ejes = {0: "lote", 2: "alto", 3: "ancho"}
+    torch.onnx.export(generador.red, ejemplo, ruta, input_names=["imagen"], output_names=["traduccion"],
+                      dynamic_axes={"imagen": ejes, "traduccion": ejes}, opset_version=17, dynamo=False)
+
+
+# Cuantiza dinámicamente los pesos a INT8 (las activaciones se cuantizan en tiempo de ejecución)
+def cuantizar_int8(ruta_onnx, ruta_salida):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(ruta_onnx, ruta_salida, weight_type=QuantType.QInt8)
+
+
+# PSNR por imagen entre lotes en [-1, 1] (rango de datos 2)
+def psnr(referencia, salida):
+    error = np.mean((referencia.astype(np.float64) - salida) ** 2, axis=tuple(range(1, referencia.ndim)))
+    return 10 * np.log10(4.0 / np.maximum(error, 1e-12))
+
+
+# SSIM medio por imagen con ventana uniforme de 7x7 (la de scikit-image por defecto),
+# calculado para todo el lote con sumas acumuladas
+def ssim(referencia, salida, ventana=7):
+    c1, c2 = (0.01 * 2.0) ** 2, (0.03 * 2.0) ** 2
+    x = referencia.astype(np.float64)
+    y = salida.astype(np.float64)
+    if x.ndim == 4:
+        x = x.mean(axis=-1)
+        y = y.mean(axis=-1)
+
+    def promedio(imagen):
+        acumulado = np.pad(imagen, ((0, 0), (1, 0), (1, 0))).cumsum(axis=1).cumsum(axis=2)
+        suma = (acumulado[:, ventana:, ventana:] - acumulado[:, :-ventana, ventana:]
+                - acumulado[:, ventana:, :-ventana] + acumulado[:, :-ventana, :-ventana])
+        return suma / ventana ** 2
+
+    n = ventana ** 2
+    mx, my = promedio(x), promedio(y)
+    vx = (promedio(x * x) - mx * mx) * n / (n - 1)
+    vy = (promedio(y * y) - my * my) * n / (n - 1)
+    cxy = (promedio(x * y) - mx * my) * n / (n - 1)
+    mapa = ((2 * mx * my + c1) * (2 * cxy + c2)) / ((mx ** 2 + my ** 2 + c1) * (vx + vy + c2))
+    return mapa.mean(axis=(1, 2))
+
+
+# Compara cada backend con la referencia sobre las mismas imágenes: PSNR y SSIM mínimos, y
+# latencia media por imagen. Con psnr_min/ssim_min indica cuáles cumplen el umbral de calidad.
+def comparar_backends(referencia, candidatos, imagenes, psnr_min=35.0, ssim_min=0.98, repeticiones=3):
+    def medir(generador):
+        generador.predict(imagenes[:1])
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            salida = generador.predict(imagenes)
+        return salida, (time.perf_counter() - inicio) / (repeticiones * len(imagenes))
+
+    salida_referencia, latencia_referencia = medir(referencia)
+    resultados = [{"backend": "pytorch", "latencia_ms": latencia_referencia * 1000,
+                   "psnr": float("inf"), "ssim": 1.0, "aprobado": True}]
+    for nombre, generador in candidatos.items():
+        salida, latencia = medir(generador)
+        valor_psnr = float(psnr(salida_referencia, salida).min())
+        valor_ssim = float(ssim(salida_referencia, salida).min())
+        resultados.append({"backend": nombre, "latencia_ms": latencia * 1000, "psnr": valor_psnr,
+                           "ssim": valor_ssim, "aprobado": valor_psnr >= psnr_min and valor_ssim >= ssim_min})
+    return resultados
+
+
+# Backend más rápido entre los que cumplen el umbral de calidad
+def elegir_backend(resultados):
+    return min((r for r in resultados if r["aprobado"]), key=lambda r: r["latencia_ms"])["backend"]
+
+
+# Imágenes de control para comparar backends: bloques de 16x16 en [-1, 1], reproducibles, con
+# zonas planas y bordes como las imágenes médicas (el ruido puro penaliza de más a INT8)
+def imagenes_control(cantidad=4, canales=1, tamano=256, semilla=0):
+    bloques = np.random.default_rng(semilla).uniform(-1.0, 1.0, (cantidad, tamano // 16, tamano // 16, canales))
+    return bloques.astype(np.float32).repeat(16, axis=1).repeat(16, axis=2)
 
 
 # Clase para manejar el modelo de IA entrenado
+# self.modelo contiene un generador por dirección de traducción ({"ct2us": ..., "us2ct": ...});
+# cada generador recibe un lote de imágenes (N, H, W, C) y devuelve otro lote de la misma forma.
+#
+# Backends de inferencia: "pytorch" (modelo de referencia), "onnx" (ONNX Runtime) y "onnx-int8"
+# (pesos cuantizados a INT8). Los modelos ONNX se exportan desde los pesos la primera vez y se
+# guardan junto a ellos. Un backend ONNX solo se usa si sus traducciones de las imágenes de
+# control alcanzan psnr_min y ssim_min frente a PyTorch; backend_usado indica el de cada dirección.
 class IA_Modelo:
-    def __init__(self, modelo_path):
+    # Resolución y canales de entrada de los generadores
+    tamano_entrada = 256
+    canales_entrada = 1
+
+    backends = ("pytorch", "onnx", "onnx-int8")
+
+    # Umbral de precisión de los backends ONNX frente a PyTorch
+    psnr_min = 35.0
+    ssim_min = 0.98
+
+    def __init__(self, modelo_path, tam_max_lote=8, espera_max=0.01, backend="pytorch", hilos_intra=0, hilos_inter=1):
+        if backend not in self.backends:
+            raise ValueError(f"Backend desconocido: {backend}. Opciones: {', '.join(self.backends)}")
         self.modelo = self.cargar_modelo(modelo_path)
+        self.backend_usado = {direccion: "pytorch" for direccion in self.modelo}
+        if backend != "pytorch":
+            self.modelo = self.preparar_onnx(modelo_path, backend, hilos_intra, hilos_inter)
+        # La instancia se comparte entre sesiones, así que todas usan el mismo servidor
+        self.servidor = ServidorInferencia(self.predecir_lote, tam_max_lote, espera_max)
 
+    # Solo se aceptan pesos en safetensors: un pickle puede ejecutar código arbitrario al cargarse
     def cargar_modelo(self, modelo_path):
-        with open(modelo_path, 'rb') as file:
-            # Aquí deberías cargar el modelo con pickle
-            # modelo = pickle.load(file)
-            print('su considerable madre')
+        if not modelo_path.lower().endswith(".safetensors"):
+            raise ValueError(
+                f"Formato de modelo no soportado: {modelo_path}. Convierte los pesos con "
+                "guardar_generadores_safetensors; los archivos pickle no se cargan por seguridad."
+            )
+        modelo = cargar_generadores_safetensors(modelo_path)
         st.success("Modelo IA cargado correctamente.")
         return modelo
 
-    def predecir(self, imagen):
+    # Exporta (si hace falta) y abre los generadores ONNX de cada dirección. Cada uno pasa antes
+    # por la compuerta de precisión: si INT8 no alcanza el umbral se prueba ONNX en float32, y si
+    # tampoco, la dirección queda en PyTorch.
+    def preparar_onnx(self, modelo_path, backend, hilos_intra, hilos_inter):
+        base = os.path.splitext(modelo_path)[0]
+        imagenes = imagenes_control(2, self.canales_entrada, self.tamano_entrada)
+        generadores = {}
+        for direccion, generador in self.modelo.items():
+            ruta = f"{base}.{direccion}.onnx"
+            if not os.path.exists(ruta) or os.path.getmtime(ruta) < os.path.getmtime(modelo_path):
+                exportar_onnx(generador, ruta, self.canales_entrada, self.tamano_entrada)
+            opciones = [("onnx", ruta)]
+            if backend == "onnx-int8":
+                ruta_int8 = f"{base}.{direccion}.int8.onnx"
+                if not os.path.exists(ruta_int8) or os.path.getmtime(ruta_int8) < os.path.getmtime(ruta):
+                    cuantizar_int8(ruta, ruta_int8)
+                opciones.insert(0, ("onnx-int8", ruta_int8))
+
+            generadores[direccion] = generador
+            for nombre, ruta in opciones:
+                candidato = GeneradorONNX(ruta, hilos_intra, hilos_inter)
+                resultado = comparar_backends(generador, {nombre: candidato}, imagenes,
+                                              self.psnr_min, self.ssim_min, repeticiones=1)[-1]
+                if resultado["aprobado"]:
+                    generadores[direccion] = candidato
+                    self.backend_usado[direccion] = nombre
+                    break
+                log.warning("%s no alcanza la precisión mínima en %s (PSNR %.1f dB, SSIM %.4f); se descarta.",
+                            nombre, direccion, resultado["psnr"], resultado["ssim"])
+        return generadores
+
+    # Una pasada del generador sobre un lote completo
+    def predecir_lote(self, lote, direccion):
+        return self.modelo[direccion].predict(lote)
+
+    # Traduce una serie completa por lotes de cortes. Los cortes de cada lote se envían juntos al
+    # servidor, que los agrupa en una sola pasada; se devuelven en orden a medida que terminan.
+    # Cada corte se preprocesa con su propio encabezado; el mín-máx se calcula sobre toda la serie.
+    def predecir_serie(self, serie, direccion="ct2us", tam_lote=8, preprocesador=None):
+        limites = preprocesador.limites_serie(serie) if preprocesador is not None else None
+        inicio = 0
+        for lote in serie.lotes(tam_lote):
+            if preprocesador is not None:
+                lote = preprocesador.procesar_lote(lote, serie.encabezados[inicio:inicio + len(lote)], limites)
+                inicio += len(lote)
+            futuros = [self.servidor.enviar(corte, direccion) for corte in lote]
+            for futuro in futuros:
+                yield futuro.result()
+
+    # Inferencia por teselas para imágenes mayores que la entrada del generador: la imagen
+    # (alto, ancho, canales) se divide en teselas solapadas que se envían juntas al servidor,
+    # y las salidas se combinan con pesos que decrecen hacia los bordes de cada tesela para
+    # que no se noten las uniones. La memoria depende del tamaño de tesela, no de la imagen.
+    def predecir_por_teselas(self, imagen, direccion="ct2us", solapamiento=32):
+        tamano = self.tamano_entrada
+        alto, ancho = imagen.shape[:2]
+
+        # Imágenes más pequeñas que una tesela: se completan reflejando los bordes
+        relleno = ((0, max(0, tamano - alto)), (0, max(0, tamano - ancho))) + ((0, 0),) * (imagen.ndim - 2)
+        if any(despues for _, despues in relleno):
+            imagen = np.pad(imagen, relleno, mode="reflect")
+        alto_total, ancho_total = imagen.shape[:2]
+
+        filas = self._inicios_teselas(alto_total, tamano, solapamiento)
+        columnas = self._inicios_teselas(ancho_total, tamano, solapamiento)
+        posiciones = [(fila, columna) for fila in filas for columna in columnas]
+        futuros = [self.servidor.enviar(imagen[fila:fila + tamano, columna:columna + tamano], direccion)
+                   for fila, columna in posiciones]
+
+        pesos = self._pesos_tesela(tamano, solapamiento)
+        if imagen.ndim == 3:
+            pesos = pesos[..., np.newaxis]
+        acumulado = None
+        suma_pesos = np.zeros((alto_total, ancho_total) + pesos.shape[2:], dtype=np.float32)
+        for (fila, columna), futuro in zip(posiciones, futuros):
+            salida = np.asarray(futuro.result(), dtype=np.float32)
+            if acumulado is None:
+                acumulado = np.zeros((alto_total, ancho_total) + salida.shape[2:], dtype=np.float32)
+            acumulado[fila:fila + tamano, columna:columna + tamano] += salida * pesos
+            suma_pesos[fila:fila + tamano, columna:columna + tamano] += pesos
+        acumulado /= suma_pesos
+        return acumulado[:alto, :ancho]
+
+    # Posiciones de inicio de las teselas; la última se alinea con el borde de la imagen
+    def _inicios_teselas(self, largo, tamano, solapamiento):
+        paso = max(1, tamano - solapamiento)
+        inicios = list(range(0, largo - tamano + 1, paso))
+        if inicios[-1] != largo - tamano:
+            inicios.append(largo - tamano)
+        return inicios
+
+    # Pesos de mezcla: rampa lineal en la zona de solapamiento, 1 en el centro de la tesela
+    def _pesos_tesela(self, tamano, solapamiento):
+        indices = np.arange(tamano, dtype=np.float32)
+        rampa = np.minimum(np.minimum(indices + 1, tamano - indices), solapamiento + 1) / (solapamiento + 1)
+        return np.outer(rampa, rampa).astype(np.float32)
+
+    # Traduce una imagen; la solicitud se agrupa con las que lleguen a la vez al servidor de
+    # esta instancia (otros hilos del mismo proceso). Con teselado=True se traduce a resolución
+    # completa por teselas, que se envían juntas.
+    def predecir(self, imagen, direccion="ct2us", teselado=False):
         if imagen is not None:
-            # Aquí agregamos cualquier procesamiento adicional que sea necesario para el modelo.
-            # prediccion = self.modelo.predict([imagen.flatten()])  # Ejemplo simple
-            prediccion = 'hola'
-            return prediccion
+            if teselado:
+                return self.predecir_por_teselas(imagen, direccion)
+            return self.servidor.enviar(imagen, direccion).result()
         else:
             st.warning("No se ha proporcionado una imagen válida para predecir.")
             return None
 
 
+# Modelos compartidos por todas las sesiones: se cargan una sola vez por proceso
+# El backend y los hilos de ONNX Runtime se eligen por variables de entorno del servidor
+registry.register("s-cyclegan", lambda: IA_Modelo(
+    "modelo_entrenado.safetensors",
+    backend=os.environ.get("SCYCLEGAN_BACKEND", "pytorch"),
+    hilos_intra=int(os.environ.get("SCYCLEGAN_HILOS_INTRA", "0")),
+    hilos_inter=int(os.environ.get("SCYCLEGAN_HILOS_INTER", "1"))
+))
+# Pool de procesos que ejecuta las traducciones fuera de las sesiones
+registry.register("trabajos", lambda: GestorTrabajos(
+    procesos=int(os.environ.get("SCYCLEGAN_TRABAJADORES", "1"))
+))
+
+
+# Trabajos de la sesión. Los identificadores se guardan también en la URL, para recuperarlos
+# si el navegador se reconecta o se recarga la página.
+def trabajos_sesion():
+    if "trabajos" not in st.session_state:
+        ids = st.query_params.get("trabajos", "")
+        st.session_state.trabajos = [id_trabajo for id_trabajo in ids.split(",") if id_trabajo]
+    return st.session_state.trabajos
+
+
+def agregar_trabajo(id_trabajo):
+    trabajos = trabajos_sesion()
+    if id_trabajo not in trabajos:
+        trabajos.append(id_trabajo)
+    st.query_params["trabajos"] = ",".join(trabajos)
+
+
+# Envía un trabajo al gestor y lo agrega a la sesión. Si el pool de procesos no lo acepta (ni
+# después de reiniciarse) o no se puede guardar la entrada, se informa en lugar de romper la página.
+def enviar_trabajo(enviar, *argumentos):
+    try:
+        agregar_trabajo(enviar(*argumentos))
+    except (RuntimeError, OSError) as error:
+        log.exception("No se pudo enviar el trabajo")
+        st.error(f"No se pudo iniciar el trabajo: {error}")
+
+
+# Estado de los trabajos de la sesión. El fragmento se vuelve a ejecutar solo mientras haya
+# trabajos pendientes: consulta el almacén sin bloquear el resto de la página.
+def mostrar_trabajos(gestor, nombre_base):
+    pendientes = any(
+        (gestor.estado(id_trabajo) or {}).get("estado") in ("en cola", "en curso") for id_trabajo in trabajos_sesion()
+    )
+
+    @st.fragment(run_every=1.0 if pendientes else None)
+    def panel():
+        for id_trabajo in reversed(trabajos_sesion()):
+            estado = gestor.estado(id_trabajo)
+            if estado is None:
+                st.warning(f"Trabajo {id_trabajo}: no encontrado.")
+                continue
+            titulo = "Imagen" if estado["tipo"] == "imagen" else "Serie"
+            if estado["estado"] in ("en cola", "en curso"):
+                total = max(estado["total"], 1)
+                st.progress(estado["progreso"] / total,
+                            text=f"{titulo} {id_trabajo}: {estado['estado']} ({estado['progreso']} de {estado['total'] or '?'})")
+            elif estado["estado"] == "error":
+                st.error(f"{titulo} {id_trabajo}: {estado['mensaje']}")
+            else:
+                ruta = gestor.resultado(id_trabajo)
+                with open(ruta, "rb") as archivo:
+                    datos = archivo.read()
+                if estado["tipo"] == "imagen":
+                    st.image(datos, caption=f"Resultado de la Predicción ({id_trabajo})")
+                    # La imagen se descarga en JPG, con el nombre del paciente
+                    buffer = io.BytesIO()
+                    Image.open(io.BytesIO(datos)).save(buffer, format="JPEG")
+                    st.download_button(
+                        label="Descargar Imagen",
+                        data=buffer.getvalue(),
+                        file_name=f"{nombre_base}.jpg",
+                        mime="image/jpeg",
+                        key=f"descarga_{id_trabajo}"
+                    )
+                else:
+                    st.download_button(
+                        label=f"Descargar Serie Traducida (ZIP, {estado['total']} cortes)",
+                        data=datos,
+                        file_name=f"{nombre_base}_serie.zip",
+                        mime="application/zip",
+                        key=f"descarga_{id_trabajo}"
+                    )
+        # Al terminar el último trabajo se vuelve a dibujar la página para detener el sondeo
+        if pendientes and not any(
+            (gestor.estado(id_trabajo) or {}).get("estado") in ("en cola", "en curso") for id_trabajo in trabajos_sesion()
+        ):
+            st.rerun()
+
+    panel()
+
+
 # Función principal que define la estructura de la aplicación con múltiples páginas
 def main():
+    # Inicia el pool de trabajos la primera vez que se ejecuta el script; el modelo se carga en sus procesos
+    tiempos_inicio = registry.warm_up(["trabajos"])
+
     # Título de la aplicación
     st.title("Aplicación de Procesamiento DICOM/JPG con IA")
     
@@ -78,8 +925,19 @@ def main():
                                         icons=["cloud-upload", "bi bi-clipboard-fill","book"],
                                         menu_icon="cast", default_index=0)
 
-    # Crear instancia del procesador de imágenes
-    dicom_processor = DicomProcessor()
+    # Procesador de imágenes de la sesión (guarda el archivo subido, no se comparte entre usuarios)
+    if "dicom_processor" not in st.session_state:
+        st.session_state.dicom_processor = DicomProcessor()
+    dicom_processor = st.session_state.dicom_processor
+
+    # El inicio del pool se mide aquí; la carga del modelo la informan los procesos de trabajos
+    if "trabajos" in tiempos_inicio:
+        st.sidebar.caption(f"Pool de trabajos iniciado en {tiempos_inicio['trabajos']:.2f} s")
+        gestor = registry.get("trabajos")
+        for nombre, segundos in gestor.tiempos_carga().items():
+            st.sidebar.caption(f"Modelo {nombre} cargado en {segundos:.2f} s")
+        if gestor.precargando():
+            st.sidebar.caption("Cargando el modelo en los procesos de trabajos...")
 
     # Página 1: Cargar y mostrar imagen DICOM o JPG
     if menu_seleccionado == "SCYCLE-GAN":
@@ -94,39 +952,76 @@ def main():
         
         # Selección de tipo de imagen
         tipo_imagen = st.radio("Selecciona el tipo de imagen", ("Imagen de Ultrasonido", "Imagen de Tomografía Computarizada"))
+        # El tipo de imagen elegido es el dominio de destino de la traducción
+        direccion = "ct2us" if tipo_imagen == "Imagen de Ultrasonido" else "us2ct"
     
         st.header("Cargar Imagen (DICOM o JPG) y Predicción")
+
+        # Las traducciones se ejecutan en el pool de trabajos, fuera de la sesión
+        try:
+            gestor = registry.get("trabajos")
+        except Exception as error:
+            st.error(f"No se pudo iniciar el servicio de traducción: {error}")
+            gestor = None
+
+        # Ventana aplicada a las imágenes DICOM antes de la traducción
+        ventana = st.selectbox("Ventana (DICOM)", list(Preprocesador.ventanas) + ["Del archivo", "Mín-máx"],
+                               help="Las ventanas en HU solo se aplican a CT; las demás modalidades se "
+                                    "normalizan entre su mínimo y su máximo.")
+        # Por teselas la imagen se traduce sin reducirla a la resolución del generador
+        teselado = st.checkbox("Traducir a resolución completa (inferencia por teselas)")
+        preprocesador = Preprocesador(
+            None if teselado else IA_Modelo.tamano_entrada, IA_Modelo.canales_entrada, ventana
+        )
         
         uploaded_file = st.file_uploader("Elige un archivo DICOM o JPG", type=["dcm", "jpg", "jpeg"])
         if uploaded_file is not None:
             dicom_processor.cargar_archivo(uploaded_file)
             dicom_processor.mostrar_imagen()
     
-            # Cargar el modelo y hacer predicción
-            modelo_ia = IA_Modelo("modelo_entrenado.pkl")
-            imagen = dicom_processor.obtener_imagen()
+            # La predicción se envía como trabajo; el resultado aparece en "Trabajos"
+            imagen = dicom_processor.obtener_tensor(preprocesador)
     
-            if st.button("Realizar Predicción"):
-                prediccion = modelo_ia.predecir(imagen)
-                if prediccion is not None:
-                    #st.write(f"Resultado de la predicción: {prediccion}")
+            if gestor is not None and st.button("Realizar Predicción"):
+                if imagen is not None:
+                    enviar_trabajo(gestor.enviar_imagen, imagen, direccion, ventana, teselado)
+                else:
+                    st.warning("No se ha proporcionado una imagen válida para predecir.")
 
-                    st.image(prediccion, caption="Resultado de la Predicción")
+        st.header("Cargar Serie de CT (ZIP con archivos DICOM)")
 
-                    # Guardar la imagen con el formato especificado
-                    prediccion_img = Image.fromarray(prediccion)
-                    buffer = io.BytesIO()
-                    nombre_archivo = f"{nombre_paciente}_{dni_paciente}_{fecha_examen}.jpg"
-                    prediccion_img.save(buffer, format="JPEG")
-                    buffer.seek(0)
-    
-                    # Botón para descargar la imagen
-                    st.download_button(
-                        label="Descargar Imagen",
-                        data=buffer,
-                        file_name=nombre_archivo,
-                        mime="image/jpeg"
-                    )
+        archivo_serie = st.file_uploader("Elige un ZIP con los cortes de la serie", type=["zip"])
+        # La serie anterior se libera en cuanto cambia o se quita el archivo
+        id_serie = None if archivo_serie is None else (
+            archivo_serie.name, getattr(archivo_serie, "file_id", None), archivo_serie.size)
+        if st.session_state.get("id_serie") != id_serie and "serie" in st.session_state:
+            st.session_state.pop("serie").cerrar()
+            st.session_state.pop("id_serie", None)
+        if archivo_serie is not None and "serie" not in st.session_state:
+            # La serie se indexa una sola vez por archivo y se guarda en la sesión
+            try:
+                st.session_state.serie = SerieDicom(archivo_serie)
+                st.session_state.id_serie = id_serie
+            except (ValueError, zipfile.BadZipFile) as error:
+                st.error(f"No se pudo abrir la serie: {error}")
+        if archivo_serie is not None and "serie" in st.session_state:
+            serie = st.session_state.serie
+
+            st.write(f"Serie con {serie.forma[0]} cortes de {serie.forma[1]} x {serie.forma[2]} píxeles.")
+            indice = st.slider("Corte", 0, len(serie) - 1, len(serie) // 2)
+            st.image(dicom_processor.para_mostrar(serie.corte(indice)), caption=f"Corte {indice}", use_container_width=True)
+
+            # Las series se traducen a la resolución del generador, en lotes de cortes, en un trabajo
+            if gestor is not None and st.button("Traducir Serie"):
+                enviar_trabajo(gestor.enviar_serie, archivo_serie, direccion, ventana)
+
+        st.header("Trabajos")
+        if gestor is not None:
+            # Un trabajo de otra sesión (u otro navegador) se recupera con su identificador
+            id_recuperar = st.text_input("Recuperar trabajo por identificador")
+            if id_recuperar and gestor.estado(id_recuperar.strip()) is not None:
+                agregar_trabajo(id_recuperar.strip())
+            mostrar_trabajos(gestor, f"{nombre_paciente}_{dni_paciente}_{fecha_examen}")
 
     # Página 2: Personalizar (vacía)
     elif menu_seleccionado == "ACPIS":
@@ -1,149 +1,1955 @@
 import mediapipe as mp
 import streamlit as st
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
 import tempfile
+import threading
+import time
+from fractions import Fraction
+from urllib.parse import urlsplit
+import queue
+from collections import deque
 import av
+import cv2
+from contextlib import contextmanager, nullcontext
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+from model_registry import registry
+
+# Pares de landmarks unidos por un hueso, como arreglo (huesos, 2). Sin mp.solutions salen de
+# la API de tareas (son las mismas 35 conexiones).
+def pose_connection_pairs():
+    solutions = getattr(mp, 'solutions', None)
+    if solutions is not None:
+        pairs = solutions.pose.POSE_CONNECTIONS
+    else:
+        pairs = [(c.start, c.end) for c in mp.tasks.vision.PoseLandmarksConnections.POSE_LANDMARKS]
+    return np.array(sorted(pairs), dtype=np.intp).reshape(-1, 2)
 
 # Clase encargada de la detección del centro de masa
 class CenterOfMassDetector:
-    def __init__(self):
-        self.mp_pose = mp.solutions.pose
-        self.mp_drawing = mp.solutions.drawing_utils
+    # Relación de masas por segmentos del cuerpo (valores aproximados)
+    segment_mass_ratios = {
+        'head': 0.08,
+        'torso': 0.5,
+        'upper_arm': 0.03,
+        'lower_arm': 0.02,
+        'thigh': 0.1,
+        'lower_leg': 0.05,
+        'foot':0.005,
+        'hand':0.005
+    }
+
+    # Segmentos corporales: (tipo de segmento, landmarks cuyo promedio es el centro del segmento)
+    segments = [
+        ('head', [0]),                       # Nose
+        ('torso', [12, 11, 24, 23]),         # Hombros y caderas
+        ('upper_arm', [12, 14]),             # Brazo derecho
+        ('lower_arm', [14, 16]),             # Antebrazo derecho
+        ('upper_arm', [11, 13]),             # Brazo izquierdo
+        ('lower_arm', [13, 15]),             # Antebrazo izquierdo
+        ('thigh', [23, 25]),                 # Muslo derecho
+        ('lower_leg', [25, 27]),             # Pierna derecha
+        ('thigh', [24, 26]),                 # Muslo izquierdo
+        ('lower_leg', [26, 28]),             # Pierna izquierda
+        ('hand', [19, 20, 21]),              # Mano derecha (sin el pulgar)
+        ('hand', [22, 23, 24]),              # Mano izquierda
+        ('foot', [27, 28, 29]),              # Pie derecho
+        ('foot', [30, 31, 32])               # Pie izquierdo
+    ]
+
+    num_landmarks = 33
+
+    # Colores (RGB) de los esqueletos en el modo de varias personas, por ID
+    person_colors = [(0, 255, 0), (255, 255, 0), (0, 255, 255), (255, 0, 255), (255, 128, 0), (128, 128, 255)]
+
+    # Tamaño de las colas entre etapas del pipeline de video
+    queue_size = 8
+
+    # Huesos del esqueleto (huesos, 2), calculados una sola vez para todos los frames
+    pose_connections = pose_connection_pairs()
+
+    # Parámetros de MediaPipe Pose
+    pose_options = {
+        'min_detection_confidence': 0.65,
+        'min_tracking_confidence': 0.65
+    }
 
-    # Función para calcular el baricentro de un grupo de puntos
-    def centroid(self, points):
-        x = np.mean([p[0] for p in points])
-        y = np.mean([p[1] for p in points])
-        z = np.mean([p[2] for p in points])
-        return [x, y, z]
+    def __init__(self, cache=None, metrics=None):
+        # mp.solutions (Pose y draw_landmarks) no existe en MediaPipe posterior a 0.10.21; sin él
+        # el esqueleto se dibuja con OpenCV (draw_skeleton) y el análisis informa el error de Pose
+        solutions = getattr(mp, 'solutions', None)
+        self.mp_pose = solutions.pose if solutions is not None else None
+        self.mp_drawing = solutions.drawing_utils if solutions is not None else None
+        # Métricas por etapa (desactivadas por defecto; se activan desde el panel de diagnóstico)
+        self.metrics = metrics or PipelineMetrics()
 
-    # Función para calcular el centro de un segmento
-    def segment_center(self, point1, point2):
-        return [(point1[0] + point2[0]) / 2, (point1[1] + point2[1]) / 2, (point1[2] + point2[2]) / 2]
+        # Matriz (segmentos x landmarks) y pesos por landmark, precalculados una sola vez
+        self.segment_matrix = self.build_segment_matrix()
+        self.landmark_weights = self.build_landmark_weights(self.segment_matrix)
+
+        # Caché en disco de landmarks por video (None para desactivarla)
+        self.cache = cache
+
+    # Construye la matriz que convierte los 33 landmarks en los centros de cada segmento
+    def build_segment_matrix(self):
+        matrix = np.zeros((len(self.segments), self.num_landmarks), dtype=np.float64)
+        for row, (_, indices) in enumerate(self.segments):
+            matrix[row, indices] = 1.0 / len(indices)
+        return matrix
+
+    # Combina la matriz de segmentos con las masas relativas: CM = pesos @ landmarks
+    def build_landmark_weights(self, segment_matrix):
+        masses = np.array([self.segment_mass_ratios[name] for name, _ in self.segments], dtype=np.float64)
+        return masses @ segment_matrix / masses.sum()
+
+    # Convierte los landmarks de MediaPipe en un arreglo (33, 3)
+    def landmarks_to_array(self, landmarks):
+        return np.array([[landmark.x, landmark.y, landmark.z] for landmark in landmarks], dtype=np.float64)
+
+    # Centro de masa para un clip completo: landmarks (frames, 33, 3) -> (frames, 3)
+    # El peso de la persona escala todas las masas por igual y se cancela al normalizar,
+    # por lo que no es necesario para el cálculo vectorizado.
+    def calculate_center_of_mass_batch(self, landmarks_array):
+        landmarks_array = np.asarray(landmarks_array, dtype=np.float64)
+        if landmarks_array.shape[-2:] != (self.num_landmarks, 3):
+            raise ValueError(
+                f"Se esperaban landmarks con forma (..., {self.num_landmarks}, 3), se recibió {landmarks_array.shape}"
+            )
+        return np.matmul(self.landmark_weights, landmarks_array)
 
     # Función para calcular el centro de masa (CM)
     def calculate_center_of_mass(self, landmarks, peso_persona):
-        # Relación de masas por segmentos del cuerpo (valores aproximados)
-        segment_mass_ratios = {
-            'head': 0.08,
-            'torso': 0.5,
-            'upper_arm': 0.03,
-            'lower_arm': 0.02,
-            'thigh': 0.1,
-            'lower_leg': 0.05,
-            'foot':0.005,
-            'hand':0.005
-        }
+        if not isinstance(landmarks, np.ndarray):
+            landmarks = self.landmarks_to_array(landmarks)
+        cm_x, cm_y, cm_z = self.calculate_center_of_mass_batch(landmarks)
+        return float(cm_x), float(cm_y), float(cm_z)
 
-        # Extraer las coordenadas relevantes de los landmarks
-        landmarks_3d = [[landmark.x, landmark.y, landmark.z] for landmark in landmarks]
+    # Instancia de MediaPipe Pose para un video. Los grafos se cargan una vez por proceso y se
+    # reutilizan desde el registro; cada video usa una en exclusiva, con el tracking reiniciado.
+    @contextmanager
+    def pose_session(self):
+        with registry.acquire('mediapipe-pose') as pose:
+            pose.reset()
+            yield pose
 
-        # Baricentro del torso
-        torso_points = [
-            landmarks_3d[12],  # Right Shoulder
-            landmarks_3d[11],  # Left Shoulder
-            landmarks_3d[24],  # Right Hip
-            landmarks_3d[23]   # Left Hip
-        ]
-        torso_center = self.centroid(torso_points)
-
-        # Centros de muslos y pantorrillas
-        thigh_right_center = self.segment_center(landmarks_3d[23], landmarks_3d[25])
-        lower_leg_right_center = self.segment_center(landmarks_3d[25], landmarks_3d[27])
-        thigh_left_center = self.segment_center(landmarks_3d[24], landmarks_3d[26])
-        lower_leg_left_center = self.segment_center(landmarks_3d[26], landmarks_3d[28])
-
-        # Centros de brazos
-        upper_arm_right_center = self.segment_center(landmarks_3d[12], landmarks_3d[14])
-        lower_arm_right_center = self.segment_center(landmarks_3d[14], landmarks_3d[16])
-        upper_arm_left_center = self.segment_center(landmarks_3d[11], landmarks_3d[13])
-        lower_arm_left_center = self.segment_center(landmarks_3d[13], landmarks_3d[15])
-
-        # Centro de la cabeza
-        head_center = landmarks_3d[0]  # Nose
-
-        # Baricentro de manos (sin el pulgar) y pies
-        hand_right_points = [landmarks_3d[19], landmarks_3d[20], landmarks_3d[21]]
-        hand_left_points = [landmarks_3d[22], landmarks_3d[23], landmarks_3d[24]]
-        foot_right_points = [landmarks_3d[27], landmarks_3d[28], landmarks_3d[29]]
-        foot_left_points = [landmarks_3d[30], landmarks_3d[31], landmarks_3d[32]]
-
-        hand_right_center = self.centroid(hand_right_points)
-        hand_left_center = self.centroid(hand_left_points)
-        foot_right_center = self.centroid(foot_right_points)
-        foot_left_center = self.centroid(foot_left_points)
-
-        # Centros y masas de los segmentos corporales
-        segment_centers = [
-            (head_center, segment_mass_ratios['head'] * peso_persona),
-            (torso_center, segment_mass_ratios['torso'] * peso_persona),
-            (upper_arm_right_center, segment_mass_ratios['upper_arm'] * peso_persona),
-            (lower_arm_right_center, segment_mass_ratios['lower_arm'] * peso_persona),
-            (upper_arm_left_center, segment_mass_ratios['upper_arm'] * peso_persona),
-            (lower_arm_left_center, segment_mass_ratios['lower_arm'] * peso_persona),
-            (thigh_right_center, segment_mass_ratios['thigh'] * peso_persona),
-            (lower_leg_right_center, segment_mass_ratios['lower_leg'] * peso_persona),
-            (thigh_left_center, segment_mass_ratios['thigh'] * peso_persona),
-            (lower_leg_left_center, segment_mass_ratios['lower_leg'] * peso_persona),
-            (hand_right_center, segment_mass_ratios['hand'] * peso_persona),
-            (hand_left_center, segment_mass_ratios['hand'] * peso_persona),
-            (foot_right_center, segment_mass_ratios['foot'] * peso_persona),
-            (foot_left_center, segment_mass_ratios['foot'] * peso_persona)
-        ]
+    # PoseLandmarker para varias personas, desde el mismo pool de instancias por proceso
+    @contextmanager
+    def people_session(self):
+        with registry.acquire('mediapipe-pose-landmarker') as landmarker:
+            landmarker.reset()
+            yield landmarker
+
+    # Abre un video desde una ruta o un objeto tipo archivo (p. ej. el UploadedFile de Streamlit).
+    # PyAV lee del buffer a medida que decodifica, por lo que no hace falta una copia previa.
+    def open_video(self, source):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return av.open(source)
+
+    # Entrega una ruta local al video. Los objetos tipo archivo se copian por bloques a un
+    # archivo temporal que se elimina al salir del bloque with, incluso si ocurre un error.
+    @contextmanager
+    def video_path(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            yield os.fspath(source)
+            return
+
+        suffix = os.path.splitext(getattr(source, 'name', '') or '')[1]
+        tfile = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        try:
+            with tfile:
+                source.seek(0)
+                shutil.copyfileobj(source, tfile)
+            yield tfile.name
+        finally:
+            os.remove(tfile.name)
+
+    # Decodifica el video y entrega, para cada frame seleccionado por el modo de procesamiento,
+    # la imagen a resolución completa y la imagen (posiblemente reducida) para la inferencia.
+    # Se decodifican todos los frames (sin skip_frame de FFmpeg): así el índice y el timestamp
+    # que recibe el modo corresponden a los frames del video y el muestreo queda uniforme.
+    def decode_frames(self, video, mode):
+        stream = video.streams.video[0]
+        # Decodificación multihilo dentro de FFmpeg
+        stream.thread_type = "AUTO"
+        mode.set_source_fps(float(stream.average_rate or stream.guessed_rate or 0))
+
+        for index, frame in enumerate(self.metrics.timed('decode', video.decode(stream))):
+            self.metrics.count('frames_decoded')
+            frame_time = self.frame_timestamp(frame, stream, index)
+            if not mode.should_process(index, frame_time):
+                self.metrics.count('frames_skipped')
+                continue
+
+            image = self.frame_to_array(frame)
+            size = mode.inference_size(frame.width, frame.height)
+            yield frame_time, image, image if size is None else self.frame_to_array(frame, size)
+
+    # Tiempo del frame en segundos. Algunos contenedores no le asignan time_base al frame
+    # (frame.time es None): se usa el pts con la base del stream y, sin pts, el índice del frame
+    # y la frecuencia media. Los timestamps ordenan y unen los fragmentos, así que nunca son None.
+    def frame_timestamp(self, frame, stream, index):
+        if frame.time is not None:
+            return frame.time
+        if frame.pts is not None and stream.time_base:
+            return float(frame.pts * stream.time_base)
+        return index / float(stream.average_rate or 30)
+
+    # Convierte un frame de PyAV a un array RGB. to_ndarray devuelve una vista sobre el plano
+    # del frame convertido, sin pasar por PIL ni hacer copias adicionales.
+    def frame_to_array(self, frame, size=None):
+        with self.metrics.measure('convert'):
+            if size is not None:
+                width, height = size
+                return frame.reformat(width=width, height=height, format="rgb24").to_ndarray()
+            return frame.to_ndarray(format="rgb24")
+
+    # Detecta la pose sobre la imagen de inferencia. MediaPipe devuelve coordenadas normalizadas
+    # (0 a 1), por lo que los landmarks ya son válidos para la imagen a resolución completa.
+    # Los frames en los que el tracker no ejecuta la detección se completan por interpolación;
+    # el tracker entrega los frames (en orden) cuando sus landmarks están disponibles.
+    def detect_pose(self, pose, tracker, frame_time, image, inference_image, mode):
+        if not tracker.detection_due():
+            self.metrics.count('frames_interpolated')
+            return tracker.push(frame_time, image)
+
+        start = time.perf_counter()
+        results = pose.process(inference_image)
+        elapsed = time.perf_counter() - start
+        mode.record_latency(elapsed)
+        self.metrics.observe('pose', elapsed)
+        self.metrics.count('detections')
+        if results.pose_landmarks:
+            self.metrics.count('poses_detected')
+            landmarks = self.landmarks_to_array(results.pose_landmarks.landmark)
+        else:
+            landmarks = np.full((self.num_landmarks, 3), np.nan)
+        return tracker.push(frame_time, image, landmarks)
+
+    # Calcula el CM de cada frame con pose detectada. El esqueleto y el CM solo se dibujan
+    # cuando la vista previa necesita un frame nuevo, para no gastar tiempo en frames que no se muestran.
+    # Si se exporta el video (encode=True), se dibujan todos los frames y se envían al codificador.
+    # Los landmarks de cada frame (NaN si no hay pose) se acumulan en track, y el CM en kinematics.
+    def render_frame(self, frame_time, image, landmarks, peso_persona, preview, track, encode=False, kinematics=None):
+        preview.advance(frame_time)
+        track.append((frame_time, landmarks))
+        self.metrics.count('frames_rendered')
+        if np.isnan(landmarks[0, 0]):
+            if kinematics is not None:
+                kinematics.gap()
+            return [(frame_time, image)] if encode else []
+
+        # Calcular el centro de masa
+        with self.metrics.measure('cm'):
+            cm_x, cm_y, cm_z = self.calculate_center_of_mass(landmarks, peso_persona)
+        if kinematics is not None:
+            kinematics.update(frame_time, (cm_x, cm_y, cm_z))
+
+        due = preview.due()
+        if due or encode:
+            # Dibujar el esqueleto y el centro de masa en la imagen
+            with self.metrics.measure('draw_landmarks'):
+                self.draw_skeleton(image, landmarks)
+            with self.metrics.measure('annotate'):
+                self.draw_center_of_mass(image, cm_x, cm_y, cm_z)
+        if due:
+            self.metrics.count('preview_frames_drawn')
+            preview.put(image)
+        return [(frame_time, image)] if encode else []
 
-        # Calcular el centro de masa en los ejes X, Y y Z
-        total_mass = sum(mass for _, mass in segment_centers)
-        cm_x = sum(center[0] * mass for center, mass in segment_centers) / total_mass
-        cm_y = sum(center[1] * mass for center, mass in segment_centers) / total_mass
-        cm_z = sum(center[2] * mass for center, mass in segment_centers) / total_mass
+    # Esqueleto con draw_landmarks de MediaPipe; si esta versión no lo trae, con OpenCV y los
+    # mismos colores (conexiones grises, landmarks en el tercer canal)
+    def draw_skeleton(self, image, landmarks):
+        if self.mp_drawing is not None:
+            self.mp_drawing.draw_landmarks(image, self.landmarks_to_proto(landmarks), self.mp_pose.POSE_CONNECTIONS)
+            return
+        height, width = image.shape[:2]
+        points = np.round(landmarks[:, :2] * (width, height)).astype(np.int32)
+        cv2.polylines(image, list(np.ascontiguousarray(points[self.pose_connections])), False,
+                      (224, 224, 224), 2, cv2.LINE_AA)
+        for x, y in points.tolist():
+            cv2.circle(image, (x, y), 2, (0, 0, 255), 2)
 
-        return cm_x, cm_y, cm_z
+    # Landmarks (33, 3) -> lista de landmarks de MediaPipe, para dibujar el esqueleto con
+    # draw_landmarks también en los frames interpolados o suavizados. landmark_pb2 se importa
+    # aquí: solo existe en las versiones de MediaPipe que traen mp.solutions.
+    def landmarks_to_proto(self, landmarks):
+        from mediapipe.framework.formats import landmark_pb2
 
-    # Procesa el video y detecta el esqueleto junto con el centro de masa
-    def process_video(self, uploaded_file, peso_persona):
-        # Crear un archivo temporal para almacenar el video
-        tfile = tempfile.NamedTemporaryFile(delete=False)
-        tfile.write(uploaded_file.read())
+        proto = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z in landmarks.tolist():
+            proto.landmark.add(x=x, y=y, z=z)
+        return proto
 
-        # Abre el video usando av
-        video = av.open(tfile.name)
+    # Dibuja el punto rojo del CM y sus coordenadas directamente sobre el array
+    # (igual que draw_landmarks de MediaPipe, que también dibuja con OpenCV en el mismo buffer)
+    def draw_center_of_mass(self, image, cm_x, cm_y, cm_z):
+        height, width, _ = image.shape
+        cm_x_px = int(cm_x * width)
+        cm_y_px = int(cm_y * height)
+        cv2.circle(image, (cm_x_px, cm_y_px), 5, (255, 0, 0), thickness=-1)
+
+        # Dibujar las coordenadas X, Y, Z junto al punto rojo
+        text = f"X: {cm_x:.2f}, Y: {cm_y:.2f}, Z: {cm_z:.2f}"
+        cv2.putText(image, text, (cm_x_px + 10, cm_y_px - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+
+    # Duración del video en segundos (None si el contenedor no la informa)
+    def video_duration(self, video):
+        stream = video.streams.video[0]
+        if stream.duration is not None:
+            return float(stream.duration * stream.time_base)
+        if video.duration is not None:
+            return video.duration / av.time_base
+        return None
+
+    # Procesa el video y detecta el esqueleto junto con el centro de masa.
+    # La vista previa está desacoplada del análisis: se muestra solo el último frame dibujado,
+    # a lo sumo preview_fps veces por segundo, mientras el pipeline avanza a su propio ritmo.
+    # Devuelve los timestamps, landmarks y CM de cada frame analizado; con export_preset se
+    # codifica además el video anotado y sus bytes (MP4) se devuelven en result['video'].
+    # Si los landmarks de este video y configuración ya están en la caché, no se vuelve a
+    # ejecutar MediaPipe: solo se recalcula el CM.
+    def process_video(self, uploaded_file, peso_persona, mode=None, preview_fps=10, export_preset=None):
+        mode = mode or ProcessingMode()
+
+        cache_key = self.cache_key(uploaded_file, mode)
+        if cache_key is not None and not export_preset:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return self.merge_chunks([cached])
+
+        preview = PreviewSlot(preview_fps)
+        track = []
+        kinematics = CMKinematics()
+
+        # Abre el video usando av directamente sobre el archivo subido (sin copiarlo a disco)
+        with self.open_video(uploaded_file) as video, self.pose_session() as pose:
+            tracker = PoseTracker(mode.pose_interval, mode.smoothing, self.num_landmarks)
+            encoder = self.run_video_pipeline(
+                video, mode, preview, export_preset,
+                detect=lambda item: self.detect_pose(pose, tracker, *item, mode), flush=tracker.flush,
+                render=lambda item, encode: self.render_frame(*item, peso_persona, preview, track, encode, kinematics),
+                kinematics=kinematics
+            )
+
+        result = self.merge_chunks([self.track_to_arrays(track)])
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return self.finish_video(result, encoder)
+
+    # Pipeline común al análisis de una y de varias personas: decodificación -> detección ->
+    # CM y dibujo (-> codificador), cada etapa en su propio hilo, mientras este hilo muestra la
+    # vista previa. detect y flush son los de la etapa de detección; render(item, encode) devuelve
+    # los frames a codificar. Devuelve el codificador (o None) para completar el video al final.
+    def run_video_pipeline(self, video, mode, preview, export_preset, detect, flush, render, kinematics=None):
+        stframe = st.empty()
+        progress = st.progress(0.0)
+        duration = self.video_duration(video)
+
+        pipeline = VideoPipeline(self.queue_size)
+        frames = pipeline.source(lambda: self.decode_frames(video, mode))
+        detections = pipeline.stage(frames, detect, flush=flush)
+        encoder = VideoEncoder(export_preset) if export_preset else None
+        if encoder is None:
+            pipeline.sink(detections, lambda item: render(item, False))
+        else:
+            # El codificador es una etapa más, en su propio hilo
+            rendered = pipeline.stage(detections, lambda item: render(item, True))
+            pipeline.sink(rendered, lambda item: self.encode_frame(encoder, *item))
+
+        # Mostrar la imagen anotada a medida que avanza el análisis
+        try:
+            for _ in pipeline.run(preview.interval):
+                self.show_preview(stframe, progress, preview, duration, kinematics)
+        except BaseException:
+            if encoder is not None:
+                encoder.discard()
+            raise
+        self.show_preview(stframe, progress, preview, duration, kinematics)
+        progress.progress(1.0, text=f"{preview.frames} frames procesados")
+        return encoder
+
+    # Cierre común de un análisis: el vaciado del codificador no es un frame, va en su propia etapa
+    def finish_video(self, result, encoder):
+        if encoder is not None:
+            with self.metrics.measure('encode_flush'):
+                result['video'] = encoder.finish()
+        self.metrics.count('videos')
+        self.metrics.finish_run()
+        return result
+
+    def encode_frame(self, encoder, frame_time, image):
+        with self.metrics.measure('encode'):
+            encoder.encode(frame_time, image)
+
+    # Análisis en tiempo real de una fuente en vivo. Siempre se procesa el frame más reciente
+    # (los que llegan mientras se analiza otro se descartan) y se mide la latencia desde que el
+    # frame estuvo disponible hasta que su CM está calculado. Con mode.latency_budget, la
+    # resolución de la detección se ajusta para mantener esa latencia dentro del presupuesto.
+    # La pose se detecta en todos los frames procesados: interpolar agregaría retraso.
+    def process_live(self, source, peso_persona, mode=None, preview_fps=15, max_seconds=None, replay=False):
+        mode = mode or ProcessingMode(latency_budget=0.1)
+        smoothing = LandmarkFilter() if mode.smoothing else None
         stframe = st.empty()
+        status = st.empty()
+        preview = PreviewSlot(preview_fps)
+        track = []
+        latencies = []
+        kinematics = CMKinematics()
+
+        live = LiveSource(source, replay)
+        started = time.monotonic()
+        try:
+            with self.pose_session() as pose:
+                while max_seconds is None or time.monotonic() - started < max_seconds:
+                    item = live.read()
+                    if item is None:
+                        if live.finished():
+                            break
+                        continue
+                    captured, frame = item
+
+                    image = self.frame_to_array(frame)
+                    size = mode.inference_size(frame.width, frame.height)
+                    inference_image = image if size is None else self.frame_to_array(frame, size)
+                    with self.metrics.measure('pose'):
+                        results = pose.process(inference_image)
+                    self.metrics.count('detections')
+                    if results.pose_landmarks:
+                        self.metrics.count('poses_detected')
+                        landmarks = self.landmarks_to_array(results.pose_landmarks.landmark)
+                    else:
+                        landmarks = np.full((self.num_landmarks, 3), np.nan)
+                    frame_time = captured - started
+                    if smoothing is not None:
+                        landmarks = smoothing.filter(frame_time, landmarks)
+                    self.render_frame(frame_time, image, landmarks, peso_persona, preview, track, kinematics=kinematics)
+
+                    latency = time.monotonic() - captured
+                    latencies.append(latency)
+                    mode.record_latency(latency)
+                    self.metrics.observe('glass_to_cm', latency)
+                    width = size[0] if size is not None else frame.width
+                    self.show_live_status(stframe, status, preview, latencies, live.slot.dropped, width, kinematics)
+        finally:
+            live.close()
+            self.metrics.count('live_frames_dropped', live.slot.dropped)
+            self.metrics.finish_run()
+
+        result = self.merge_chunks([self.track_to_arrays(track)])
+        result['latency'] = np.array(latencies, dtype=np.float64)
+        result['dropped'] = live.slot.dropped
+        return result
+
+    # Vista previa y estadísticas de latencia del modo en vivo
+    def show_live_status(self, stframe, status, preview, latencies, dropped, width, kinematics=None):
+        self.metrics.sample_memory()
+        image = preview.take()
+        if image is None:
+            return
+        with self.metrics.measure('ui'):
+            stframe.image(image, use_container_width=True)
+        self.metrics.count('preview_frames_shown')
+        recent = np.array(latencies[-100:]) * 1000
+        status.caption(
+            f"Latencia p50 {np.percentile(recent, 50):.0f} ms · p95 {np.percentile(recent, 95):.0f} ms · "
+            f"{preview.frames} frames procesados · {dropped} descartados · detección a {width} px"
+            + (f"\n\n{kinematics.describe()}" if kinematics is not None and kinematics.size else "")
+        )
+
+    # Análisis de varias personas en una sola pasada: cada frame se decodifica una vez y pasa una
+    # vez por PoseLandmarker, que entrega hasta num_poses personas. PersonTracker les asigna IDs
+    # estables entre frames; el CM de todas se calcula en una sola operación y se dibujan todas
+    # en la misma pasada de anotación. Devuelve los timestamps, los IDs y, por frame y por ID,
+    # los landmarks (frames, personas, 33, 3) y el CM (frames, personas, 3), con NaN si la
+    # persona no aparece en el frame. El modo se aplica igual que con una persona: presupuesto de
+    # latencia, detección cada pose_interval frames y suavizado One-Euro (por ID).
+    def process_video_multi(self, uploaded_file, mode=None, preview_fps=10, export_preset=None):
+        mode = mode or ProcessingMode()
+        preview = PreviewSlot(preview_fps)
+        tracker = PersonTracker()
+        frames_tracker = MultiPoseTracker(mode.pose_interval, mode.smoothing, self.num_landmarks)
+        track = []
+
+        with self.open_video(uploaded_file) as video, self.people_session() as landmarker:
+            encoder = self.run_video_pipeline(
+                video, mode, preview, export_preset,
+                detect=lambda item: self.detect_people(landmarker, tracker, frames_tracker, *item, mode),
+                flush=frames_tracker.flush,
+                render=lambda item, encode: self.render_people(*item, preview, track, encode)
+            )
+
+        return self.finish_video(self.people_track_to_arrays(track), encoder)
+
+    # Detecta a todas las personas del frame y les asigna sus IDs. Los frames sin detección se
+    # completan por interpolación en frames_tracker, que los entrega en orden.
+    def detect_people(self, landmarker, tracker, frames_tracker, frame_time, image, inference_image, mode):
+        if not frames_tracker.detection_due():
+            self.metrics.count('frames_interpolated')
+            return frames_tracker.push(frame_time, image)
+
+        start = time.perf_counter()
+        landmarks = landmarker.process(inference_image, frame_time)
+        elapsed = time.perf_counter() - start
+        mode.record_latency(elapsed)
+        self.metrics.observe('pose', elapsed)
+        self.metrics.count('detections')
+        self.metrics.count('poses_detected', len(landmarks))
+        return frames_tracker.push(frame_time, image, tracker.update(landmarks), landmarks)
+
+    # CM de todas las personas del frame en una sola operación: (personas, 33, 3) -> (personas, 3)
+    def render_people(self, frame_time, image, ids, landmarks, preview, track, encode=False):
+        preview.advance(frame_time)
+        track.append((frame_time, ids, landmarks))
+        self.metrics.count('frames_rendered')
+        with self.metrics.measure('cm'):
+            cms = self.calculate_center_of_mass_batch(landmarks)
+
+        due = preview.due()
+        if len(ids) and (due or encode):
+            with self.metrics.measure('draw_landmarks'):
+                self.draw_people(image, ids, landmarks, cms)
+        if due:
+            self.metrics.count('preview_frames_drawn')
+            preview.put(image)
+        return [(frame_time, image)] if encode else []
+
+    # Esqueletos, CM e ID de todas las personas. Las coordenadas en píxeles de todos los huesos se
+    # calculan juntas y cada esqueleto se dibuja con una sola llamada a polylines.
+    def draw_people(self, image, ids, landmarks, cms):
+        height, width, _ = image.shape
+        scale = np.array([width, height], dtype=np.float64)
+        points = np.round(landmarks[..., :2] * scale).astype(np.int32)
+        bones = np.ascontiguousarray(points[:, self.pose_connections])
+        centers = np.round(cms[:, :2] * scale).astype(np.int32)
+        for person_id, person_bones, (cm_x, cm_y) in zip(ids, bones, centers):
+            color = self.person_colors[person_id % len(self.person_colors)]
+            cv2.polylines(image, list(person_bones), False, color, 2, cv2.LINE_AA)
+            cv2.circle(image, (int(cm_x), int(cm_y)), 6, (255, 0, 0), thickness=-1)
+            cv2.putText(image, f"ID {person_id}", (int(cm_x) + 10, int(cm_y) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        color, 1, cv2.LINE_AA)
+
+    # Convierte [(tiempo, ids, landmarks)] en arrays por ID y calcula el CM de todo el clip de una vez
+    def people_track_to_arrays(self, track):
+        ids = sorted({int(person_id) for _, frame_ids, _ in track for person_id in frame_ids})
+        columns = {person_id: column for column, person_id in enumerate(ids)}
+        landmarks = np.full((len(track), len(ids), self.num_landmarks, 3), np.nan)
+        for row, (_, frame_ids, frame_landmarks) in enumerate(track):
+            landmarks[row, [columns[int(person_id)] for person_id in frame_ids]] = frame_landmarks
+        return {
+            'timestamps': np.array([frame_time for frame_time, _, _ in track], dtype=np.float64),
+            'ids': np.array(ids, dtype=np.int64),
+            'landmarks': landmarks,
+            'cm': self.calculate_center_of_mass_batch(landmarks)
+        }
+
+    # Clave de la caché para el video y el modo de procesamiento (None si no se usa la caché)
+    # path distingue el análisis secuencial del repartido en fragmentos ('sharded'), que no
+    # conserva el estado del tracker entre fragmentos y por eso no da los mismos landmarks.
+    def cache_key(self, source, mode, path='sequential'):
+        settings = mode.cache_settings()
+        if self.cache is None or settings is None:
+            return None
+        return self.cache.key(self.content_digest(source), dict(settings, path=path, **self.pose_options))
+
+    # Hash del contenido del video. El de un archivo subido se guarda en la sesión (por file_id)
+    # para no volver a leer todo el archivo en cada ejecución del script.
+    def content_digest(self, source):
+        file_id = getattr(source, 'file_id', None)
+        if file_id is None:
+            return self.cache.digest(source)
+        cached = st.session_state.get('cm_video_digest')
+        if cached is None or cached[0] != file_id:
+            cached = st.session_state['cm_video_digest'] = (file_id, self.cache.digest(source))
+        return cached[1]
+
+    # Convierte la lista [(tiempo, landmarks)] acumulada por el pipeline en arrays
+    def track_to_arrays(self, track):
+        return {
+            'timestamps': np.array([frame_time for frame_time, _ in track], dtype=np.float64),
+            'landmarks': np.array([landmarks for _, landmarks in track], dtype=np.float64).reshape(
+                -1, self.num_landmarks, 3)
+        }
+
+    # Envía al navegador el último frame disponible y actualiza la barra de progreso
+    # Con kinematics, el texto incluye la velocidad del CM y los pasos detectados hasta el momento
+    def show_preview(self, stframe, progress, preview, duration, kinematics=None):
+        self.metrics.sample_memory()
+        image = preview.take()
+        if image is not None:
+            with self.metrics.measure('ui'):
+                stframe.image(image, use_container_width=True)
+            self.metrics.count('preview_frames_shown')
+        details = f" · {kinematics.describe()}" if kinematics is not None and kinematics.size else ""
+        if duration:
+            fraction = min(1.0, max(0.0, preview.position / duration))
+            progress.progress(fraction, text=f"{preview.position:.1f} s de {duration:.1f} s{details}")
+        else:
+            progress.progress(0.0, text=f"{preview.frames} frames procesados{details}")
+
+    # Lista los keyframes del video leyendo solo los paquetes (sin decodificar)
+    def find_keyframes(self, path):
+        with av.open(path) as video:
+            stream = video.streams.video[0]
+            keyframes = [packet.pts for packet in video.demux(stream)
+                         if packet.is_keyframe and packet.pts is not None]
+            return sorted(keyframes), float(stream.time_base)
+
+    # Divide el video en fragmentos que empiezan en keyframes. Cada fragmento se decodifica
+    # desde un keyframe anterior (solapamiento) para que el tracker se estabilice.
+    def plan_chunks(self, keyframes, time_base, num_chunks, overlap_seconds, min_chunk_seconds=10.0):
+        if not keyframes:
+            return [(None, None, None)]
 
-        with self.mp_pose.Pose(min_detection_confidence=0.65, min_tracking_confidence=0.65) as pose:
-            for frame in video.decode(video=0):
-                # Convertir el frame a un array de numpy
-                image = np.array(frame.to_image())
+        duration = (keyframes[-1] - keyframes[0]) * time_base
+        num_chunks = max(1, min(num_chunks, int(duration // min_chunk_seconds) or 1))
+        step = len(keyframes) / num_chunks
+        bounds = sorted({keyframes[int(i * step)] for i in range(num_chunks)})
 
-                # Procesa la imagen para detectar poses
-                results = pose.process(image)
+        chunks = []
+        for i, start in enumerate(bounds):
+            end = bounds[i + 1] if i + 1 < len(bounds) else None
+            if i == 0:
+                chunks.append((None, None, end))
+                continue
+            warmup_limit = start - overlap_seconds / time_base
+            warmup = max([k for k in keyframes if k <= warmup_limit], default=keyframes[0])
+            chunks.append((warmup, start, end))
+        return chunks
 
-                # Dibujar el esqueleto y el centro de masa en la imagen
+    # Analiza un fragmento [start, end) del video con su propia instancia de Pose.
+    # Devuelve los tiempos (s) y los landmarks (NaN cuando no se detecta pose).
+    def analyze_chunk(self, path, warmup=None, start=None, end=None):
+        timestamps = []
+        landmarks = []
+        with av.open(path) as video, self.pose_session() as pose:
+            stream = video.streams.video[0]
+            if warmup is not None:
+                video.seek(warmup, stream=stream, backward=True)
+
+            for index, frame in enumerate(video.decode(stream)):
+                if end is not None and frame.pts is not None and frame.pts >= end:
+                    break
+
+                results = pose.process(self.frame_to_array(frame))
+
+                # Los frames del solapamiento solo sirven para estabilizar el tracker
+                if start is not None and frame.pts is not None and frame.pts < start:
+                    continue
+
+                timestamps.append(self.frame_timestamp(frame, stream, index))
                 if results.pose_landmarks:
-                    landmarks = results.pose_landmarks.landmark
+                    landmarks.append(self.landmarks_to_array(results.pose_landmarks.landmark))
+                else:
+                    landmarks.append(np.full((self.num_landmarks, 3), np.nan))
+
+        return {
+            'timestamps': np.array(timestamps, dtype=np.float64),
+            'landmarks': np.array(landmarks, dtype=np.float64).reshape(-1, self.num_landmarks, 3)
+        }
+
+    # Une los resultados de los fragmentos en orden temporal y calcula el CM de todo el clip
+    def merge_chunks(self, parts):
+        timestamps = np.concatenate([part['timestamps'] for part in parts])
+        landmarks = np.concatenate([part['landmarks'] for part in parts])
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        landmarks = landmarks[order]
+
+        # Descarta frames repetidos en los bordes de los fragmentos
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[1:] = np.diff(timestamps) > 0
+        timestamps = timestamps[keep]
+        landmarks = landmarks[keep]
+
+        return {
+            'timestamps': timestamps,
+            'landmarks': landmarks,
+            'cm': self.calculate_center_of_mass_batch(landmarks)
+        }
+
+    # Análisis completo de un video en el proceso actual (sin vista previa)
+    def analyze_video(self, path):
+        return self.merge_chunks([self.analyze_chunk(path)])
+
+    # Análisis de videos largos: reparte fragmentos alineados a keyframes entre varios procesos
+    def analyze_video_sharded(self, path, workers=None, overlap_seconds=1.0):
+        workers = workers or os.cpu_count() or 1
+        keyframes, time_base = self.find_keyframes(path)
+        # Más fragmentos que procesos para equilibrar la carga
+        chunks = self.plan_chunks(keyframes, time_base, workers * 2, overlap_seconds)
+
+        if len(chunks) == 1 or workers == 1:
+            parts = [self.analyze_chunk(path, *chunk) for chunk in chunks]
+        else:
+            # "spawn": los procesos no heredan los grafos de MediaPipe (ni sus hilos) del proceso padre
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                parts = list(executor.map(_analyze_chunk, [path] * len(chunks), chunks))
+        return self.merge_chunks(parts)
+
+# Punto de entrada de los procesos del pool: cada proceso crea su propio detector y Pose
+def _analyze_chunk(path, chunk):
+    return CenterOfMassDetector().analyze_chunk(path, *chunk)
+
+# Modo de procesamiento: qué frames se analizan y a qué resolución se ejecuta la inferencia.
+# - target_fps: frecuencia de análisis según el timestamp de cada frame (None = todos)
+# - frame_step: analizar uno de cada N frames
+# - inference_width: ancho máximo de la imagen enviada a MediaPipe (None = resolución completa)
+# - latency_budget: segundos por inferencia; si se supera, se reduce la resolución y luego la frecuencia
+#   (sin target_fps, desde la frecuencia del video); con margen se recuperan en orden inverso
+# - pose_interval: ejecutar la detección en uno de cada N frames analizados e interpolar el resto
+# - smoothing: filtrar los landmarks en el tiempo (One-Euro) para reducir el temblor del CM
+class ProcessingMode:
+    def __init__(self, target_fps=None, frame_step=1, inference_width=None, latency_budget=None,
+                 min_width=192, min_fps=2.0, pose_interval=1, smoothing=False):
+        self.target_fps = target_fps
+        self.frame_step = max(1, int(frame_step))
+        self.inference_width = inference_width
+        self.latency_budget = latency_budget
+        self.pose_interval = max(1, int(pose_interval))
+        self.smoothing = smoothing
+        self.min_width = min_width
+        self.min_fps = min_fps
+        self.average_latency = None
+        self._next_time = None
+        self._full_width = None
+        # Frecuencia máxima de análisis: la pedida o, si no se indicó, la del video (set_source_fps)
+        self._max_fps = target_fps
+        # El hilo de decodificación lee el estado adaptativo y el de detección lo modifica
+        self.lock = threading.Lock()
+
+    # Parámetros que determinan los landmarks obtenidos (clave de la caché). El modo adaptativo
+    # depende de la carga de la máquina y no es reproducible, por lo que no se guarda en caché.
+    def cache_settings(self):
+        if self.latency_budget:
+            return None
+        return {
+            'target_fps': self.target_fps,
+            'frame_step': self.frame_step,
+            'inference_width': self.inference_width,
+            'pose_interval': self.pose_interval,
+            'smoothing': self.smoothing
+        }
+
+    # Frecuencia del video de origen. El modo adaptativo necesita una frecuencia de partida para
+    # poder reducirla: si no se indicó target_fps, es la de los frames que deja pasar frame_step.
+    def set_source_fps(self, fps):
+        with self.lock:
+            if fps and self._max_fps is None:
+                self._max_fps = fps / self.frame_step
+
+    # Decide si se analiza el frame, por índice y por timestamp
+    def should_process(self, index, frame_time):
+        if index % self.frame_step:
+            return False
+        with self.lock:
+            return self._should_process_time(frame_time)
+
+    def _should_process_time(self, frame_time):
+        if not self.target_fps or frame_time is None:
+            return True
+        # Tolerancia para el error de redondeo acumulado en la grilla (0.1 * 3 > 0.3)
+        if self._next_time is not None and frame_time < self._next_time - 1e-6:
+            return False
+        interval = 1.0 / self.target_fps
+        # Si el video salta hacia adelante, se reinicia la grilla de tiempos desde este frame
+        if self._next_time is None or frame_time - self._next_time >= interval:
+            self._next_time = frame_time + interval
+        else:
+            self._next_time += interval
+        return True
+
+    # Tamaño (ancho, alto) para la inferencia conservando la relación de aspecto;
+    # None si se usa la resolución original
+    def inference_size(self, width, height):
+        with self.lock:
+            self._full_width = width
+            inference_width = self.inference_width
+        if not inference_width or inference_width >= width:
+            return None
+        target_width = int(inference_width) & ~1
+        target_height = max(2, int(round(height * target_width / width)) & ~1)
+        return target_width, target_height
+
+    # Registra la latencia de una inferencia y, en modo adaptativo, ajusta la resolución
+    # o la frecuencia de análisis para mantenerse dentro del presupuesto
+    def record_latency(self, seconds):
+        with self.lock:
+            self._record_latency(seconds)
+
+    def _record_latency(self, seconds):
+        if self.average_latency is None:
+            self.average_latency = seconds
+        else:
+            self.average_latency = 0.8 * self.average_latency + 0.2 * seconds
+
+        if not self.latency_budget or self._full_width is None:
+            return
+
+        width = self.inference_width or self._full_width
+        fps = self.target_fps or self._max_fps
+        if self.average_latency > self.latency_budget:
+            if width > self.min_width:
+                self.inference_width = max(self.min_width, int(width * 0.75))
+            elif fps and fps > self.min_fps:
+                self.target_fps = max(self.min_fps, fps * 0.75)
+            # Se reinicia el promedio para medir el efecto del ajuste
+            self.average_latency = None
+        elif self.average_latency < 0.5 * self.latency_budget:
+            # Primero se recupera la frecuencia (lo último que se redujo) y después la resolución
+            if self.target_fps and self._max_fps and self.target_fps < self._max_fps:
+                self.target_fps = min(self._max_fps, self.target_fps * 1.25)
+            elif width < self._full_width:
+                self.inference_width = min(self._full_width, int(width * 1.25))
+            else:
+                return
+            self.average_latency = None
+
+# Filtro One-Euro sobre los 33 landmarks (x, y, z), vectorizado: cada coordenada tiene su propio
+# filtro pasa bajos cuya frecuencia de corte crece con la velocidad. En reposo filtra fuerte (sin
+# temblor) y en movimientos rápidos casi no agrega retraso. Como el CM es una combinación lineal
+# de los landmarks, suavizar los landmarks suaviza también la trayectoria del CM.
+class LandmarkFilter:
+    def __init__(self, min_cutoff=1.0, beta=10.0, derivative_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.derivative = None
+        self.last_time = None
+
+    # Factor de suavizado de un filtro exponencial con frecuencia de corte cutoff (Hz)
+    def alpha(self, cutoff, dt):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    # Filtra los landmarks de un frame. Sin pose (NaN) el filtro se reinicia.
+    def filter(self, frame_time, landmarks):
+        if np.isnan(landmarks).any():
+            self.reset()
+            return landmarks
+        if self.value is None or frame_time is None or self.last_time is None or frame_time <= self.last_time:
+            self.value = landmarks.copy()
+            self.derivative = np.zeros_like(landmarks)
+            self.last_time = frame_time
+            return self.value.copy()
+
+        dt = frame_time - self.last_time
+        self.last_time = frame_time
+        derivative = (landmarks - self.value) / dt
+        self.derivative += self.alpha(self.derivative_cutoff, dt) * (derivative - self.derivative)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.derivative)
+        self.value += self.alpha(cutoff, dt) * (landmarks - self.value)
+        return self.value.copy()
+
+# Estado de la detección entre frames. La pose completa se detecta en uno de cada pose_interval
+# frames; los frames intermedios se retienen hasta la siguiente detección y sus landmarks se
+# interpolan linealmente (en el tiempo) entre ambas. Con smoothing, todos los frames pasan por el
+# filtro One-Euro en orden. Se retienen a lo sumo pose_interval - 1 imágenes.
+class PoseTracker:
+    def __init__(self, pose_interval=1, smoothing=False, num_landmarks=33):
+        self.pose_interval = max(1, int(pose_interval))
+        self.filter = LandmarkFilter() if smoothing else None
+        self.num_landmarks = num_landmarks
+        self.pending = []
+        self.previous = None
+        self.count = 0
+
+    # Indica si en el próximo frame se ejecuta la detección completa
+    def detection_due(self):
+        return self.count % self.pose_interval == 0
+
+    # Agrega un frame; landmarks=None si no se ejecutó la detección. Devuelve los frames
+    # (tiempo, imagen, landmarks) que ya tienen landmarks, en orden.
+    def push(self, frame_time, image, landmarks=None):
+        self.count += 1
+        if landmarks is None:
+            self.pending.append((frame_time, image))
+            return []
+
+        ready = self.interpolate(frame_time, landmarks)
+        ready.append((frame_time, image, landmarks))
+        self.previous = (frame_time, landmarks)
+        return self.smooth(ready)
+
+    # Frames pendientes al final del video: se mantienen los landmarks de la última detección
+    def flush(self):
+        if self.previous is None:
+            held = np.full((self.num_landmarks, 3), np.nan)
+        else:
+            held = self.previous[1]
+        ready = [(frame_time, image, held) for frame_time, image in self.pending]
+        self.pending = []
+        return self.smooth(ready)
+
+    # Interpolación lineal de todos los frames pendientes en una sola operación. Si falta la pose
+    # en alguno de los extremos, el resultado es NaN (sin pose).
+    def interpolate(self, frame_time, landmarks):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        if self.previous is None:
+            start_time, start = None, np.full_like(landmarks, np.nan)
+        else:
+            start_time, start = self.previous
+
+        times = [pending_time for pending_time, _ in pending]
+        if None in times or start_time is None or frame_time is None or frame_time <= start_time:
+            weights = np.arange(1, len(pending) + 1) / (len(pending) + 1)
+        else:
+            weights = (np.array(times) - start_time) / (frame_time - start_time)
+        interpolated = start + weights[:, np.newaxis, np.newaxis] * (landmarks - start)
+        return [(pending_time, image, values) for (pending_time, image), values in zip(pending, interpolated)]
+
+    def smooth(self, ready):
+        if self.filter is None:
+            return ready
+        return [(frame_time, image, self.filter.filter(frame_time, landmarks)) for frame_time, image, landmarks in ready]
+
+# PoseLandmarker de MediaPipe Tasks: detecta hasta num_poses personas por frame. El modelo
+# (.task) se indica con CM_POSE_LANDMARKER_MODEL. En modo VIDEO cada instancia exige timestamps
+# crecientes, también entre videos, así que reset() continúa desde el último timestamp usado.
+class MultiPoseLandmarker:
+    def __init__(self, num_poses=4, model_path=None):
+        model_path = model_path or os.environ.get('CM_POSE_LANDMARKER_MODEL', 'pose_landmarker_full.task')
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(
+                f"No se encontró el modelo de PoseLandmarker '{model_path}'. Descarga pose_landmarker_full.task "
+                "de MediaPipe o indica su ruta con la variable de entorno CM_POSE_LANDMARKER_MODEL.")
+        vision = mp.tasks.vision
+        options = vision.PoseLandmarkerOptions(
+            base_options=mp.tasks.BaseOptions(model_asset_path=model_path),
+            running_mode=vision.RunningMode.VIDEO,
+            num_poses=num_poses,
+            min_pose_detection_confidence=CenterOfMassDetector.pose_options['min_detection_confidence'],
+            min_tracking_confidence=CenterOfMassDetector.pose_options['min_tracking_confidence']
+        )
+        self.landmarker = vision.PoseLandmarker.create_from_options(options)
+        self.num_poses = num_poses
+        self.last_timestamp = -1
+        self.offset = 0
+
+    def reset(self):
+        self.offset = self.last_timestamp + 1
+
+    # Landmarks de todas las personas del frame: (personas, 33, 3)
+    def process(self, image, frame_time):
+        timestamp = self.offset + int(round((frame_time or 0.0) * 1000))
+        timestamp = max(timestamp, self.last_timestamp + 1)
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(image))
+        result = self.landmarker.detect_for_video(image, timestamp)
+        self.last_timestamp = timestamp
+        return np.array([[(landmark.x, landmark.y, landmark.z) for landmark in pose]
+                         for pose in result.pose_landmarks], dtype=np.float64).reshape(-1, 33, 3)
+
+    def close(self):
+        self.landmarker.close()
+
+# IDs de personas consistentes entre frames. Cada persona se representa por el centro de su torso
+# (hombros y caderas), y su posición en el frame siguiente se predice con su velocidad, para no
+# intercambiar los IDs cuando dos personas se cruzan. Las detecciones de un frame se asignan a
+# las personas conocidas de menor a mayor distancia a la posición predicha (todas las distancias
+# se calculan en una sola operación). Una detección sin
+# persona cercana recibe un ID nuevo; una persona que no aparece en max_missed frames se olvida.
+class PersonTracker:
+    torso = [11, 12, 23, 24]
+
+    def __init__(self, max_distance=0.15, max_missed=15):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.next_id = 0
+        self.ids = []
+        self.centers = np.empty((0, 2))
+        self.velocities = np.empty((0, 2))
+        self.missed = []
+
+    # IDs (personas,) para los landmarks (personas, 33, 3) de un frame
+    def update(self, landmarks):
+        centers = landmarks[:, self.torso, :2].mean(axis=1)
+        ids = np.full(len(centers), -1, dtype=np.int64)
+        matched = set()
+
+        if self.ids and len(centers):
+            steps = np.array(self.missed, dtype=np.float64)[:, np.newaxis] + 1
+            predicted = self.centers + self.velocities * steps
+            distances = np.linalg.norm(predicted[:, np.newaxis] - centers[np.newaxis], axis=-1)
+            for flat in np.argsort(distances, axis=None):
+                known, detected = divmod(int(flat), distances.shape[1])
+                if distances[known, detected] > self.max_distance:
+                    break
+                if known in matched or ids[detected] >= 0:
+                    continue
+                ids[detected] = self.ids[known]
+                matched.add(known)
+
+        # Personas conocidas: se actualiza su posición o se cuenta un frame sin verlas
+        positions = {person_id: center for person_id, center in zip(ids, centers) if person_id >= 0}
+        kept_ids, kept_centers, kept_velocities, kept_missed = [], [], [], []
+        for known, person_id in enumerate(self.ids):
+            center, velocity = self.centers[known], self.velocities[known]
+            if known in matched:
+                # Velocidad suavizada, por frame
+                step = positions[person_id] - center
+                velocity = 0.5 * velocity + 0.5 * step / (self.missed[known] + 1)
+                center, missed = positions[person_id], 0
+            else:
+                missed = self.missed[known] + 1
+            if missed <= self.max_missed:
+                kept_ids.append(person_id)
+                kept_centers.append(center)
+                kept_velocities.append(velocity)
+                kept_missed.append(missed)
+
+        # Personas nuevas
+        for detected in np.flatnonzero(ids < 0):
+            ids[detected] = self.next_id
+            self.next_id += 1
+            kept_ids.append(int(ids[detected]))
+            kept_centers.append(centers[detected])
+            kept_velocities.append(np.zeros(2))
+            kept_missed.append(0)
+
+        self.ids = kept_ids
+        self.centers = np.array(kept_centers, dtype=np.float64).reshape(-1, 2)
+        self.velocities = np.array(kept_velocities, dtype=np.float64).reshape(-1, 2)
+        self.missed = kept_missed
+        return ids
 
-                    # Dibujar el esqueleto en la imagen
-                    self.mp_drawing.draw_landmarks(image, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+# Equivalente a PoseTracker para varias personas: detección cada pose_interval frames,
+# interpolación por ID de los frames intermedios (solo las personas presentes en las dos
+# detecciones que los rodean) y, con smoothing, un filtro One-Euro por ID. El filtro de una
+# persona se descarta en cuanto deja de aparecer en un frame.
+class MultiPoseTracker:
+    def __init__(self, pose_interval=1, smoothing=False, num_landmarks=33):
+        self.pose_interval = max(1, int(pose_interval))
+        self.smoothing = smoothing
+        self.num_landmarks = num_landmarks
+        self.filters = {}
+        self.pending = []
+        self.previous = None
+        self.count = 0
 
-                    # Calcular el centro de masa
-                    cm_x, cm_y, cm_z = self.calculate_center_of_mass(landmarks, peso_persona)
+    def detection_due(self):
+        return self.count % self.pose_interval == 0
 
-                    # Dibujar el centro de masa en la imagen
-                    height, width, _ = image.shape
-                    cm_x_px = int(cm_x * width)
-                    cm_y_px = int(cm_y * height)
+    # Agrega un frame; ids=None si no se ejecutó la detección. Devuelve los frames
+    # (tiempo, imagen, ids, landmarks) que ya tienen landmarks, en orden.
+    def push(self, frame_time, image, ids=None, landmarks=None):
+        self.count += 1
+        if ids is None:
+            self.pending.append((frame_time, image))
+            return []
 
-                    # Convertir la imagen a PIL para dibujar
-                    img_pil = Image.fromarray(image)
-                    draw = ImageDraw.Draw(img_pil)
-                    draw.ellipse((cm_x_px - 5, cm_y_px - 5, cm_x_px + 5, cm_y_px + 5), fill=(255, 0, 0))
+        ready = self.interpolate(frame_time, ids, landmarks)
+        ready.append((frame_time, image, ids, landmarks))
+        self.previous = (frame_time, ids, landmarks)
+        return self.smooth(ready)
 
-                    # Dibujar las coordenadas X, Y, Z junto al punto rojo
-                    text = f"X: {cm_x:.2f}, Y: {cm_y:.2f}, Z: {cm_z:.2f}"
-                    draw.text((cm_x_px + 10, cm_y_px - 10), text, fill=(255, 255, 255))
+    # Frames pendientes al final del video: se mantienen las personas de la última detección
+    def flush(self):
+        if self.previous is None:
+            ids, held = np.empty(0, dtype=np.int64), np.empty((0, self.num_landmarks, 3))
+        else:
+            _, ids, held = self.previous
+        ready = [(frame_time, image, ids, held) for frame_time, image in self.pending]
+        self.pending = []
+        return self.smooth(ready)
 
-                    # Mostrar la imagen con esqueleto, centro de masa y coordenadas
-                    stframe.image(img_pil, use_column_width=True)
+    # Interpolación lineal, por ID, de todos los frames pendientes en una sola operación
+    def interpolate(self, frame_time, ids, landmarks):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        if self.previous is None:
+            start_time, common = None, np.empty(0, dtype=np.int64)
+        else:
+            start_time, start_ids, start = self.previous
+            common = np.intersect1d(start_ids, ids)
+
+        times = [pending_time for pending_time, _ in pending]
+        if None in times or start_time is None or frame_time is None or frame_time <= start_time:
+            weights = np.arange(1, len(pending) + 1) / (len(pending) + 1)
+        else:
+            weights = (np.array(times) - start_time) / (frame_time - start_time)
+        if len(common):
+            start = start[[list(start_ids).index(person_id) for person_id in common]]
+            end = landmarks[[list(ids).index(person_id) for person_id in common]]
+            interpolated = start + weights[:, np.newaxis, np.newaxis, np.newaxis] * (end - start)
+        else:
+            interpolated = np.empty((len(pending), 0, self.num_landmarks, 3))
+        return [(pending_time, image, common, values) for (pending_time, image), values in zip(pending, interpolated)]
+
+    def smooth(self, ready):
+        if not self.smoothing:
+            return ready
+        smoothed = []
+        for frame_time, image, ids, landmarks in ready:
+            filters = {person_id: self.filters.get(person_id) or LandmarkFilter() for person_id in map(int, ids)}
+            self.filters = filters
+            values = np.array([filters[int(person_id)].filter(frame_time, person)
+                               for person_id, person in zip(ids, landmarks)]).reshape(landmarks.shape)
+            smoothed.append((frame_time, image, ids, values))
+        return smoothed
+
+# Cinemática del CM sobre un flujo de frames, con costo O(1) por frame. Guarda en un buffer
+# circular las últimas `capacity` muestras válidas y mantiene:
+# - velocidad y aceleración (diferencias hacia atrás entre frames consecutivos con pose)
+# - largo del recorrido en el plano de la imagen (acumulado)
+# - área de balanceo: elipse que contiene el 95 % de las posiciones (x, y) de la ventana,
+#   a partir de sumas acumuladas que se actualizan al entrar y salir cada muestra
+# - pasos: máximos de la altura del CM en la imagen (y crece hacia abajo, así que son los puntos
+#   más bajos del CM) con una amplitud mínima respecto al valle anterior y un intervalo mínimo
+# Las coordenadas del CM son las normalizadas de MediaPipe (fracción del ancho y alto del frame),
+# por lo que las velocidades están en unidades normalizadas por segundo.
+# La cadencia se mide siempre en la ventana (pasos por minuto entre las muestras del buffer).
+# from_track calcula las mismas métricas, vectorizadas, sobre un track completo ya guardado.
+# update() y gap() se llaman desde el hilo del análisis y summary() desde el de la página, por lo
+# que el estado se protege con un lock.
+class CMKinematics:
+    # χ² con 2 grados de libertad para el 95 %
+    chi2_95 = 5.991
+
+    def __init__(self, capacity=300, min_step_interval=0.25, min_step_amplitude=0.01):
+        self.capacity = capacity
+        self.min_step_interval = min_step_interval
+        self.min_step_amplitude = min_step_amplitude
+        self.times = np.full(capacity, np.nan)
+        self.positions = np.full((capacity, 2), np.nan)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self._reset()
+
+    def _reset(self):
+        self.index = 0
+        self.size = 0
+        # Sumas de x, y, x², y², xy de la ventana, relativas a origin (evita perder precisión)
+        self.sums = np.zeros(5)
+        self.origin = None
+        self.pushes = 0
+        self.path_length = 0.0
+        self.step_times = deque()
+        self.step_count = 0
+        self.last_step = -np.inf
+        self._gap()
+
+    # Frame sin pose: se corta la cadena de diferencias (velocidad, aceleración, pasos)
+    def gap(self):
+        with self.lock:
+            self._gap()
+
+    def _gap(self):
+        self.previous = None
+        self.velocity = np.full(3, np.nan)
+        self.acceleration = np.full(3, np.nan)
+        self.trough = None
+
+    def update(self, frame_time, cm):
+        cm = np.asarray(cm, dtype=np.float64)
+        with self.lock:
+            self._update(frame_time, cm)
+
+    def _update(self, frame_time, cm):
+        if frame_time is None or np.isnan(cm).any():
+            self._gap()
+            return
+        velocity = np.full(3, np.nan)
+        acceleration = np.full(3, np.nan)
+        if self.previous is not None:
+            previous_time, previous_cm, previous_velocity = self.previous
+            dt = frame_time - previous_time
+            if dt > 0:
+                velocity = (cm - previous_cm) / dt
+                acceleration = (velocity - previous_velocity) / dt
+                self.path_length += float(np.hypot(*(cm[:2] - previous_cm[:2])))
+                # Máximo local de y en el frame anterior: posible paso
+                if previous_velocity[1] > 0 and velocity[1] <= 0:
+                    self.check_step(previous_time, previous_cm[1])
+        if self.trough is None:
+            self.trough = cm[1]
+        self.trough = min(self.trough, cm[1])
+        self.previous = (frame_time, cm, velocity)
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.push(frame_time, cm[:2])
+
+    def check_step(self, peak_time, peak):
+        if peak - self.trough >= self.min_step_amplitude and peak_time - self.last_step >= self.min_step_interval:
+            self.step_times.append(peak_time)
+            self.step_count += 1
+            self.last_step = peak_time
+            self.trough = peak
+
+    # Agrega una posición a la ventana y descuenta la que sale del buffer
+    def push(self, frame_time, position):
+        if self.origin is None:
+            self.origin = position.copy()
+        if self.size == self.capacity:
+            self.sums -= self.moments(self.positions[self.index] - self.origin)
+        else:
+            self.size += 1
+        self.times[self.index] = frame_time
+        self.positions[self.index] = position
+        self.index = (self.index + 1) % self.capacity
+        self.sums += self.moments(position - self.origin)
+
+        # Cada `capacity` muestras las sumas se recalculan desde el buffer, para que los
+        # errores de redondeo no se acumulen (costo amortizado O(1))
+        self.pushes += 1
+        if self.pushes % self.capacity == 0:
+            relative = self.positions[:self.size] - self.origin
+            self.sums = self.moments(relative.T).sum(axis=1) if self.size else np.zeros(5)
+
+        oldest = self.times[self.index if self.size == self.capacity else 0]
+        while self.step_times and self.step_times[0] < oldest:
+            self.step_times.popleft()
+
+    @staticmethod
+    def moments(relative):
+        x, y = relative
+        return np.array([x, y, x * x, y * y, x * y])
+
+    # Área de la elipse del 95 % a partir de la covarianza de la ventana
+    def sway_area(self):
+        n = self.size
+        if n < 3:
+            return np.nan
+        sum_x, sum_y, sum_xx, sum_yy, sum_xy = self.sums
+        var_x = (sum_xx - sum_x * sum_x / n) / (n - 1)
+        var_y = (sum_yy - sum_y * sum_y / n) / (n - 1)
+        cov_xy = (sum_xy - sum_x * sum_y / n) / (n - 1)
+        return np.pi * self.chi2_95 * np.sqrt(max(var_x * var_y - cov_xy * cov_xy, 0.0))
+
+    # Pasos por minuto dentro de la ventana
+    def cadence(self):
+        if self.size < 2:
+            return np.nan
+        oldest = self.times[self.index if self.size == self.capacity else 0]
+        newest = self.times[self.index - 1]
+        return len(self.step_times) * 60.0 / (newest - oldest) if newest > oldest else np.nan
+
+    # Copia del estado actual; es lo único que se lee desde fuera del hilo del análisis
+    def summary(self):
+        with self.lock:
+            return {
+                'velocity': self.velocity.copy(),
+                'speed': float(np.hypot(*self.velocity[:2])),
+                'acceleration': self.acceleration.copy(),
+                'sway_area': float(self.sway_area()),
+                'path_length': self.path_length,
+                'steps': self.step_count,
+                'cadence': float(self.cadence()),
+            }
+
+    # Resumen en una línea para la vista previa
+    def describe(self):
+        summary = self.summary()
+        speed = f"{summary['speed']:.2f}/s" if np.isfinite(summary['speed']) else "—"
+        return (f"velocidad CM {speed} · balanceo {summary['sway_area']:.4f} · "
+                f"recorrido {summary['path_length']:.2f} · {summary['steps']} pasos")
+
+    # Métricas de un track completo (timestamps (frames,), cm (frames, 3), NaN sin pose), con los
+    # mismos criterios que el cálculo incremental: velocidad, aceleración, rapidez, recorrido
+    # acumulado, área de balanceo y cadencia (en la ventana) por frame, y los instantes de los
+    # pasos. mean_cadence es la cadencia de todo el track.
+    @classmethod
+    def from_track(cls, timestamps, cm, capacity=300, min_step_interval=0.25, min_step_amplitude=0.01):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        cm = np.asarray(cm, dtype=np.float64)
+        frames = len(timestamps)
+        valid = ~np.isnan(cm).any(axis=1)
+
+        # Diferencias hacia atrás; NaN después de un frame sin pose o si el tiempo no avanza
+        velocity = np.full((frames, 3), np.nan)
+        acceleration = np.full((frames, 3), np.nan)
+        dt = np.diff(timestamps)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            forward = (dt > 0)[:, np.newaxis]
+            velocity[1:] = np.where(forward, np.diff(cm, axis=0) / dt[:, np.newaxis], np.nan)
+            acceleration[1:] = np.where(forward, np.diff(velocity, axis=0) / dt[:, np.newaxis], np.nan)
+        segments = np.hypot(*(np.diff(cm[:, :2], axis=0).T))
+        segments[~(dt > 0)] = np.nan
+        path_length = np.concatenate([[0.0], np.cumsum(np.nan_to_num(segments))])
+
+        # Área de balanceo en ventanas de `capacity` muestras válidas (sumas acumuladas)
+        sway_area = np.full(frames, np.nan)
+        positions = cm[valid, :2]
+        if len(positions):
+            relative = positions - positions[0]
+            moments = np.concatenate([np.zeros((1, 5)), np.cumsum(cls.moments(relative.T).T, axis=0)])
+            ends = np.arange(1, len(positions) + 1)
+            starts = np.maximum(0, ends - capacity)
+            n = (ends - starts).astype(np.float64)
+            sum_x, sum_y, sum_xx, sum_yy, sum_xy = (moments[ends] - moments[starts]).T
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var_x = (sum_xx - sum_x * sum_x / n) / (n - 1)
+                var_y = (sum_yy - sum_y * sum_y / n) / (n - 1)
+                cov_xy = (sum_xy - sum_x * sum_y / n) / (n - 1)
+                area = np.pi * cls.chi2_95 * np.sqrt(np.maximum(var_x * var_y - cov_xy * cov_xy, 0.0))
+            area[n < 3] = np.nan
+            sway_area[valid] = area
+
+        # Pasos: máximos locales de y (la velocidad vertical pasa de positiva a no positiva). El
+        # valle se mide desde el último paso o desde el inicio del tramo continuo con pose.
+        vertical = velocity[:, 1]
+        with np.errstate(invalid='ignore'):
+            candidates = np.flatnonzero((vertical[:-1] > 0) & (vertical[1:] <= 0))
+        run_start = np.maximum.accumulate(np.where(valid & ~np.r_[False, valid[:-1]], np.arange(frames), 0))
+        step_times = []
+        last_step, last_step_index = -np.inf, 0
+        for peak_index in candidates:
+            start = max(run_start[peak_index + 1], last_step_index)
+            trough = cm[start:peak_index + 1, 1].min()
+            peak_time = timestamps[peak_index]
+            if cm[peak_index, 1] - trough >= min_step_amplitude and peak_time - last_step >= min_step_interval:
+                step_times.append(peak_time)
+                last_step, last_step_index = peak_time, peak_index
+
+        # Cadencia en la misma ventana de `capacity` muestras válidas. Al frame de cada muestra ya
+        # se detectaron todos los pasos anteriores a ella (un paso se confirma en el frame siguiente).
+        cadence = np.full(frames, np.nan)
+        step_array = np.array(step_times, dtype=np.float64)
+        if len(positions):
+            valid_times = timestamps[valid]
+            oldest, newest = valid_times[starts], valid_times[ends - 1]
+            steps_in_window = (np.searchsorted(step_array, newest, 'left')
+                               - np.searchsorted(step_array, oldest, 'left'))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                window_cadence = np.where((n >= 2) & (newest > oldest),
+                                          steps_in_window * 60.0 / (newest - oldest), np.nan)
+            cadence[valid] = window_cadence
+
+        duration = timestamps[valid][-1] - timestamps[valid][0] if valid.sum() > 1 else 0.0
+        return {
+            'velocity': velocity,
+            'acceleration': acceleration,
+            'speed': np.hypot(velocity[:, 0], velocity[:, 1]),
+            'path_length': path_length,
+            'sway_area': sway_area,
+            'step_times': step_array,
+            'cadence': cadence,
+            'mean_cadence': len(step_times) * 60.0 / duration if duration > 0 else np.nan,
+        }
+
+# Caché en disco de los landmarks por frame, indexada por el hash del contenido del video y la
+# configuración de Pose. Se eliminan primero las entradas usadas hace más tiempo (LRU) cuando el
+# tamaño total supera max_bytes.
+class LandmarkCache:
+    def __init__(self, directory=None, max_bytes=2 * 1024 ** 3):
+        self.directory = directory or os.environ.get(
+            'CM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'cm_landmark_cache'))
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    # Hash SHA-256 del contenido (leído por bloques)
+    def digest(self, source):
+        digest = hashlib.sha256()
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as file:
+                self._hash_file(digest, file)
+        else:
+            source.seek(0)
+            self._hash_file(digest, source)
+            source.seek(0)
+        return digest.hexdigest()
+
+    # Clave de la entrada: hash del contenido combinado con la configuración
+    def key(self, content_digest, settings):
+        digest = hashlib.sha256(content_digest.encode())
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _hash_file(self, digest, file, block_size=1024 * 1024):
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    # Devuelve {'timestamps', 'landmarks'} o None; un acierto marca la entrada como usada recientemente
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                result = {'timestamps': data['timestamps'], 'landmarks': data['landmarks']}
+            os.utime(path)
+            return result
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        partial = path + '.partial'
+        with open(partial, 'wb') as file:
+            np.savez(file, timestamps=result['timestamps'], landmarks=result['landmarks'])
+        os.replace(partial, path)
+        self.evict()
+
+    # Elimina las entradas menos usadas hasta respetar el tamaño máximo
+    def evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.npz'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+# Codifica los frames anotados a un MP4 con PyAV. Los presets usan solo codificadores por
+# software (libx264; mpeg4 si FFmpeg no incluye libx264) para funcionar en cualquier servidor.
+class VideoEncoder:
+    presets = {
+        'Rápido': {'codec': 'libx264', 'preset': 'ultrafast', 'crf': 28, 'scale': 0.5},
+        'Equilibrado': {'codec': 'libx264', 'preset': 'veryfast', 'crf': 23, 'scale': 1.0},
+        'Alta calidad': {'codec': 'libx264', 'preset': 'medium', 'crf': 18, 'scale': 1.0}
+    }
+
+    def __init__(self, preset='Equilibrado'):
+        self.settings = self.presets[preset]
+        self.container = None
+        self.stream = None
+        self._last_pts = -1
+        tfile = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        tfile.close()
+        self.path = tfile.name
+
+    # Abre el contenedor con el tamaño del primer frame (ajustado a dimensiones pares)
+    def _open(self, width, height):
+        scale = self.settings['scale']
+        codec = self.settings['codec'] if self.settings['codec'] in av.codecs_available else 'mpeg4'
+        self.container = av.open(self.path, mode='w')
+        self.stream = self.container.add_stream(codec, rate=30)
+        self.stream.width = max(2, int(width * scale) & ~1)
+        self.stream.height = max(2, int(height * scale) & ~1)
+        self.stream.pix_fmt = 'yuv420p'
+        # Timestamps en milisegundos: el video conserva los tiempos reales aunque se omitan frames
+        self.stream.codec_context.time_base = Fraction(1, 1000)
+        if codec == 'libx264':
+            self.stream.options = {'preset': self.settings['preset'], 'crf': str(self.settings['crf'])}
+
+    def encode(self, frame_time, image):
+        height, width, _ = image.shape
+        if self.container is None:
+            self._open(width, height)
+
+        pts = int(round((frame_time or 0.0) * 1000))
+        if pts <= self._last_pts:
+            pts = self._last_pts + 1
+        self._last_pts = pts
+
+        frame = av.VideoFrame.from_ndarray(image, format='rgb24')
+        frame = frame.reformat(width=self.stream.width, height=self.stream.height, format='yuv420p')
+        frame.pts = pts
+        frame.time_base = Fraction(1, 1000)
+        for packet in self.stream.encode(frame):
+            self.container.mux(packet)
+
+    # Vacía el codificador y devuelve el MP4 como bytes; el archivo temporal se elimina
+    def finish(self):
+        try:
+            if self.container is None:
+                return None
+            for packet in self.stream.encode():
+                self.container.mux(packet)
+            self.container.close()
+            self.container = None
+            with open(self.path, 'rb') as file:
+                return file.read()
+        finally:
+            self.discard()
+
+    # Descarta el video (por ejemplo, si el procesamiento se interrumpe)
+    def discard(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# Último frame dibujado para la vista previa, con un límite de frames por segundo.
+# El análisis nunca espera al navegador: los frames intermedios simplemente no se dibujan.
+class PreviewSlot:
+    def __init__(self, max_fps=10):
+        self.interval = 1.0 / max_fps if max_fps else 0.1
+        self.lock = threading.Lock()
+        self.image = None
+        self.position = 0.0
+        self.frames = 0
+        self._last_put = None
+
+    # Registra el avance del análisis (para la barra de progreso)
+    def advance(self, frame_time):
+        self.frames += 1
+        if frame_time is not None:
+            self.position = frame_time
+
+    # Indica si ya pasó el intervalo mínimo desde el último frame de vista previa
+    def due(self):
+        return self._last_put is None or time.monotonic() - self._last_put >= self.interval
+
+    def put(self, image):
+        with self.lock:
+            self.image = image
+            self._last_put = time.monotonic()
+
+    # Devuelve el último frame (una sola vez) o None si no hay uno nuevo
+    def take(self):
+        with self.lock:
+            image, self.image = self.image, None
+        return image
+
+# Ranura con el frame más reciente de una fuente en vivo. Cada frame nuevo reemplaza al que
+# no se alcanzó a procesar: los frames viejos se descartan en lugar de acumularse en una cola.
+class LatestFrameSlot:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.condition:
+            if self.item is not None:
+                self.dropped += 1
+            self.item = item
+            self.condition.notify()
+
+    # Espera un frame nuevo (a lo sumo timeout segundos); None si no llegó ninguno
+    def take(self, timeout=1.0):
+        with self.condition:
+            if self.item is None and not self.closed:
+                self.condition.wait(timeout)
+            item, self.item = self.item, None
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# Fuente de video en vivo: una cámara (/dev/videoN en Linux, el índice en macOS,
+# "video=<nombre>" en Windows), una URL de transmisión (RTSP, HTTP, UDP) o un archivo que se
+# reproduce a velocidad real, como si fuera una cámara. Un hilo decodifica continuamente y deja
+# cada frame en la ranura junto con el instante en que estuvo disponible.
+# Las fuentes disponibles las define el servidor (ver available); la página solo elige entre ellas.
+class LiveSource:
+    video_extensions = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+
+    def __init__(self, source, replay=False, loop=False, open_timeout=5.0, read_timeout=5.0):
+        self.source = source
+        self.replay = replay
+        self.loop = loop
+        self.read_timeout = read_timeout
+        self.slot = LatestFrameSlot()
+        self.stop_event = threading.Event()
+        self.error = None
+        self.container = self.open(source, (open_timeout, read_timeout))
+        self.thread = threading.Thread(target=self._capture, daemon=True)
+        self.thread.start()
+
+    # Fuentes que el servidor permite abrir, {nombre: (fuente, es_archivo)}:
+    # - CM_LIVE_CAMERAS: cámaras separadas por comas (por defecto la primera cámara del equipo)
+    # - CM_LIVE_URLS: URLs de transmisión permitidas, separadas por comas
+    # - CM_LIVE_REPLAY_DIR: carpeta con archivos de video que se reproducen a velocidad real
+    @classmethod
+    def available(cls):
+        default_camera = '0' if sys.platform == 'darwin' else '/dev/video0' if sys.platform.startswith('linux') else ''
+        sources = {}
+        for camera in os.environ.get('CM_LIVE_CAMERAS', default_camera).split(','):
+            if camera.strip():
+                sources[f"Cámara {camera.strip()}"] = (camera.strip(), False)
+        urls = [url.strip() for url in os.environ.get('CM_LIVE_URLS', '').split(',') if url.strip()]
+        for number, url in enumerate(urls, 1):
+            # El nombre no muestra la URL completa, que puede llevar credenciales
+            sources[f"Transmisión {number} ({urlsplit(url).hostname or 'local'})"] = (url, False)
+        directory = os.environ.get('CM_LIVE_REPLAY_DIR')
+        if directory and os.path.isdir(directory):
+            directory = os.path.realpath(directory)
+            for name in sorted(os.listdir(directory)):
+                path = os.path.realpath(os.path.join(directory, name))
+                # Solo archivos de video dentro de la carpeta (los enlaces que salen de ella se ignoran)
+                if (os.path.dirname(path) == directory and os.path.isfile(path)
+                        and name.lower().endswith(cls.video_extensions)):
+                    sources[f"Archivo {name}"] = (path, True)
+        return sources
+
+    # Abre la fuente con las opciones de baja latencia de FFmpeg (sin buffer de entrada). El
+    # timeout de lectura interrumpe una transmisión que deja de enviar datos.
+    def open(self, source, timeout):
+        if self.replay:
+            return av.open(source)
+        if source.startswith('/dev/video'):
+            return av.open(source, format='v4l2', timeout=timeout)
+        if sys.platform == 'darwin' and source.isdigit():
+            return av.open(source, format='avfoundation', options={'framerate': '30'}, timeout=timeout)
+        if source.startswith('video='):
+            return av.open(source, format='dshow', timeout=timeout)
+        return av.open(source, options={'fflags': 'nobuffer', 'flags': 'low_delay', 'rtsp_transport': 'tcp'},
+                       timeout=timeout)
+
+    def _capture(self):
+        try:
+            stream = self.container.streams.video[0]
+            # Hilos por slice: el multihilo por frames retrasa cada frame varios frames
+            stream.thread_type = 'SLICE'
+            while not self.stop_event.is_set():
+                start = None
+                for frame in self.container.decode(stream):
+                    if self.stop_event.is_set():
+                        return
+                    if self.replay and frame.time is not None:
+                        # Cada frame del archivo se entrega en su momento, como lo haría una cámara
+                        if start is None:
+                            start = time.monotonic() - frame.time
+                        self.stop_event.wait(max(0.0, start + frame.time - time.monotonic()))
+                    self.slot.put((time.monotonic(), frame))
+                if not (self.replay and self.loop):
+                    return
+                self.container.seek(0)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.slot.close()
+            # El contenedor lo cierra este hilo, que es el único que lo usa
+            self.container.close()
+
+    # Frame más reciente (instante de captura, frame de PyAV), o None si no llegó ninguno
+    def read(self, timeout=1.0):
+        item = self.slot.take(timeout)
+        if item is None and self.error is not None:
+            raise self.error
+        return item
+
+    # La fuente terminó (fin del archivo o error) y no quedan frames por leer
+    def finished(self):
+        return self.slot.closed and self.slot.item is None
+
+    # Una lectura bloqueada termina a lo sumo en read_timeout; si el hilo sigue detenido después
+    # de eso, se abandona (es daemon) y cierra el contenedor cuando la lectura vuelva
+    def close(self):
+        self.stop_event.set()
+        self.slot.close()
+        self.thread.join(self.read_timeout + 1.0)
+
+# Pipeline de etapas en hilos separados unidas por colas acotadas.
+# Cada etapa procesa los elementos en orden; si una cola se llena, la etapa anterior
+# se bloquea hasta que haya espacio (contrapresión), limitando la memoria usada.
+class VideoPipeline:
+    _END = object()
+
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.error = None
+
+    # Inserta un elemento esperando espacio en la cola, salvo que el pipeline se detenga
+    def _put(self, q, item):
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Obtiene un elemento de la cola; devuelve _END si el pipeline se detuvo
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._END
+
+    def _start(self, target):
+        def run():
+            try:
+                target()
+            except BaseException as error:
+                self.error = error
+                self.stop_event.set()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    # Etapa inicial: consume un generador (por ejemplo, el decodificador)
+    def source(self, generator_fn):
+        outbox = queue.Queue(maxsize=self.queue_size)
+
+        def run():
+            for item in generator_fn():
+                if not self._put(outbox, item):
+                    return
+            self._put(outbox, self._END)
+
+        self._start(run)
+        return outbox
+
+    # Etapa intermedia: work(item) devuelve los elementos (cero o más) a enviar a la siguiente etapa.
+    # flush() (opcional) entrega los elementos que la etapa retenía cuando termina la entrada.
+    def stage(self, inbox, work, flush=None):
+        outbox = queue.Queue(maxsize=self.queue_size)
+
+        def run():
+            while True:
+                item = self._get(inbox)
+                if item is self._END:
+                    if self.stop_event.is_set():
+                        return
+                    break
+                for result in work(item):
+                    if not self._put(outbox, result):
+                        return
+            for result in (flush() if flush is not None else []):
+                if not self._put(outbox, result):
+                    return
+            self._put(outbox, self._END)
+
+        self._start(run)
+        return outbox
+
+    # Etapa final: consume los elementos sin producir una cola de salida
+    def sink(self, inbox, work):
+        def run():
+            while True:
+                item = self._get(inbox)
+                if item is self._END:
+                    break
+                work(item)
+
+        self._start(run)
+
+    # Espera a que terminen las etapas devolviendo el control al hilo principal cada `interval`
+    # segundos (para actualizar la interfaz sin bloquear el análisis)
+    def run(self, interval):
+        try:
+            while not self.stop_event.is_set() and any(thread.is_alive() for thread in self.threads):
+                yield
+                self.threads[-1].join(interval)
+        finally:
+            self.close()
+
+    # Consume la última cola en el hilo principal (necesario para los elementos de Streamlit)
+    def results(self, inbox):
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is self._END:
+                    break
+                yield item
+        finally:
+            self.close()
+
+    # Detiene todas las etapas y propaga el primer error ocurrido en ellas
+    def close(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+# Métricas del pipeline de video, compartidas por todas las sesiones del proceso:
+# - tiempos por etapa (histograma con suma, cantidad y máximo)
+# - contadores (frames decodificados, descartados, interpolados, detecciones, ...)
+# - memoria: RSS actual, máximo observado y máximo del proceso
+# Desactivadas, measure() devuelve un contexto vacío compartido y count()/observe() retornan
+# de inmediato, por lo que el costo por frame es despreciable.
+# Se exportan en JSON o en el formato de texto de Prometheus; con CM_METRICS_FILE se escriben
+# al final de cada video (p. ej. para el textfile collector de node_exporter).
+class PipelineMetrics:
+    # Límites (segundos) de los intervalos del histograma
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    _disabled = nullcontext()
+
+    def __init__(self, enabled=None, export_path=None):
+        self.enabled = os.environ.get('CM_METRICS') == '1' if enabled is None else enabled
+        self.export_path = export_path or os.environ.get('CM_METRICS_FILE')
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.gauges = {}
+            self.since = time.time()
+
+    # Contexto que mide el tiempo de una etapa
+    def measure(self, stage):
+        if not self.enabled:
+            return self._disabled
+        return self._measure(stage)
+
+    @contextmanager
+    def _measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # Mide el tiempo de cada next() de un iterador (p. ej. la decodificación)
+    def timed(self, stage, iterable):
+        if not self.enabled:
+            return iterable
+        return self._timed(stage, iterable)
+
+    def _timed(self, stage, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    # Registra una duración ya medida
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            timer = self.timers.get(stage)
+            if timer is None:
+                timer = self.timers[stage] = {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                              'buckets': [0] * (len(self.buckets) + 1)}
+            timer['count'] += 1
+            timer['sum'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+            timer['buckets'][index] += 1
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Memoria residente actual y máxima. El máximo del proceso (ru_maxrss) no existe en Windows.
+    def sample_memory(self):
+        if not self.enabled:
+            return
+        rss = None
+        try:
+            with open('/proc/self/statm') as statm:
+                rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux informa kilobytes; macOS, bytes
+            peak = peak if sys.platform == 'darwin' else peak * 1024
+        except ImportError:
+            peak = None
+        with self.lock:
+            if rss is not None:
+                self.gauges['memory_rss_bytes'] = rss
+                self.gauges['memory_rss_high_water_bytes'] = max(rss, self.gauges.get('memory_rss_high_water_bytes', 0))
+            if peak is not None:
+                self.gauges['memory_process_peak_bytes'] = peak
+
+    # Cierre de un análisis: última muestra de memoria y exportación al archivo configurado
+    def finish_run(self):
+        if not self.enabled:
+            return
+        self.sample_memory()
+        if self.export_path:
+            self.export(self.export_path)
+
+    # Resumen en un diccionario serializable a JSON
+    def snapshot(self):
+        with self.lock:
+            timers = {stage: dict(timer, buckets=list(timer['buckets'])) for stage, timer in self.timers.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        stages = {
+            stage: {
+                'count': timer['count'],
+                'total_s': timer['sum'],
+                'mean_ms': timer['sum'] * 1000 / timer['count'],
+                'max_ms': timer['max'] * 1000,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], timer['buckets'])),
+            }
+            for stage, timer in timers.items()
+        }
+        derived = {}
+        if counters.get('detections'):
+            derived['detection_rate'] = counters.get('poses_detected', 0) / counters['detections']
+        if counters.get('preview_frames_drawn'):
+            derived['preview_frames_dropped'] = max(
+                0, counters['preview_frames_drawn'] - counters.get('preview_frames_shown', 0))
+        return {
+            'since': self.since,
+            'uptime_s': time.time() - self.since,
+            'stages': stages,
+            'counters': counters,
+            'gauges': gauges,
+            'derived': derived,
+        }
+
+    # Formato de exposición de texto de Prometheus
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP cm_stage_seconds Tiempo por etapa del pipeline de video',
+            '# TYPE cm_stage_seconds histogram',
+        ]
+        for stage, timer in sorted(snapshot['stages'].items()):
+            cumulative = 0
+            for bound, count in timer['buckets'].items():
+                cumulative += count
+                lines.append(f'cm_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'cm_stage_seconds_sum{{stage="{stage}"}} {timer["total_s"]}')
+            lines.append(f'cm_stage_seconds_count{{stage="{stage}"}} {timer["count"]}')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'# TYPE cm_{name}_total counter')
+            lines.append(f'cm_{name}_total {value}')
+        for name, value in sorted(list(snapshot['gauges'].items()) + list(snapshot['derived'].items())):
+            lines.append(f'# TYPE cm_{name} gauge')
+            lines.append(f'cm_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # Escribe las métricas (.json o formato de Prometheus) reemplazando el archivo de forma atómica
+    def export(self, path):
+        content = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        partial = path + '.partial'
+        with open(partial, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(partial, path)
 
 class AppFrontend:
     def __init__(self, detector):
@@ -152,13 +1958,214 @@ class AppFrontend:
 
     def run_page_1(self):
         self.st.title("Detección del Centro de Masa")
+        input_mode = self.st.radio("Fuente", ["Archivo de video", "Cámara o transmisión en vivo"], horizontal=True)
+        if input_mode != "Archivo de video":
+            self.run_live_mode()
+            return
         uploaded_file = self.st.file_uploader("Sube un video", type=['mp4', 'mov', 'avi'])
         if uploaded_file is not None:
             peso_persona = self.st.number_input("Ingresa el peso de la persona (kg):", min_value=0.0, step=0.1)
+            multi = self.st.checkbox("Varias personas en el video (un ID y un CM por persona)")
+            parallel = self.st.checkbox("Análisis en paralelo (videos largos, sin vista previa)", disabled=multi)
+            preview_fps, mode = self.processing_mode_options()
+            export_preset = self.st.selectbox(
+                "Exportar video anotado (MP4)", ["No exportar"] + list(VideoEncoder.presets), disabled=parallel
+            )
             if peso_persona > 0:
+                if not multi and self.pose_unavailable():
+                    return
                 self.st.text("Procesando video...")
-                self.detector.process_video(uploaded_file, peso_persona)
+                if multi:
+                    try:
+                        result = self.detector.process_video_multi(
+                            uploaded_file, mode, preview_fps,
+                            export_preset if export_preset in VideoEncoder.presets else None
+                        )
+                    except FileNotFoundError as error:
+                        # Falta el modelo .task de PoseLandmarker (CM_POSE_LANDMARKER_MODEL)
+                        self.st.error(str(error))
+                        return
+                elif parallel:
+                    result = self.run_parallel_analysis(uploaded_file)
+                else:
+                    result = self.detector.process_video(
+                        uploaded_file, peso_persona, mode, preview_fps,
+                        export_preset if export_preset in VideoEncoder.presets else None
+                    )
+                if result.get('video'):
+                    # on_click="ignore" evita que la descarga vuelva a ejecutar el análisis
+                    self.st.download_button(
+                        label="Descargar video anotado",
+                        data=result['video'],
+                        file_name=os.path.splitext(uploaded_file.name)[0] + "_centro_de_masa.mp4",
+                        mime="video/mp4",
+                        on_click="ignore"
+                    )
                 self.st.text("Procesamiento completado.")
+                self.show_cm_chart(result)
+                self.show_kinematics(result)
+
+    # Muestra el error si MediaPipe Pose no se pudo cargar (p. ej. una versión sin mp.solutions)
+    def pose_unavailable(self):
+        registry.warm_up(['mediapipe-pose'])
+        error = registry.errors.get('mediapipe-pose')
+        if error is not None:
+            self.st.error(f"MediaPipe Pose no está disponible: {error}")
+        return error is not None
+
+    # Modo en vivo: la fuente se abre en el servidor (cámara conectada al equipo, URL de
+    # transmisión o archivo reproducido a velocidad real) y solo se puede elegir entre las que
+    # configura el servidor. Al presionar "Detener" Streamlit vuelve a ejecutar el script, lo que
+    # interrumpe el análisis y cierra la fuente.
+    def run_live_mode(self):
+        if self.pose_unavailable():
+            return
+        sources = LiveSource.available()
+        if not sources:
+            self.st.info("No hay fuentes en vivo configuradas en el servidor "
+                         "(CM_LIVE_CAMERAS, CM_LIVE_URLS o CM_LIVE_REPLAY_DIR).")
+            return
+        name = self.st.selectbox("Fuente", list(sources))
+        peso_persona = self.st.number_input("Ingresa el peso de la persona (kg):", min_value=0.0, step=0.1)
+        with self.st.expander("Opciones del modo en vivo"):
+            latency_budget = self.st.number_input("Latencia máxima (ms)", min_value=20, value=100, step=10)
+            inference_width = self.st.number_input("Ancho inicial para la detección en píxeles (0 = original)",
+                                                   min_value=0, value=320, step=32)
+            smoothing = self.st.checkbox("Suavizado temporal de los landmarks (One-Euro)", value=True)
+            max_seconds = self.st.number_input("Duración máxima de la sesión (s)", min_value=5, value=60, step=5)
+        if peso_persona > 0 and self.st.button("Iniciar"):
+            self.st.button("Detener")
+            mode = ProcessingMode(inference_width=inference_width or None, latency_budget=latency_budget / 1000,
+                                  smoothing=smoothing)
+            source, replay = sources[name]
+            try:
+                result = self.detector.process_live(source, peso_persona, mode, max_seconds=max_seconds, replay=replay)
+            except (OSError, av.FFmpegError) as error:
+                self.st.error(f"No se pudo abrir la fuente '{name}': {error}")
+                return
+            if len(result['latency']):
+                over = np.mean(result['latency'] > latency_budget / 1000) * 100
+                self.st.text(
+                    f"Sesión terminada: {len(result['timestamps'])} frames analizados, {result['dropped']} descartados, "
+                    f"latencia p95 {np.percentile(result['latency'], 95) * 1000:.0f} ms "
+                    f"({over:.0f} % sobre el presupuesto)."
+                )
+                self.show_cm_chart(result)
+                self.show_kinematics(result)
+
+    # Reserva el panel de métricas del pipeline. Las métricas son de todo el servidor y se
+    # activan con CM_METRICS=1; cada sesión solo decide si muestra el panel.
+    def diagnostics_panel(self):
+        if not self.detector.metrics.enabled:
+            return None
+        show = self.st.sidebar.checkbox(
+            "Diagnóstico del pipeline",
+            help="Tiempos de cada etapa del análisis en todas las sesiones del servidor"
+        )
+        return self.st.sidebar.container() if show else None
+
+    # Tiempos por etapa, contadores y memoria, con descarga en JSON o formato Prometheus
+    def show_diagnostics(self, panel):
+        metrics = self.detector.metrics
+        snapshot = metrics.snapshot()
+        with panel:
+            self.st.caption(f"Métricas de los últimos {snapshot['uptime_s'] / 60:.1f} min (todas las sesiones)")
+            stages = sorted(snapshot['stages'].items(), key=lambda item: -item[1]['total_s'])
+            self.st.dataframe([
+                {'Etapa': stage, 'Llamadas': timer['count'], 'Media (ms)': round(timer['mean_ms'], 2),
+                 'Máx (ms)': round(timer['max_ms'], 1), 'Total (s)': round(timer['total_s'], 2)}
+                for stage, timer in stages
+            ], hide_index=True)
+            counters = dict(snapshot['counters'], **snapshot['derived'])
+            if counters:
+                self.st.dataframe([{'Contador': name, 'Valor': round(value, 3)} for name, value in counters.items()],
+                                  hide_index=True)
+            for name, value in snapshot['gauges'].items():
+                self.st.text(f"{name}: {value / 1024 ** 2:.0f} MB")
+            self.st.download_button("Descargar métricas (JSON)", metrics.to_json(), file_name="cm_metrics.json",
+                                    mime="application/json", on_click="ignore")
+            self.st.download_button("Descargar métricas (Prometheus)", metrics.to_prometheus(),
+                                    file_name="cm_metrics.prom", mime="text/plain", on_click="ignore")
+
+    # Trayectoria del CM en el tiempo (en el modo de varias personas, X e Y de cada ID)
+    def show_cm_chart(self, result):
+        if 'ids' in result:
+            columns = {'Tiempo (s)': result['timestamps']}
+            for column, person_id in enumerate(result['ids']):
+                columns[f'ID {person_id} X'] = result['cm'][:, column, 0]
+                columns[f'ID {person_id} Y'] = result['cm'][:, column, 1]
+            self.st.line_chart(columns, x='Tiempo (s)')
+            return
+        self.st.line_chart({
+            'Tiempo (s)': result['timestamps'],
+            'X': result['cm'][:, 0],
+            'Y': result['cm'][:, 1],
+            'Z': result['cm'][:, 2]
+        }, x='Tiempo (s)')
+
+    # Cinemática del CM calculada sobre el track completo: resumen y rapidez en el tiempo. Las
+    # distancias están en coordenadas normalizadas de la imagen (fracción del ancho y alto).
+    def show_kinematics(self, result):
+        timestamps = result['timestamps']
+        if 'ids' in result:
+            people = [(f'ID {person_id}', result['cm'][:, column]) for column, person_id in enumerate(result['ids'])]
+        else:
+            people = [('CM', result['cm'])]
+        rows = []
+        speeds = {'Tiempo (s)': timestamps}
+        for name, cm in people:
+            kinematics = CMKinematics.from_track(timestamps, cm)
+            speed, sway_area, cadence = kinematics['speed'], kinematics['sway_area'], kinematics['mean_cadence']
+            rows.append({
+                '': name,
+                'Rapidez media (/s)': np.nanmean(speed) if np.isfinite(speed).any() else None,
+                'Recorrido': kinematics['path_length'][-1] if len(timestamps) else 0.0,
+                'Área de balanceo máx.': np.nanmax(sway_area) if np.isfinite(sway_area).any() else None,
+                'Pasos': len(kinematics['step_times']),
+                'Cadencia media (pasos/min)': cadence if np.isfinite(cadence) else None,
+            })
+            speeds[f'{name} rapidez' if len(people) > 1 else 'Rapidez (/s)'] = kinematics['speed']
+        self.st.dataframe(rows, hide_index=True)
+        self.st.line_chart(speeds, x='Tiempo (s)')
+
+    # Opciones de frecuencia y resolución del análisis (0 = sin límite)
+    def processing_mode_options(self):
+        with self.st.expander("Opciones de procesamiento"):
+            target_fps = self.st.number_input("FPS de análisis (0 = todos los frames)", min_value=0.0, value=0.0, step=1.0)
+            inference_width = self.st.number_input("Ancho máximo para la detección en píxeles (0 = original)",
+                                                   min_value=0, value=0, step=32)
+            latency_budget = self.st.number_input("Presupuesto de latencia por frame en ms (0 = desactivado)",
+                                                  min_value=0, value=0, step=5)
+            pose_interval = self.st.slider("Detectar la pose cada N frames (los intermedios se interpolan)",
+                                           min_value=1, max_value=6, value=1)
+            smoothing = self.st.checkbox("Suavizado temporal de los landmarks (One-Euro)")
+            preview_fps = self.st.slider("FPS de la vista previa", min_value=1, max_value=30, value=10)
+        return preview_fps, ProcessingMode(
+            target_fps=target_fps or None,
+            inference_width=inference_width or None,
+            latency_budget=latency_budget / 1000 or None,
+            pose_interval=pose_interval,
+            smoothing=smoothing
+        )
+
+    # Analiza el video completo en varios procesos (o lo recupera de la caché)
+    def run_parallel_analysis(self, uploaded_file):
+        cpus = os.cpu_count() or 1
+        # Con un solo procesador no hay nada que elegir (y el slider no admite mínimo igual al máximo)
+        workers = self.st.slider("Procesos", min_value=1, max_value=cpus, value=cpus) if cpus > 1 else 1
+        # Se analizan todos los frames a resolución completa, por fragmentos
+        cache_key = self.detector.cache_key(uploaded_file, ProcessingMode(), 'sharded')
+        if cache_key is not None:
+            cached = self.detector.cache.get(cache_key)
+            if cached is not None:
+                return self.detector.merge_chunks([cached])
+
+        # Los procesos del pool necesitan abrir el video por su cuenta, desde una ruta
+        with self.detector.video_path(uploaded_file) as path:
+            result = self.detector.analyze_video_sharded(path, workers=workers)
+        if cache_key is not None:
+            self.detector.cache.put(cache_key, result)
+        return result
 
     def run_page_2(self):
         self.st.title("Cálculo del Centro de Masa")
@@ -222,12 +2229,36 @@ class AppFrontend:
         dictado en la Pontifica Universidad Catolica del Perú.
         """)
 
+# MediaPipe Pose clásico. Las versiones de MediaPipe posteriores a 0.10.21 ya no traen
+# mp.solutions: el error indica qué instalar en lugar de un AttributeError.
+def create_pose():
+    if getattr(mp, 'solutions', None) is None:
+        raise RuntimeError(f"MediaPipe {getattr(mp, '__version__', '?')} no incluye mp.solutions.pose; "
+                           "instala la versión de requirements.txt (mediapipe<=0.10.21) "
+                           "o usa el modo de varias personas.")
+    return mp.solutions.pose.Pose(**CenterOfMassDetector.pose_options)
+
+
+# Modelos compartidos por todas las sesiones del proceso. MediaPipe Pose guarda estado de
+# tracking y no es thread-safe, por lo que se entrega una instancia por video desde un pool.
+registry.register('mediapipe-pose', create_pose, thread_safe=False)
+registry.register('mediapipe-pose-landmarker',
+                  lambda: MultiPoseLandmarker(int(os.environ.get('CM_MAX_PEOPLE', '4'))), thread_safe=False)
+registry.register('detector', lambda: CenterOfMassDetector(cache=LandmarkCache()))
+
 def main():
-    # Instancia la clase detectora de centro de masa
-    detector = CenterOfMassDetector()
+    # Carga los modelos la primera vez que se ejecuta el script en este proceso. PoseLandmarker
+    # (varias personas) se carga recién cuando se usa.
+    load_times = registry.warm_up(['mediapipe-pose', 'detector'])
+
+    # Detector de centro de masa compartido (no guarda estado por sesión)
+    detector = registry.get('detector')
 
     # Instancia la clase de frontend
     frontend = AppFrontend(detector)
+    frontend.st.sidebar.caption(
+        "Modelos cargados: " + ", ".join(f"{name} ({seconds:.2f} s)" for name, seconds in load_times.items())
+    )
 
     # Crea una barra lateral con un selector de páginas
     page = frontend.st.sidebar.selectbox(
@@ -235,6 +2266,9 @@ def main():
         ("Detección del Centro de Masa", "Cálculo del Centro de Masa", "Tarea academica 1")
     )
 
+    # El panel de diagnóstico se activa antes del análisis y se completa al final del script
+    diagnostics = frontend.diagnostics_panel()
+
     # Ejecutar diferentes páginas
     if page == "Detección del Centro de Masa":
         frontend.run_page_1()
@@ -243,5 +2277,8 @@ def main():
     elif page == "Tarea academica 1":
         frontend.run_page_n()
 
+    if diagnostics is not None:
+        frontend.show_diagnostics(diagnostics)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
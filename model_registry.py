@@ -0,0 +1,94 @@
+# Registro de modelos compartido por todo el proceso.
+#
+# Streamlit vuelve a ejecutar el script en cada interacción, pero los módulos importados se
+# mantienen en memoria: el registro vive aquí para que cada modelo (generadores de S-CycleGAN,
+# grafos de MediaPipe, ...) se cargue una sola vez por proceso y se comparta entre sesiones.
+# Los modelos que no son thread-safe se entregan desde un pool: cada hilo usa una instancia
+# en exclusiva y la devuelve al terminar, para que la siguiente ejecución la reutilice.
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaders = {}
+        self.instances = {}
+        self.pools = {}
+        self.load_times = {}
+        self.errors = {}
+        self._load_locks = {}
+
+    # Registra un modelo; registrar dos veces el mismo nombre no tiene efecto (reruns de Streamlit)
+    def register(self, name, loader, thread_safe=True):
+        with self.lock:
+            if name not in self.loaders:
+                self.loaders[name] = (loader, thread_safe)
+                self._load_locks[name] = threading.Lock()
+                if not thread_safe:
+                    self.pools[name] = []
+
+    # Ejecuta el loader y registra el tiempo de carga (o el error)
+    def _load(self, name):
+        loader, _ = self.loaders[name]
+        start = time.perf_counter()
+        try:
+            instance = loader()
+        except Exception as error:
+            self.errors[name] = error
+            raise
+        self.errors.pop(name, None)
+        self.load_times.setdefault(name, time.perf_counter() - start)
+        return instance
+
+    # Devuelve la instancia compartida de un modelo thread-safe, cargándola la primera vez
+    def get(self, name):
+        if name in self.instances:
+            return self.instances[name]
+        if not self.loaders[name][1]:
+            raise ValueError(f"El modelo '{name}' no es thread-safe: usa acquire()")
+        with self._load_locks[name]:
+            if name not in self.instances:
+                self.instances[name] = self._load(name)
+        return self.instances[name]
+
+    # Entrega una instancia para uso exclusivo del hilo actual durante el bloque with
+    @contextmanager
+    def acquire(self, name):
+        _, thread_safe = self.loaders[name]
+        if thread_safe:
+            yield self.get(name)
+            return
+
+        pool = self.pools[name]
+        with self.lock:
+            instance = pool.pop() if pool else None
+        if instance is None:
+            instance = self._load(name)
+        try:
+            yield instance
+        finally:
+            with self.lock:
+                pool.append(instance)
+
+    # Carga por adelantado los modelos indicados (o todos). Los errores se guardan en
+    # self.errors en lugar de propagarse, y no se reintenta un modelo que ya falló.
+    def warm_up(self, names=None):
+        for name in names or list(self.loaders):
+            if name in self.errors:
+                continue
+            try:
+                if self.loaders[name][1]:
+                    self.get(name)
+                elif not self.pools[name] and name not in self.load_times:
+                    instance = self._load(name)
+                    with self.lock:
+                        self.pools[name].append(instance)
+            except Exception:
+                pass
+        return dict(self.load_times)
+
+
+# Registro único del proceso
+registry = ModelRegistry()
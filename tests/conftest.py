@@ -0,0 +1,62 @@
+import os
+import sys
+from contextlib import contextmanager
+from fractions import Fraction
+from types import SimpleNamespace
+
+import av
+import numpy as np
+import pytest
+
+# Los módulos de la aplicación están en la raíz del repositorio, no en un paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Video H.264 de 90 frames a 30 fps con B-frames (frames que no sirven de referencia), para
+# comprobar que la selección de frames cuenta todos los frames del video. Un keyframe por
+# segundo (sin keyframes por cambio de escena).
+@pytest.fixture(scope="session")
+def video_30fps(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 160, 120, "yuv420p"
+        stream.codec_context.options = {"bf": "2", "g": "30", "sc_threshold": "0"}
+        for index in range(90):
+            image = np.full((120, 160, 3), (index * 2) % 256, dtype=np.uint8)
+            frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+            frame.pts, frame.time_base = index, Fraction(1, 30)
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+# MediaPipe Pose de prueba: landmarks aleatorios, sin pose uno de cada cinco frames. Permite
+# analizar videos sin depender de la versión de MediaPipe instalada (mp.solutions).
+class FakePose:
+    def __init__(self):
+        self.rng = np.random.default_rng(0)
+        self.calls = 0
+
+    def process(self, image):
+        self.calls += 1
+        if self.calls % 5 == 0:
+            return SimpleNamespace(pose_landmarks=None)
+        points = [SimpleNamespace(x=x, y=y, z=z) for x, y, z in self.rng.uniform(0.1, 0.9, (33, 3))]
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=points))
+
+
+@pytest.fixture
+def fake_pose(monkeypatch):
+    import master
+
+    pose = FakePose()
+
+    @contextmanager
+    def pose_session(self):
+        yield pose
+
+    monkeypatch.setattr(master.CenterOfMassDetector, "pose_session", pose_session)
+    return pose
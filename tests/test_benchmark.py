@@ -0,0 +1,13 @@
+import numpy as np
+
+import benchmark
+
+
+# Las etapas del video salen de PipelineMetrics, con los mismos nombres que exporta la aplicación
+def test_benchmark_video_usa_las_metricas_del_pipeline(video_30fps, tmp_path, fake_pose):
+    resultado = benchmark.benchmark_video(np.random.default_rng(0), 10, video_30fps, str(tmp_path))
+    assert resultado["frames"] == 90 and resultado["fps"] > 0
+    assert {"decode", "convert", "pose", "cm"} <= set(resultado["etapas"])
+    assert resultado["etapas"]["decode"]["count"] == 90
+    assert resultado["contadores"]["frames_decoded"] == 90
+    assert resultado["contadores"]["detections"] == resultado["etapas"]["pose"]["count"]
@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+import cm_batch
+
+
+def fake_result(frames=5):
+    return {'timestamps': np.arange(frames) / 30.0, 'landmarks': np.zeros((frames, 33, 3)), 'cm': np.zeros((frames, 3))}
+
+
+# Pool de prueba: ejecuta cada trabajo al enviarlo y registra el contexto de multiprocessing
+class FakeExecutor:
+    contexts = []
+
+    def __init__(self, max_workers=None, mp_context=None):
+        self.contexts.append(mp_context)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+def make_videos(directory, names):
+    for name in names:
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'video')
+
+
+@pytest.mark.parametrize("value", ["0", "-2", "dos"])
+def test_procesos_must_be_a_positive_integer(tmp_path, value, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cm_batch.main([str(tmp_path), str(tmp_path), '--procesos', value])
+    assert exit_info.value.code == 2
+    assert '--procesos' in capsys.readouterr().err
+
+
+def test_find_videos_mirrors_the_input_tree(tmp_path):
+    make_videos(tmp_path / 'videos', ['a.mp4', 'sub/b.MOV', 'notas.txt'])
+    jobs = cm_batch.find_videos(str(tmp_path / 'videos'), str(tmp_path / 'salida'), 'npz')
+    assert [(os.path.relpath(video, tmp_path), os.path.relpath(output, tmp_path)) for video, output in jobs] == [
+        (os.path.join('videos', 'a.mp4'), os.path.join('salida', 'a.npz')),
+        (os.path.join('videos', 'sub', 'b.MOV'), os.path.join('salida', 'sub', 'b.npz')),
+    ]
+
+
+def test_outputs_newer_than_the_video_are_up_to_date(tmp_path):
+    make_videos(tmp_path, ['a.mp4'])
+    video, output = str(tmp_path / 'a.mp4'), str(tmp_path / 'a.npz')
+    assert not cm_batch.is_up_to_date(video, output)
+    cm_batch.save_result(fake_result(), output, 'npz')
+    os.utime(video, (0, 0))
+    assert cm_batch.is_up_to_date(video, output)
+    with np.load(output) as data:
+        np.testing.assert_array_equal(data['timestamps'], fake_result()['timestamps'])
+    assert not os.path.exists(output + '.partial')
+
+
+def test_single_video_failure_is_reported_per_file(tmp_path, monkeypatch, capsys):
+    make_videos(tmp_path / 'videos', ['largo.mp4'])
+
+    class FailingDetector:
+        def analyze_video_sharded(self, video, workers=None):
+            raise RuntimeError("video dañado")
+
+    monkeypatch.setattr(cm_batch, 'CenterOfMassDetector', FailingDetector)
+    assert cm_batch.main([str(tmp_path / 'videos'), str(tmp_path / 'salida'), '--procesos', '2']) == 1
+    assert 'largo.mp4: error - video dañado' in capsys.readouterr().err
+
+
+def test_several_videos_run_in_a_spawn_pool_and_failures_set_the_exit_code(tmp_path, monkeypatch, capsys):
+    make_videos(tmp_path / 'videos', ['a.mp4', 'b.mp4', 'c.mp4'])
+
+    def process_one(video, output, output_format):
+        if video.endswith('b.mp4'):
+            raise RuntimeError("sin pose")
+        cm_batch.save_result(fake_result(), output, output_format)
+        return 5
+
+    FakeExecutor.contexts = []
+    monkeypatch.setattr(cm_batch, 'ProcessPoolExecutor', FakeExecutor)
+    monkeypatch.setattr(cm_batch, 'process_one', process_one)
+    assert cm_batch.main([str(tmp_path / 'videos'), str(tmp_path / 'salida'), '--procesos', '2']) == 1
+    assert [context.get_start_method() for context in FakeExecutor.contexts] == ['spawn']
+    output = capsys.readouterr()
+    assert 'b.mp4: error - sin pose' in output.err and 'a.mp4: 5 frames' in output.out
+    assert sorted(os.listdir(tmp_path / 'salida')) == ['a.npz', 'c.npz']
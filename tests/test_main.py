@@ -0,0 +1,405 @@
+import gc
+import io
+import os
+import threading
+import zipfile
+
+import numpy as np
+import pydicom
+import pytest
+from pydicom.data import get_testdata_file
+from pydicom.dataset import Dataset
+
+import main
+from main import (DicomProcessor, IA_Modelo, Preprocesador, SerieDicom, ServidorInferencia,
+                  cargar_generadores_safetensors, comparar_backends, construir_generador_resnet, elegir_backend,
+                  guardar_generadores_safetensors, imagenes_control)
+
+
+# Generador de prueba: devuelve la entrada y registra el tamaño de cada lote
+class GeneradorIdentidad:
+    def __init__(self):
+        self.lotes = []
+
+    def predict(self, lote):
+        self.lotes.append(len(lote))
+        return np.asarray(lote, dtype=np.float32)
+
+
+def modelo_de_prueba(generador, espera_max=0.01):
+    modelo = IA_Modelo.__new__(IA_Modelo)
+    modelo.modelo = {"ct2us": generador, "us2ct": generador}
+    modelo.servidor = ServidorInferencia(modelo.predecir_lote, tam_max_lote=8, espera_max=espera_max)
+    return modelo
+
+
+# --- Micro-lotes (user-012) ---
+
+def test_servidor_agrupa_solicitudes_concurrentes():
+    generador = GeneradorIdentidad()
+    modelo = modelo_de_prueba(generador, espera_max=0.2)
+    imagenes = [np.full((4, 4, 1), indice, dtype=np.float32) for indice in range(8)]
+    resultados = [None] * 8
+
+    def pedir(indice):
+        resultados[indice] = modelo.predecir(imagenes[indice])
+
+    hilos = [threading.Thread(target=pedir, args=(indice,)) for indice in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    for imagen, resultado in zip(imagenes, resultados):
+        np.testing.assert_array_equal(resultado, imagen)
+    assert len(generador.lotes) < 8 and sum(generador.lotes) == 8
+
+
+def test_servidor_propaga_errores_y_separa_formas():
+    llamadas = []
+
+    def funcion_lote(lote, direccion):
+        llamadas.append(lote.shape)
+        if direccion == "falla":
+            raise RuntimeError("error del generador")
+        return lote
+
+    servidor = ServidorInferencia(funcion_lote, espera_max=0.1)
+    chica, grande = servidor.enviar(np.zeros((2, 2)), "ct2us"), servidor.enviar(np.zeros((3, 3)), "ct2us")
+    fallida = servidor.enviar(np.zeros((2, 2)), "falla")
+    assert chica.result().shape == (2, 2) and grande.result().shape == (3, 3)
+    with pytest.raises(RuntimeError):
+        fallida.result()
+    assert (1, 2, 2) in llamadas and (1, 3, 3) in llamadas
+
+
+# --- Carga perezosa de DICOM y ventanas por modalidad (user-013) ---
+
+# Archivo en memoria con la interfaz del UploadedFile de Streamlit
+class ArchivoSubido(io.BytesIO):
+    def __init__(self, datos, name, file_id="archivo"):
+        super().__init__(datos)
+        self.name = name
+        self.size = len(datos)
+        self.file_id = file_id
+
+
+def test_dicom_se_lee_sin_pixeles_y_se_decodifica_una_vez(monkeypatch):
+    datos = open(get_testdata_file("CT_small.dcm"), "rb").read()
+    lecturas = []
+    dcmread = pydicom.dcmread
+    monkeypatch.setattr(main.pydicom, "dcmread",
+                        lambda archivo, **opciones: lecturas.append(opciones) or dcmread(archivo, **opciones))
+
+    procesador = DicomProcessor()
+    archivo = ArchivoSubido(datos, "corte.dcm")
+    procesador.cargar_archivo(archivo)
+    assert "PixelData" not in procesador.dicom_data and lecturas == [{"stop_before_pixels": True}]
+
+    primera = procesador.obtener_imagen()
+    assert procesador.obtener_imagen() is primera
+    # Un rerun con el mismo archivo no vuelve a leer el encabezado ni los píxeles
+    procesador.cargar_archivo(archivo)
+    procesador.obtener_imagen()
+    assert lecturas == [{"stop_before_pixels": True}, {}]
+    np.testing.assert_array_equal(primera, dcmread(get_testdata_file("CT_small.dcm")).pixel_array)
+
+
+def test_ventana_hu_solo_en_ct_y_mín_máx_en_ultrasonido():
+    crudo = np.linspace(0, 255, 16 * 16).reshape(16, 16)
+    preprocesador = Preprocesador(tamano=16, ventana="Abdomen")
+
+    ultrasonido = Dataset()
+    ultrasonido.Modality = "US"
+    salida = preprocesador.procesar(crudo, ultrasonido)[..., 0]
+    np.testing.assert_allclose(salida, crudo / 127.5 - 1, atol=1e-5)
+
+    tomografia = Dataset()
+    tomografia.Modality = "CT"
+    salida = preprocesador.procesar(crudo, tomografia)[..., 0]
+    # Abdomen: [-160, 240] HU
+    np.testing.assert_allclose(salida, (np.minimum(crudo, 240) + 160) / 200 - 1, atol=1e-5)
+
+
+# --- Preprocesamiento (user-015) ---
+
+def bilineal_referencia(imagen, tamano):
+    alto, ancho = imagen.shape
+    salida = np.zeros((tamano, tamano))
+    for fila in range(tamano):
+        for columna in range(tamano):
+            y = min(max((fila + 0.5) * alto / tamano - 0.5, 0), alto - 1)
+            x = min(max((columna + 0.5) * ancho / tamano - 0.5, 0), ancho - 1)
+            y0, x0 = int(y), int(x)
+            y1, x1 = min(y0 + 1, alto - 1), min(x0 + 1, ancho - 1)
+            wy, wx = y - y0, x - x0
+            salida[fila, columna] = ((1 - wy) * ((1 - wx) * imagen[y0, x0] + wx * imagen[y0, x1])
+                                     + wy * ((1 - wx) * imagen[y1, x0] + wx * imagen[y1, x1]))
+    return salida
+
+
+def test_preprocesar_jpg_rgb_a_un_canal():
+    imagen = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    salida = Preprocesador(tamano=64, canales=1).procesar(imagen)
+    luma = imagen.astype(np.float64) @ [0.299, 0.587, 0.114]
+    assert salida.shape == (64, 64, 1) and salida.dtype == np.float32
+    np.testing.assert_allclose(salida[..., 0], luma * 2 / 255 - 1, atol=1e-5)
+
+
+def test_preprocesar_dicom_aplica_rescale_y_ventana():
+    crudo = np.random.default_rng(1).integers(0, 2000, (2, 32, 32)).astype(np.int16)
+    encabezado = Dataset()
+    encabezado.Modality = "CT"
+    encabezado.RescaleSlope = 1
+    encabezado.RescaleIntercept = -1024
+    salida = Preprocesador(tamano=32, ventana="Abdomen").procesar_lote(crudo, encabezado)
+    # Abdomen: centro 40, ancho 400 -> [-160, 240] HU
+    esperado = (np.clip(crudo - 1024.0, -160, 240) + 160) * 2 / 400 - 1
+    np.testing.assert_allclose(salida[..., 0], esperado, atol=1e-5)
+
+
+def test_preprocesar_ventana_del_archivo():
+    crudo = np.linspace(-500, 500, 16 * 16).reshape(16, 16)
+    encabezado = Dataset()
+    encabezado.WindowCenter = 0
+    encabezado.WindowWidth = 200
+    salida = Preprocesador(tamano=16, ventana="Del archivo").procesar(crudo, encabezado)
+    np.testing.assert_allclose(salida[..., 0], np.clip(crudo, -100, 100) / 100, atol=1e-5)
+
+
+def test_redimensionar_por_bloques_y_bilineal():
+    imagen = np.random.default_rng(2).uniform(0, 255, (128, 128)).astype(np.float32)
+    por_bloques = Preprocesador(tamano=64).redimensionar(imagen[np.newaxis, ..., np.newaxis])
+    np.testing.assert_allclose(por_bloques[0, ..., 0], imagen.reshape(64, 2, 64, 2).mean(axis=(1, 3)), rtol=1e-5)
+
+    imagen = imagen[:50, :70]
+    bilineal = Preprocesador(tamano=32).redimensionar(imagen[np.newaxis, ..., np.newaxis])
+    np.testing.assert_allclose(bilineal[0, ..., 0], bilineal_referencia(imagen, 32), rtol=1e-4, atol=1e-3)
+
+
+def test_preprocesar_un_canal_a_tres_y_volver_a_imagen():
+    preprocesador = Preprocesador(tamano=8, canales=3)
+    salida = preprocesador.procesar(np.full((8, 8), 255, dtype=np.uint8))
+    assert salida.shape == (8, 8, 3)
+    np.testing.assert_allclose(salida, 1.0)
+    np.testing.assert_array_equal(preprocesador.a_imagen(np.array([[-2.0, -1.0, 0.0, 1.0]])), [[0, 0, 127, 255]])
+
+
+def test_multiframe_rgb_usa_el_frame_seleccionado():
+    ruta = get_testdata_file("SC_rgb_rle_2frame.dcm")
+    frames = pydicom.dcmread(ruta).pixel_array
+    procesador = DicomProcessor()
+    procesador.cargar_archivo(ArchivoSubido(open(ruta, "rb").read(), "rgb.dcm"))
+    preprocesador = Preprocesador(tamano=100, ventana="Mín-máx")
+    assert procesador.es_multiframe()
+    for indice in range(2):
+        procesador.frame_actual = indice
+        tensor = procesador.obtener_tensor(preprocesador)
+        assert tensor.shape == (100, 100, 1)
+        np.testing.assert_allclose(tensor, preprocesador.procesar(frames[indice], procesador.dicom_data))
+
+    # Un solo frame RGB (alto, ancho, 3) no es multiframe aunque tenga tres dimensiones
+    procesador.dicom_data.NumberOfFrames = 1
+    procesador.pixeles = frames[1]
+    assert not procesador.es_multiframe()
+    np.testing.assert_allclose(procesador.obtener_tensor(preprocesador),
+                               preprocesador.procesar(frames[1], procesador.dicom_data))
+
+
+# --- Series DICOM (user-014) ---
+
+def zip_serie(posiciones, extras=(), interceptos=None):
+    base = pydicom.dcmread(get_testdata_file("CT_small.dcm"))
+    archivo = io.BytesIO()
+    with zipfile.ZipFile(archivo, "w") as salida:
+        for numero, posicion in enumerate(posiciones):
+            base.ImagePositionPatient = [0.0, 0.0, posicion]
+            base.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+            base.InstanceNumber = numero
+            if interceptos is not None:
+                base.RescaleIntercept = interceptos[numero]
+            corte = io.BytesIO()
+            base.save_as(corte)
+            salida.writestr(f"corte_{numero}.dcm", corte.getvalue())
+        for nombre, contenido in extras:
+            salida.writestr(nombre, contenido)
+    archivo.seek(0)
+    return archivo
+
+
+def test_serie_ordena_por_posicion_y_omite_archivos_que_no_son_dicom():
+    serie = SerieDicom(zip_serie([30.0, 10.0, 20.0], extras=[("leeme.txt", b"hola")]))
+    try:
+        assert len(serie) == 3 and serie.forma == (3, 128, 128)
+        assert serie.fuentes == ["corte_1.dcm", "corte_2.dcm", "corte_0.dcm"]
+        assert [encabezado.InstanceNumber for encabezado in serie.encabezados] == [1, 2, 0]
+        assert [lote.shape for lote in serie.lotes(tam_lote=2)] == [(2, 128, 128), (1, 128, 128)]
+    finally:
+        serie.cerrar()
+
+
+def test_serie_sin_cortes_es_un_error():
+    with pytest.raises(ValueError):
+        SerieDicom(zip_serie([], extras=[("leeme.txt", b"hola")]))
+
+
+def test_volumen_temporal_se_elimina_al_cerrar_y_al_liberar_la_serie():
+    serie = SerieDicom(zip_serie([0.0, 1.0]))
+    volumen = serie.volumen()
+    assert volumen.shape == (2, 128, 128)
+    np.testing.assert_array_equal(volumen[1], serie.corte(1))
+    ruta = serie.ruta_volumen
+    del volumen
+    serie.cerrar()
+    assert not os.path.exists(ruta)
+
+    serie = SerieDicom(zip_serie([0.0, 1.0]))
+    serie.volumen()
+    ruta = serie.ruta_volumen
+    del serie
+    gc.collect()
+    assert not os.path.exists(ruta)
+
+
+def test_serie_preprocesa_cada_corte_con_su_encabezado():
+    serie = SerieDicom(zip_serie([0.0, 1.0, 2.0], interceptos=[-1024, 0, 200]))
+    preprocesador = Preprocesador(tamano=128, ventana="Abdomen")
+    try:
+        traducidos = list(modelo_de_prueba(GeneradorIdentidad()).predecir_serie(serie, tam_lote=2,
+                                                                                preprocesador=preprocesador))
+        esperados = [preprocesador.procesar(serie.corte(indice), encabezado)
+                     for indice, encabezado in enumerate(serie.encabezados)]
+    finally:
+        serie.cerrar()
+    for traducido, esperado in zip(traducidos, esperados):
+        np.testing.assert_allclose(traducido, esperado, atol=1e-5)
+    assert not np.allclose(traducidos[0], traducidos[1])
+
+
+def test_serie_mín_máx_se_calcula_sobre_toda_la_serie():
+    serie = SerieDicom(zip_serie([0.0, 1.0, 2.0], interceptos=[0, 500, 1000]))
+    preprocesador = Preprocesador(tamano=128, ventana="Mín-máx")
+    try:
+        crudos = [serie.corte(indice).astype(np.float64) + encabezado.RescaleIntercept
+                  for indice, encabezado in enumerate(serie.encabezados)]
+        # Un corte por lote: con límites por lote cada corte iría de -1 a 1
+        traducidos = list(modelo_de_prueba(GeneradorIdentidad()).predecir_serie(serie, tam_lote=1,
+                                                                                preprocesador=preprocesador))
+    finally:
+        serie.cerrar()
+    bajo, alto = min(crudo.min() for crudo in crudos), max(crudo.max() for crudo in crudos)
+    for traducido, crudo in zip(traducidos, crudos):
+        np.testing.assert_allclose(traducido[..., 0], (crudo - bajo) * 2 / (alto - bajo) - 1, atol=1e-4)
+    assert traducidos[0].min() == pytest.approx(-1) and traducidos[-1].max() == pytest.approx(1)
+    assert traducidos[0].max() < traducidos[-1].max()
+
+
+# --- Inferencia por teselas (user-016) ---
+
+@pytest.mark.parametrize("forma", [(600, 400, 1), (100, 120, 1), (256, 256, 1), (300, 520)])
+def test_teselado_reconstruye_la_imagen(forma):
+    generador = GeneradorIdentidad()
+    modelo = modelo_de_prueba(generador)
+    imagen = np.random.default_rng(3).uniform(-1, 1, forma).astype(np.float32)
+    salida = modelo.predecir(imagen, teselado=True)
+    assert salida.shape == imagen.shape
+    np.testing.assert_allclose(salida, imagen, atol=1e-5)
+    # Las teselas se envían juntas y el servidor las agrupa en lotes
+    teselas = len(modelo._inicios_teselas(max(forma[0], 256), 256, 32)) * len(
+        modelo._inicios_teselas(max(forma[1], 256), 256, 32))
+    assert sum(generador.lotes) == teselas
+
+
+def test_inicios_de_teselas_cubren_la_imagen():
+    modelo = IA_Modelo.__new__(IA_Modelo)
+    assert modelo._inicios_teselas(256, 256, 32) == [0]
+    inicios = modelo._inicios_teselas(600, 256, 32)
+    assert inicios[0] == 0 and inicios[-1] == 600 - 256
+    assert all(0 < siguiente - actual <= 256 - 32 for actual, siguiente in zip(inicios, inicios[1:]))
+
+
+# --- Pesos en safetensors (user-017) ---
+
+def test_safetensors_ida_y_vuelta(tmp_path):
+    torch = pytest.importorskip("torch")
+    torch.manual_seed(0)
+    redes = {direccion: construir_generador_resnet(canales=1, filtros=4, bloques=1).eval()
+             for direccion in ("ct2us", "us2ct")}
+    ruta = str(tmp_path / "modelo.safetensors")
+    guardar_generadores_safetensors(redes, ruta, canales=1, filtros=4, bloques=1)
+
+    generadores = cargar_generadores_safetensors(ruta)
+    assert set(generadores) == {"ct2us", "us2ct"}
+    lote = np.random.default_rng(4).uniform(-1, 1, (2, 32, 32, 1)).astype(np.float32)
+    for direccion, red in redes.items():
+        with torch.inference_mode():
+            esperado = red(torch.from_numpy(lote.transpose(0, 3, 1, 2))).numpy().transpose(0, 2, 3, 1)
+        np.testing.assert_allclose(generadores[direccion].predict(lote), esperado, atol=1e-5)
+
+
+def test_safetensors_sin_generadores_y_pickle_se_rechazan(tmp_path):
+    safetensors = pytest.importorskip("safetensors.torch")
+    torch = pytest.importorskip("torch")
+    ruta = str(tmp_path / "otro.safetensors")
+    safetensors.save_file({"capa.weight": torch.zeros(2)}, ruta)
+    with pytest.raises(ValueError):
+        cargar_generadores_safetensors(ruta)
+    with pytest.raises(ValueError, match="pickle"):
+        IA_Modelo(str(tmp_path / "modelo.pth"))
+
+
+# --- Backends y compuerta de precisión (user-018) ---
+
+# Generador que suma ruido gaussiano a la entrada (un backend menos preciso que la referencia)
+class GeneradorRuidoso:
+    def __init__(self, desvio):
+        self.desvio = desvio
+
+    def predict(self, lote):
+        ruido = np.random.default_rng(5).normal(0, self.desvio, lote.shape) if self.desvio else 0
+        return np.asarray(lote, dtype=np.float32) + ruido
+
+
+def test_comparar_backends_aplica_el_umbral_y_elige_el_más_rápido():
+    imagenes = imagenes_control(2, tamano=64)
+    candidatos = {"exacto": GeneradorRuidoso(0), "casi": GeneradorRuidoso(0.01), "malo": GeneradorRuidoso(0.2)}
+    resultados = {r["backend"]: r for r in comparar_backends(GeneradorIdentidad(), candidatos, imagenes,
+                                                             psnr_min=35.0, ssim_min=0.98, repeticiones=1)}
+    # Ruido 0.01 en un rango de 2: PSNR ~46 dB; ruido 0.2: ~20 dB
+    assert resultados["exacto"]["aprobado"] and resultados["casi"]["aprobado"]
+    assert not resultados["malo"]["aprobado"] and resultados["malo"]["psnr"] < 35.0
+    assert resultados["casi"]["psnr"] > 35.0 and resultados["casi"]["ssim"] >= 0.98
+
+    latencias = {"pytorch": 10.0, "exacto": 5.0, "casi": 2.0, "malo": 1.0}
+    for nombre, resultado in resultados.items():
+        resultado["latencia_ms"] = latencias[nombre]
+    assert elegir_backend(list(resultados.values())) == "casi"
+    resultados["casi"]["aprobado"] = False
+    assert elegir_backend(list(resultados.values())) == "exacto"
+
+
+@pytest.mark.parametrize("desvios, esperado", [
+    ({"onnx-int8": 0.01, "onnx": 0}, "onnx-int8"),
+    ({"onnx-int8": 0.2, "onnx": 0}, "onnx"),
+    ({"onnx-int8": 0.2, "onnx": 0.2}, "pytorch"),
+])
+def test_int8_sin_la_precisión_mínima_vuelve_a_onnx_o_pytorch(tmp_path, monkeypatch, desvios, esperado):
+    rutas = {}
+    monkeypatch.setattr(main, "exportar_onnx", lambda generador, ruta, *_: open(ruta, "wb").close())
+    monkeypatch.setattr(main, "cuantizar_int8", lambda ruta, salida: open(salida, "wb").close())
+    monkeypatch.setattr(main, "GeneradorONNX", lambda ruta, *_: rutas.setdefault(
+        ruta, GeneradorRuidoso(desvios["onnx-int8" if ruta.endswith(".int8.onnx") else "onnx"])))
+    monkeypatch.setattr(IA_Modelo, "tamano_entrada", 32)
+    ruta_modelo = tmp_path / "modelo.safetensors"
+    ruta_modelo.touch()
+
+    modelo = IA_Modelo.__new__(IA_Modelo)
+    referencia = GeneradorIdentidad()
+    modelo.modelo = {"ct2us": referencia}
+    modelo.backend_usado = {"ct2us": "pytorch"}
+    generadores = modelo.preparar_onnx(str(ruta_modelo), "onnx-int8", 0, 1)
+    assert modelo.backend_usado == {"ct2us": esperado}
+    archivos = {"onnx-int8": "modelo.ct2us.int8.onnx", "onnx": "modelo.ct2us.onnx"}
+    if esperado == "pytorch":
+        assert generadores["ct2us"] is referencia
+    else:
+        assert generadores["ct2us"] is rutas[str(tmp_path / archivos[esperado])]
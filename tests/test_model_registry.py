@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from model_registry import ModelRegistry
+
+
+def counting_loader(loads, delay=0.0):
+    def load():
+        time.sleep(delay)
+        loads.append(object())
+        return loads[-1]
+    return load
+
+
+def test_thread_safe_model_is_loaded_once_for_all_threads():
+    registry = ModelRegistry()
+    loads = []
+    registry.register('modelo', counting_loader(loads, delay=0.05))
+    registry.register('modelo', counting_loader([]))  # un rerun no reemplaza el loader
+    instances = []
+    threads = [threading.Thread(target=lambda: instances.append(registry.get('modelo'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1 and all(instance is loads[0] for instance in instances)
+    assert set(registry.load_times) == {'modelo'}
+
+
+def test_pooled_model_is_exclusive_and_reused():
+    registry = ModelRegistry()
+    loads = []
+    registry.register('pose', counting_loader(loads), thread_safe=False)
+    with pytest.raises(ValueError):
+        registry.get('pose')
+
+    with registry.acquire('pose') as first:
+        with registry.acquire('pose') as second:
+            assert first is not second
+    with registry.acquire('pose') as again:
+        assert again in (first, second)
+    assert len(loads) == 2
+
+
+def test_warm_up_records_errors_without_retrying():
+    registry = ModelRegistry()
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise RuntimeError("pesos no encontrados")
+
+    loads = []
+    registry.register('roto', broken)
+    registry.register('pose', counting_loader(loads), thread_safe=False)
+    times = registry.warm_up()
+    registry.warm_up()
+    assert set(times) == {'pose'} and len(attempts) == 1 and len(loads) == 1
+    assert isinstance(registry.errors['roto'], RuntimeError)
+    # El modelo precargado queda en el pool
+    with registry.acquire('pose') as instance:
+        assert instance is loads[0]
@@ -0,0 +1,110 @@
+import os
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+import trabajos
+from trabajos import AlmacenTrabajos, GestorTrabajos
+
+
+# Pool de prueba, sin procesos. Un pool roto rechaza todos los envíos; con rotos > 0, los
+# próximos pools que se creen ya nacen rotos.
+class PoolDePrueba:
+    creados = []
+    rotos = 0
+
+    def __init__(self, procesos, mp_context=None):
+        self.roto = PoolDePrueba.rotos > 0
+        PoolDePrueba.rotos -= 1
+        self.enviados = []
+        self.cerrado = False
+        PoolDePrueba.creados.append(self)
+
+    def submit(self, funcion, *argumentos):
+        if self.roto:
+            raise BrokenProcessPool("un proceso terminó de forma abrupta")
+        self.enviados.append(funcion)
+        futuro = Future()
+        futuro.set_result(None)
+        return futuro
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.cerrado = True
+
+
+@pytest.fixture
+def gestor(tmp_path, monkeypatch):
+    PoolDePrueba.creados, PoolDePrueba.rotos = [], 0
+    monkeypatch.setattr(trabajos, "ProcessPoolExecutor", PoolDePrueba)
+    return GestorTrabajos(AlmacenTrabajos(str(tmp_path)), procesos=2)
+
+
+def test_almacen_guarda_estado_y_resultado(tmp_path):
+    almacen = AlmacenTrabajos(str(tmp_path))
+    id_trabajo = almacen.crear("imagen", {"direccion": "ct2us"})
+    assert almacen.estado(id_trabajo)["estado"] == "en cola"
+    assert almacen.resultado(id_trabajo) is None
+    almacen.actualizar(id_trabajo, estado="terminado", resultado="resultado.png")
+    assert almacen.resultado(id_trabajo) == os.path.join(str(tmp_path), id_trabajo, "resultado.png")
+    # Identificadores inexistentes o con rutas no se leen
+    assert almacen.estado("noexiste") is None and almacen.estado("../x") is None and almacen.estado("") is None
+
+
+def test_almacen_marca_interrumpidos_y_limpia_vencidos(tmp_path):
+    almacen = AlmacenTrabajos(str(tmp_path))
+    pendiente = almacen.crear("serie", {})
+    viejo = almacen.crear("serie", {})
+    reciente = almacen.crear("serie", {})
+    almacen.actualizar(viejo, estado="terminado", creado=time.time() - 25 * 3600)
+    almacen.actualizar(reciente, estado="terminado")
+
+    almacen.marcar_interrumpidos()
+    assert almacen.estado(pendiente)["estado"] == "error"
+    almacen.limpiar(max_horas=24)
+    assert almacen.estado(viejo) is None and not os.path.exists(almacen.ruta(viejo))
+    assert almacen.estado(reciente) is not None and almacen.estado(pendiente) is not None
+
+
+def test_gestor_precarga_el_modelo_y_limpia_cada_intervalo(gestor, monkeypatch):
+    assert PoolDePrueba.creados[0].enviados == [trabajos.precargar_modelo] * 2
+    limpiezas = []
+    monkeypatch.setattr(gestor.almacen, "limpiar", lambda: limpiezas.append(1))
+    gestor.estado("noexiste")
+    assert limpiezas == []
+    # Pasado el intervalo se limpia una vez y el reloj vuelve a empezar
+    gestor.ultima_limpieza -= gestor.intervalo_limpieza + 1
+    gestor.estado("noexiste")
+    gestor.estado("noexiste")
+    assert limpiezas == [1]
+
+
+def test_pool_roto_se_reemplaza_y_se_reintenta(gestor):
+    roto = PoolDePrueba.creados[0]
+    roto.roto = True
+    id_trabajo = gestor.enviar_imagen(np.zeros((4, 4, 1)), "ct2us", "Abdomen")
+    nuevo = PoolDePrueba.creados[-1]
+    assert roto.cerrado and gestor.pool is nuevo and len(PoolDePrueba.creados) == 2
+    assert nuevo.enviados == [trabajos.precargar_modelo] * 2 + [trabajos.ejecutar_trabajo]
+    assert gestor.estado(id_trabajo)["estado"] == "en cola"
+
+
+def test_pool_roto_dos_veces_deja_el_trabajo_en_error(gestor):
+    PoolDePrueba.creados[0].roto = True
+    PoolDePrueba.rotos = 1
+    with pytest.raises(BrokenProcessPool):
+        gestor.enviar_imagen(np.zeros((4, 4, 1)), "ct2us", "Abdomen")
+    id_trabajo = os.listdir(gestor.almacen.directorio)[0]
+    estado = gestor.estado(id_trabajo)
+    assert estado["estado"] == "error" and "abrupta" in estado["mensaje"]
+
+
+def test_tiempos_de_carga_los_informan_los_procesos(gestor):
+    precargas = [Future(), Future()]
+    gestor.precargas = precargas
+    assert gestor.tiempos_carga() == {} and gestor.precargando()
+    precargas[0].set_result({"s-cyclegan": 1.5})
+    precargas[1].set_exception(RuntimeError("sin pesos"))
+    assert gestor.tiempos_carga() == {"s-cyclegan": 1.5} and not gestor.precargando()
@@ -0,0 +1,250 @@
+# Trabajos de traducción en segundo plano.
+#
+# Una traducción larga (una serie completa, o una imagen por teselas) no se ejecuta dentro del
+# hilo de la sesión de Streamlit: se envía como trabajo a un pool de procesos locales y la
+# página solo consulta su estado. Cada trabajo tiene un identificador y una carpeta en el
+# almacén local con su entrada, su estado (JSON con el progreso) y su resultado, de modo que
+# la página puede recuperarlo aunque el navegador se reconecte o se recargue.
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PIL import Image
+
+
+# Almacén de trabajos en disco: una carpeta por trabajo
+class AlmacenTrabajos:
+    pendientes = ("en cola", "en curso")
+
+    def __init__(self, directorio=None):
+        self.directorio = (directorio or os.environ.get("SCYCLEGAN_TRABAJOS_DIR")
+                           or os.path.join(tempfile.gettempdir(), "scyclegan-trabajos"))
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def ruta(self, id_trabajo, nombre=""):
+        return os.path.join(self.directorio, id_trabajo, nombre)
+
+    # Crea el trabajo en cola y devuelve su identificador
+    def crear(self, tipo, parametros):
+        id_trabajo = uuid.uuid4().hex[:12]
+        os.makedirs(self.ruta(id_trabajo))
+        self.escribir(id_trabajo, {
+            "id": id_trabajo,
+            "tipo": tipo,
+            "parametros": parametros,
+            "estado": "en cola",
+            "progreso": 0,
+            "total": 0,
+            "mensaje": "",
+            "creado": time.time(),
+        })
+        return id_trabajo
+
+    # El estado se reemplaza de forma atómica: quien lo lee nunca ve un JSON a medio escribir
+    def escribir(self, id_trabajo, estado):
+        temporal = self.ruta(id_trabajo, "estado.json.partial")
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(estado, archivo)
+        os.replace(temporal, self.ruta(id_trabajo, "estado.json"))
+
+    # Estado del trabajo, o None si no existe (identificador inválido o ya eliminado)
+    def estado(self, id_trabajo):
+        if not id_trabajo or not id_trabajo.isalnum():
+            return None
+        try:
+            with open(self.ruta(id_trabajo, "estado.json"), encoding="utf-8") as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return None
+
+    def actualizar(self, id_trabajo, **cambios):
+        estado = self.estado(id_trabajo)
+        if estado is not None:
+            estado.update(cambios)
+            self.escribir(id_trabajo, estado)
+        return estado
+
+    # Ruta del resultado de un trabajo terminado
+    def resultado(self, id_trabajo):
+        estado = self.estado(id_trabajo)
+        if estado is None or estado["estado"] != "terminado":
+            return None
+        return self.ruta(id_trabajo, estado["resultado"])
+
+    # Trabajos que quedaron pendientes de una ejecución anterior del servidor: ningún proceso
+    # los va a terminar, así que se marcan como interrumpidos
+    def marcar_interrumpidos(self):
+        for id_trabajo in os.listdir(self.directorio):
+            estado = self.estado(id_trabajo)
+            if estado is not None and estado["estado"] in self.pendientes:
+                self.actualizar(id_trabajo, estado="error", mensaje="Trabajo interrumpido al reiniciar el servidor.")
+
+    # Elimina los trabajos con más de max_horas de antigüedad
+    def limpiar(self, max_horas=24):
+        limite = time.time() - max_horas * 3600
+        for id_trabajo in os.listdir(self.directorio):
+            estado = self.estado(id_trabajo)
+            if estado is not None and estado["estado"] not in self.pendientes and estado["creado"] < limite:
+                shutil.rmtree(self.ruta(id_trabajo), ignore_errors=True)
+
+
+# Envía trabajos al pool de procesos. Cada proceso carga el modelo una vez (a través del
+# registro) y lo reutiliza en los trabajos siguientes; las sesiones no esperan a ningún trabajo.
+# Cada proceso ejecuta un trabajo a la vez con su propia copia del modelo: el servidor de
+# micro-lotes solo agrupa los cortes o teselas de ese trabajo, no las solicitudes de distintos
+# usuarios (esas corren en paralelo, una por proceso).
+# El gestor vive mientras viva el servidor, así que los trabajos vencidos se eliminan también
+# durante el uso (a lo sumo una vez cada intervalo_limpieza segundos).
+class GestorTrabajos:
+    def __init__(self, almacen=None, procesos=1, intervalo_limpieza=600):
+        self.almacen = almacen or AlmacenTrabajos()
+        self.almacen.marcar_interrumpidos()
+        self.almacen.limpiar()
+        self.intervalo_limpieza = intervalo_limpieza
+        self.ultima_limpieza = time.monotonic()
+        self.lock_limpieza = threading.Lock()
+        self.procesos = procesos
+        self.lock_pool = threading.Lock()
+        self.pool = self._crear_pool()
+
+    def _crear_pool(self):
+        # spawn: los procesos no heredan el estado de Streamlit ni los hilos del servidor
+        pool = ProcessPoolExecutor(self.procesos, mp_context=multiprocessing.get_context("spawn"))
+        # Los procesos cargan el modelo por adelantado para que el primer trabajo no espere
+        self.precargas = [pool.submit(precargar_modelo) for _ in range(self.procesos)]
+        return pool
+
+    # Tiempo de carga de cada modelo informado por los procesos que ya lo cargaron (el mayor
+    # entre procesos); vacío mientras ninguno terminó
+    def tiempos_carga(self):
+        tiempos = {}
+        for futuro in self.precargas:
+            if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+                for nombre, segundos in futuro.result().items():
+                    tiempos[nombre] = max(segundos, tiempos.get(nombre, 0.0))
+        return tiempos
+
+    def precargando(self):
+        return any(not futuro.done() for futuro in self.precargas)
+
+    # Traducción de una imagen ya preprocesada
+    def enviar_imagen(self, imagen, direccion, ventana, teselado=False):
+        id_trabajo = self.almacen.crear("imagen", {"direccion": direccion, "ventana": ventana, "teselado": teselado})
+        np.save(self.almacen.ruta(id_trabajo, "entrada.npy"), imagen)
+        return self._enviar(id_trabajo)
+
+    # Traducción de una serie (ZIP con los cortes DICOM)
+    def enviar_serie(self, archivo_zip, direccion, ventana):
+        id_trabajo = self.almacen.crear("serie", {"direccion": direccion, "ventana": ventana})
+        with open(self.almacen.ruta(id_trabajo, "entrada.zip"), "wb") as destino:
+            archivo_zip.seek(0)
+            shutil.copyfileobj(archivo_zip, destino)
+        return self._enviar(id_trabajo)
+
+    # Si un proceso murió (falta de memoria, por ejemplo), el pool queda roto y rechaza todos los
+    # envíos: se reemplaza por uno nuevo y se reintenta una vez. Si vuelve a fallar, el trabajo
+    # queda en error (no "en cola" para siempre) y la excepción llega a la página.
+    def _enviar(self, id_trabajo):
+        self._limpiar_si_corresponde()
+        pool = self.pool
+        try:
+            futuro = pool.submit(ejecutar_trabajo, self.almacen.directorio, id_trabajo)
+        except BrokenProcessPool:
+            try:
+                futuro = self._reemplazar_pool(pool).submit(ejecutar_trabajo, self.almacen.directorio, id_trabajo)
+            except BrokenProcessPool as error:
+                self.almacen.actualizar(id_trabajo, estado="error", mensaje=str(error) or type(error).__name__)
+                raise
+        futuro.add_done_callback(lambda futuro: self._terminado(id_trabajo, futuro))
+        return id_trabajo
+
+    # Varias sesiones pueden encontrar el mismo pool roto: solo la primera lo reemplaza
+    def _reemplazar_pool(self, roto):
+        with self.lock_pool:
+            if self.pool is roto:
+                roto.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._crear_pool()
+            return self.pool
+
+    # Si el proceso muere (falta de memoria, pool roto) el trabajo no llega a registrar el error
+    def _terminado(self, id_trabajo, futuro):
+        error = futuro.exception()
+        if error is not None:
+            self.almacen.actualizar(id_trabajo, estado="error", mensaje=str(error) or type(error).__name__)
+
+    def estado(self, id_trabajo):
+        self._limpiar_si_corresponde()
+        return self.almacen.estado(id_trabajo)
+
+    # Las sesiones consultan el estado a cada segundo: solo una de ellas limpia, y solo si pasó
+    # el intervalo desde la última limpieza
+    def _limpiar_si_corresponde(self):
+        if time.monotonic() - self.ultima_limpieza < self.intervalo_limpieza:
+            return
+        if not self.lock_limpieza.acquire(blocking=False):
+            return
+        try:
+            self.ultima_limpieza = time.monotonic()
+            self.almacen.limpiar()
+        finally:
+            self.lock_limpieza.release()
+
+    def resultado(self, id_trabajo):
+        return self.almacen.resultado(id_trabajo)
+
+
+# Se ejecuta en cada proceso del pool al iniciarlo; devuelve el tiempo de carga en ese proceso
+def precargar_modelo():
+    import main  # registra el modelo
+    from model_registry import registry
+    return registry.warm_up(["s-cyclegan"])
+
+
+# Se ejecuta en un proceso del pool. El progreso se guarda en el almacén a medida que avanza.
+def ejecutar_trabajo(directorio, id_trabajo):
+    # Importación diferida: el módulo de la aplicación registra el modelo en el registro del proceso
+    from main import Preprocesador, SerieDicom, IA_Modelo
+    from model_registry import registry
+
+    almacen = AlmacenTrabajos(directorio)
+    estado = almacen.actualizar(id_trabajo, estado="en curso", iniciado=time.time())
+    parametros = estado["parametros"]
+    try:
+        modelo = registry.get("s-cyclegan")
+        preprocesador = Preprocesador(IA_Modelo.tamano_entrada, IA_Modelo.canales_entrada, parametros["ventana"])
+
+        if estado["tipo"] == "imagen":
+            almacen.actualizar(id_trabajo, total=1)
+            imagen = np.load(almacen.ruta(id_trabajo, "entrada.npy"))
+            prediccion = modelo.predecir(imagen, parametros["direccion"], parametros["teselado"])
+            Image.fromarray(preprocesador.a_imagen(prediccion)).save(almacen.ruta(id_trabajo, "resultado.png"))
+            almacen.actualizar(id_trabajo, estado="terminado", progreso=1, resultado="resultado.png", terminado=time.time())
+            return
+
+        serie = SerieDicom(almacen.ruta(id_trabajo, "entrada.zip"))
+        almacen.actualizar(id_trabajo, total=len(serie))
+        temporal = almacen.ruta(id_trabajo, "resultado.zip.partial")
+        try:
+            with zipfile.ZipFile(temporal, "w") as salida:
+                traducciones = modelo.predecir_serie(serie, parametros["direccion"], preprocesador=preprocesador)
+                for numero, traducido in enumerate(traducciones):
+                    imagen_png = io.BytesIO()
+                    Image.fromarray(preprocesador.a_imagen(traducido)).save(imagen_png, format="PNG")
+                    salida.writestr(f"corte_{numero:04d}.png", imagen_png.getvalue())
+                    almacen.actualizar(id_trabajo, progreso=numero + 1)
+        finally:
+            serie.cerrar()
+        os.replace(temporal, almacen.ruta(id_trabajo, "resultado.zip"))
+        almacen.actualizar(id_trabajo, estado="terminado", resultado="resultado.zip", terminado=time.time())
+    except Exception as error:
+        almacen.actualizar(id_trabajo, estado="error", mensaje=str(error) or type(error).__name__)